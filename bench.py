@@ -0,0 +1,330 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Benchmark suite for the grid update, rendering and input paths,
+# run without a window. For example:
+#
+#     python -m bench --output bench.json
+#     python -m bench --output new.json --compare bench.json
+
+# Import modules
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+# Render offscreen, without opening a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+
+# Import scripts
+from grid import Grid, GridAsset
+from camera import Camera
+from patterns import BUILTIN_PATTERNS
+from headless import ENGINES
+from engine import random_soup
+
+
+SIZES = [100, 500, 1000]
+DENSITIES = [0.1, 0.5]
+PATTERNS = ['Gosper gun', 'Snark']
+# Cases whose time grows by more than this factor are reported
+# as regressions by compare
+TOLERANCE = 1.25
+# Runs per sample of the benchmarks that change the grid, which
+# all start from the same state whatever the machine
+RUNS = {'update': 16, 'toggle_cell': 1024, 'print_to_grid': 1024}
+
+
+# Define benchmark simulation class
+class BenchSimulation():
+    def __init__(self, grid_size, width=640, height=640):
+        '''
+        Params:
+            grid_size : int
+                Number of cells along each dimension of the grid.
+            width, height : int (optional)
+                Size of the offscreen surface, as in Simulation.
+        Output:
+            Initializes the attributes of the Simulation class
+            that grids, patterns and the camera read, with an
+            offscreen surface instead of a window.
+        '''
+        self.width, self.height = width, height
+        self.grid_size = grid_size
+        self.screen = pygame.Surface((width, height))
+        self.display_size = [width, height]
+        self.display_offset = [0, 0]
+        self.camera = Camera(self)
+
+
+def make_grid(sim, size, engine='numpy', pbc=False, density=None, pattern=None, seed=0):
+    '''
+    Params:
+        sim : BenchSimulation
+            Simulation the grid renders to.
+        size : int
+            Number of cells along each dimension of the grid.
+        engine : str (optional)
+            Name of the engine backend, one of headless.ENGINES.
+        pbc : bool (optional)
+            Whether to use periodic boundary conditions.
+        density : float (optional)
+            Fraction of alive cells of a random soup.
+        pattern : str (optional)
+            Name of a pattern of BUILTIN_PATTERNS, placed at the
+            center of an empty grid instead of a soup.
+        seed : int (optional)
+            Seed of the random soup.
+    Output:
+        Returns the Grid, always with the same initial state for
+        the same arguments.
+    '''
+    grid = Grid(sim, size, engine=ENGINES[engine]())
+    grid.pbc = pbc
+    if pattern is not None:
+        grid.clear()
+        grid.stamp(np.array(BUILTIN_PATTERNS[pattern]), (size // 2, size // 2))
+    else:
+        grid.set_cells(random_soup(size, seed, density))
+    return grid
+
+
+def measure(operation, repeat=5, min_time=0.05, setup=None, number=None):
+    '''
+    Params:
+        operation : callable
+            Operation to time, called without arguments.
+        repeat : int (optional)
+            Number of timed samples.
+        min_time : float (optional)
+            The operation is run as many times per sample as
+            needed to take at least this many seconds, found
+            before timing.
+        setup : callable (optional)
+            Called before each sample, without timing it, to
+            bring back the state the operation changes.
+        number : int (optional)
+            Fixed number of runs per sample, instead of the one
+            found from min_time. Operations that change what the
+            next run does, such as stepping the grid, need it so
+            that every machine times the same runs.
+    Output:
+        Returns a dict with the number of runs per sample and the
+        seconds per run of each sample, and of the best and median
+        sample.
+    '''
+    if number is None:
+        # Calibrate the runs per sample, which also warms up caches
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                operation()
+            if time.perf_counter() - start >= min_time or number >= 1 << 20:
+                break
+            number *= 2
+    else:
+        # Warm up with one untimed sample
+        if setup is not None:
+            setup()
+        for _ in range(number):
+            operation()
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        samples.append((time.perf_counter() - start) / number)
+    return {'number': number, 'samples': samples,
+            'best': min(samples), 'median': float(np.median(samples))}
+
+
+def cases(sizes, engines, densities, patterns):
+    # Parameters of every benchmark, one dict per case
+    for size in sizes:
+        for pbc in (False, True):
+            boards = [{'density': density} for density in densities]
+            boards += [{'pattern': pattern} for pattern in patterns]
+            for board in boards:
+                for engine in engines:
+                    # HashLife only runs without PBC
+                    if pbc and engine == 'hashlife':
+                        continue
+                    yield dict(benchmark='update', size=size, pbc=pbc, engine=engine, **board)
+                yield dict(benchmark='render', size=size, pbc=pbc, **board)
+            yield dict(benchmark='get_cells', size=size, pbc=pbc, density=0.5)
+            yield dict(benchmark='toggle_cell', size=size, pbc=pbc, density=0.5)
+            for pattern in patterns:
+                for mode in GridAsset.modes:
+                    yield dict(benchmark='print_to_grid', size=size, pbc=pbc,
+                               pattern=pattern, mode=mode, density=0.5)
+
+
+def run_case(case, repeat=5, min_time=0.05):
+    '''
+    Params:
+        case : dict
+            Parameters of the case, as yielded by cases.
+        repeat, min_time : (optional)
+            As in measure.
+    Output:
+        Returns the case with the timings of measure added.
+    '''
+    size = case['size']
+    sim = BenchSimulation(size)
+    benchmark = case['benchmark']
+    board = {'density': case.get('density'),
+             'pattern': case.get('pattern') if benchmark != 'print_to_grid' else None}
+    grids = [make_grid(sim, size, case.get('engine', 'numpy'), case['pbc'], **board)]
+    grid = grids[0]
+    rng = np.random.default_rng(1)
+    index = [0]
+
+    def setup():
+        # Start every sample from the initial grid and the first
+        # cell or pattern position
+        grids[0] = make_grid(sim, size, case.get('engine', 'numpy'), case['pbc'], **board)
+        index[0] = 0
+
+    if benchmark == 'update':
+        operation = lambda: grids[0].update()
+    elif benchmark == 'render':
+        operation = lambda: grid.render(sim.screen)
+    elif benchmark == 'get_cells':
+        out = grid.get_cells()
+        operation = lambda: grid.get_cells(out)
+    elif benchmark == 'toggle_cell':
+        positions = rng.integers(0, size, (RUNS[benchmark], 2)).tolist()
+
+        def operation():
+            grids[0].toggle_cell(*positions[index[0]])
+            index[0] += 1
+    elif benchmark == 'print_to_grid':
+        asset = GridAsset(sim)
+        asset.set_alive_cells(BUILTIN_PATTERNS[case['pattern']])
+        asset.mode = case['mode']
+        refs = [tuple(ref) for ref in rng.integers(0, size, (RUNS[benchmark], 2)).tolist()]
+
+        def operation():
+            asset.print_to_grid(refs[index[0]], grids[0])
+            index[0] += 1
+    else:
+        raise ValueError('Unknown benchmark: {}'.format(benchmark))
+    result = dict(case)
+    if benchmark in RUNS:
+        result.update(measure(operation, repeat, min_time, setup, RUNS[benchmark]))
+    else:
+        result.update(measure(operation, repeat, min_time))
+    return result
+
+
+def case_key(result):
+    # Parameters that identify a case between runs
+    return tuple(sorted((key, value) for key, value in result.items()
+                        if key not in ('number', 'samples', 'best', 'median')))
+
+
+def compare(results, baseline):
+    '''
+    Params:
+        results, baseline : list
+            Results of two runs, as saved by main.
+    Output:
+        Returns a list of (case, ratio) tuples, with the ratio
+        of the new to the old best time of the cases in both
+        runs, sorted from the largest ratio. The best sample is
+        the least affected by other load on the machine.
+    '''
+    old = {case_key(result): result for result in baseline}
+    ratios = []
+    for result in results:
+        key = case_key(result)
+        if key in old:
+            ratios.append((dict(key), result['best'] / old[key]['best']))
+    return sorted(ratios, key=lambda item: -item[1])
+
+
+def describe(case):
+    return ' '.join('{}={}'.format(key, value) for key, value in case.items()
+                    if key not in ('number', 'samples', 'best', 'median') and value is not None)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the grid update, rendering and input paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='board sizes to benchmark')
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument('--densities', type=float, nargs='+', default=DENSITIES,
+                        help='densities of the random soups')
+    parser.add_argument('--patterns', nargs='+', choices=sorted(BUILTIN_PATTERNS),
+                        default=PATTERNS)
+    parser.add_argument('--benchmarks', nargs='+', default=None,
+                        choices=['update', 'render', 'get_cells', 'toggle_cell', 'print_to_grid'])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed samples per case')
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='minimum seconds per sample of the benchmarks that do not change the grid')
+    parser.add_argument('--output', default=None,
+                        help='JSON file for the results')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='slowdown ratio reported as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pygame.init()
+    results = []
+    for case in cases(args.sizes, args.engines, args.densities, args.patterns):
+        if args.benchmarks is not None and case['benchmark'] not in args.benchmarks:
+            continue
+        result = run_case(case, args.repeat, args.min_time)
+        results.append(result)
+        print('{:>12.1f} us  {}'.format(result['median'] * 1e6, describe(case)))
+
+    if args.output is not None:
+        report = {'python': platform.python_version(),
+                  'numpy': np.__version__,
+                  'pygame': pygame.version.ver,
+                  'platform': platform.platform(),
+                  'cpus': os.cpu_count(),
+                  'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        ratios = compare(results, baseline)
+        regressions = [(case, ratio) for case, ratio in ratios if ratio > args.tolerance]
+        for case, ratio in regressions:
+            print('regression {:.2f}x  {}'.format(ratio, describe(case)))
+        print('{} cases compared, {} regressions'.format(len(ratios), len(regressions)))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
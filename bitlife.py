@@ -0,0 +1,301 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import numpy as np
+
+# Import scripts
+from rules import LIFE
+from boardfile import BoardWriter
+
+
+WORD_BITS = 64
+ONE = np.uint64(1)
+HIGH_SHIFT = np.uint64(WORD_BITS - 1)
+
+
+def pack(state):
+    '''
+    Params:
+        state : np.ndarray
+            2-D uint8 array with the grid state.
+    Output:
+        Returns a 2-D uint64 array where row i holds the cells
+        (i, j) of the grid, with cell j stored in bit j % 64 of
+        word j // 64. Unused bits of the last word are zero.
+    '''
+    n_i, n_j = state.shape
+    n_words = -(-n_j // WORD_BITS)
+    cells = np.zeros((n_i, n_words * WORD_BITS), dtype=np.uint8)
+    cells[:, :n_j] = state
+    packed = np.packbits(cells, axis=1, bitorder='little')
+    return packed.view('<u8').astype(np.uint64)
+
+
+def unpack(packed, n_j):
+    # Inverse of pack, for a grid with n_j columns
+    as_bytes = packed.astype('<u8').view(np.uint8)
+    return np.unpackbits(as_bytes, axis=1, bitorder='little')[:, :n_j].copy()
+
+
+def changed_cells(old, new, n_j):
+    '''
+    Params:
+        old, new : np.ndarray
+            Packed rows of two states of the same board.
+        n_j : int
+            Number of columns of the board.
+    Output:
+        Returns the sorted flat indexes i * n_j + j of the cells
+        that differ. While few words differ only those are 
+        unpacked.
+    '''
+    diff = old ^ new
+    rows, words = np.nonzero(diff)
+    if len(rows) > diff.size // 16:
+        return np.flatnonzero(unpack(diff, n_j))
+    bits = np.unpackbits(diff[rows, words].astype('<u8').view(np.uint8).reshape(-1, 8), 
+                         axis=1, bitorder='little')
+    k, bit = np.nonzero(bits)
+    return rows[k] * n_j + words[k] * WORD_BITS + bit
+
+
+def flip_cells(words, indexes, n_j):
+    # Flip the cells with the given flat indexes, in place
+    i, j = np.divmod(np.asarray(indexes, dtype=np.intp), n_j)
+    np.bitwise_xor.at(words, (i, j // WORD_BITS),
+                      np.left_shift(ONE, (j % WORD_BITS).astype(np.uint64)))
+
+
+def save_packed(path, board, generation=0, rows_per_block=1024):
+    # Save a PackedBoard as a board file, unpacking a block of
+    # rows at a time
+    with BoardWriter(path, board.shape, generation, board.pbc, str(board.rule)) as writer:
+        for i in range(0, board.shape[0], rows_per_block):
+            writer.write_rows(board.rows(i, i + rows_per_block))
+
+
+# Define bit-packed board class
+class PackedBoard():
+    def __init__(self, words, n_j, pbc=False, rule=LIFE):
+        '''
+        Params:
+            words : np.ndarray
+                2-D uint64 array with the packed rows, as
+                returned by pack.
+            n_j : int
+                Number of columns of the grid.
+            pbc : bool (optional)
+                Whether to use periodic boundary conditions.
+            rule : Rule (optional)
+                Rule used to step the cells.
+        Output:
+            Initializes a board that keeps 64 cells per word
+            between generations, which uses an eighth of the
+            memory of a byte per cell array.
+        '''
+        self.words = words
+        self.n_j = n_j
+        self.pbc = pbc
+        self.rule = rule
+        # Mask for the used bits of the last word of each row
+        tail = n_j - (words.shape[1] - 1) * WORD_BITS
+        self.tail_mask = np.uint64((1 << tail) - 1) if tail < WORD_BITS else ~np.uint64(0)
+        self.row_mask = np.full(words.shape[1], ~np.uint64(0), dtype=np.uint64)
+        self.row_mask[-1] = self.tail_mask
+
+    @classmethod
+    def from_array(cls, state, pbc=False, rule=LIFE):
+        return cls(pack(state), state.shape[1], pbc, rule)
+
+    @classmethod
+    def random(cls, shape, seed=None, pbc=False, rule=LIFE):
+        # Random board with half of the cells alive, built
+        # directly in packed form
+        rng = np.random.default_rng(seed)
+        n_words = -(-shape[1] // WORD_BITS)
+        words = rng.integers(0, 1 << 64, (shape[0], n_words), dtype=np.uint64)
+        board = cls(words, shape[1], pbc, rule)
+        board.words &= board.row_mask
+        return board
+
+    @classmethod
+    def soup(cls, size, seed=None, density=0.5, pbc=False, rule=LIFE, rows_per_block=1024):
+        # Same random state as engine.random_soup, drawn and
+        # packed a block of rows at a time
+        rng = np.random.default_rng(seed)
+        words = np.zeros((size, -(-size // WORD_BITS)), dtype=np.uint64)
+        for i in range(0, size, rows_per_block):
+            block = rng.random((min(rows_per_block, size - i), size)) < density
+            words[i:i + len(block)] = pack(block.astype(np.uint8))
+        return cls(words, size, pbc, rule)
+
+    @classmethod
+    def from_board(cls, board, rule=LIFE, rows_per_block=1024):
+        # Board with the cells of a BoardFile, read and packed a
+        # block of rows at a time
+        n_i, n_j = board.shape
+        words = np.zeros((n_i, max(-(-n_j // WORD_BITS), 1)), dtype=np.uint64)
+        for i in range(0, n_i, rows_per_block):
+            block = board.read((i, 0), (i + rows_per_block, n_j))
+            words[i:i + len(block)] = pack(block)
+        return cls(words, n_j, board.pbc, rule)
+
+    def to_array(self):
+        return unpack(self.words, self.n_j)
+
+    def rows(self, low, high):
+        # Unpacked block of rows low <= i < high
+        return unpack(self.words[low:high], self.n_j)
+
+    @property
+    def shape(self):
+        return (self.words.shape[0], self.n_j)
+
+    @property
+    def population(self):
+        if hasattr(np, 'bitwise_count'):
+            return int(np.bitwise_count(self.words).sum())
+        return int(sum(np.unpackbits(row.view(np.uint8)).sum() for row in self.words))
+
+    def _west(self, x):
+        # Value of the cell at j - 1, for every cell
+        out = x << ONE
+        out[:, 1:] |= x[:, :-1] >> HIGH_SHIFT
+        if self.pbc:
+            last_bit = np.uint64((self.n_j - 1) % WORD_BITS)
+            out[:, 0] |= (x[:, -1] >> last_bit) & ONE
+        return out
+
+    def _east(self, x):
+        # Value of the cell at j + 1, for every cell
+        out = x >> ONE
+        out[:, :-1] |= x[:, 1:] << HIGH_SHIFT
+        if self.pbc:
+            last_bit = np.uint64((self.n_j - 1) % WORD_BITS)
+            out[:, -1] |= (x[:, 0] & ONE) << last_bit
+        return out
+
+    def _shift_rows(self, x, di):
+        # Row i of the output holds row i + di of x
+        if self.pbc:
+            return np.roll(x, -di, axis=0)
+        out = np.zeros_like(x)
+        if di > 0:
+            out[:-di] = x[di:]
+        else:
+            out[-di:] = x[:di]
+        return out
+
+    def neighbor_planes(self):
+        '''
+        Output:
+            Returns the 4 bit planes (b0, b1, b2, b3) of the
+            alive neighbor count of every cell, computed with
+            bitwise adders over whole words.
+        '''
+        x = self.words
+        west, east = self._west(x), self._east(x)
+        # Horizontal sums: west + east (0-2) and west + x + east (0-3)
+        pair_0, pair_1 = west ^ east, west & east
+        trio_0, trio_1 = pair_0 ^ x, pair_1 | (pair_0 & x)
+        # Rows above and below contribute all 3 cells, the own
+        # row only contributes west and east
+        up_0, up_1 = self._shift_rows(trio_0, -1), self._shift_rows(trio_1, -1)
+        down_0, down_1 = self._shift_rows(trio_0, 1), self._shift_rows(trio_1, 1)
+        # Add up the units
+        b0 = up_0 ^ down_0 ^ pair_0
+        carry = (up_0 & down_0) | (pair_0 & (up_0 ^ down_0))
+        # Add up the twos, plus the carry
+        twos_0 = up_1 ^ down_1 ^ pair_1
+        twos_1 = (up_1 & down_1) | (pair_1 & (up_1 ^ down_1))
+        b1 = twos_0 ^ carry
+        fours = twos_0 & carry
+        b2 = twos_1 ^ fours
+        b3 = twos_1 & fours
+        return b0, b1, b2, b3
+
+    def step(self):
+        b0, b1, b2, b3 = self.neighbor_planes()
+        # The unused bits of the last word are cleared
+        self.words = self.rule.apply_planes(b0, b1, b2, b3, self.words) & self.row_mask
+
+    def advance(self, generations):
+        for _ in range(generations):
+            self.step()
+
+
+# Define bit-packed engine class
+class SwarEngine():
+    '''
+    Grid engine that steps 64 cells per word with bitwise logic.
+    Grids keep their cells in a PackedBoard between generations
+    while this engine is used, see Grid.update. The step and 
+    advance methods pack the given state for each call instead.
+    '''
+    # Grids keep the cells packed with this engine
+    packed = True
+
+    def __init__(self, rule=LIFE):
+        self.rule = rule
+
+    def step(self, state, pbc):
+        return self.advance(state, pbc, 1)
+
+    def advance(self, state, pbc, generations):
+        board = PackedBoard.from_array(state, pbc, self.rule)
+        board.advance(generations)
+        return board.to_array()
+
+
+# Define packed grid class
+class PackedGrid():
+    '''
+    Stands in for Grid in headless runs, keeping the cells in a
+    PackedBoard between generations instead of a byte per cell.
+    The cells are only unpacked for snapshots, a block of rows at
+    a time when saved as board files.
+    '''
+    def __init__(self, board):
+        self.board = board
+
+    @property
+    def pbc(self):
+        return self.board.pbc
+
+    @property
+    def rule(self):
+        return self.board.rule
+
+    @property
+    def state(self):
+        return self.board.to_array()
+
+    @property
+    def population(self):
+        return self.board.population
+
+    def get_cells(self):
+        return self.board.to_array()
+
+    def update(self):
+        self.board.step()
+
+    def advance(self, generations):
+        self.board.advance(generations)
+
+    def save(self, path, generation=0):
+        save_packed(path, self.board, generation)
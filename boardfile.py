@@ -0,0 +1,254 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Board files hold a header followed by the cells, one bit per cell.
+# Row i of the board takes (n_j + 7) // 8 bytes, with cell (i, j) in
+# bit j % 8 of byte j // 8, so any block of rows can be read without
+# reading the rest of the file.
+
+# Import modules
+import os
+import struct
+import numpy as np
+
+
+MAGIC = b'CABF'
+VERSION = 2
+# Magic, version, flags, n_i, n_j, origin_i, origin_j, generation
+# and rule, for each version. Version 2 has room for Larger than
+# Life rules
+RULE_BYTES = 64
+HEADERS = {1: struct.Struct('<4sHHQQqqQ24s'),
+           2: struct.Struct('<4sHHQQqqQ{}s'.format(RULE_BYTES))}
+HEADER = HEADERS[VERSION]
+PREFIX = struct.Struct('<4sH')
+FLAG_PBC = 1
+DEFAULT_RULE = 'B3/S23'
+
+
+def row_bytes(n_j):
+    return (n_j + 7) // 8
+
+
+# Define board writer class
+class BoardWriter():
+    def __init__(self, path, shape, generation=0, pbc=False, rule=DEFAULT_RULE,
+                 origin=(0, 0)):
+        '''
+        Params:
+            path : str
+                Path of the board file.
+            shape : tuple
+                Shape (n_i, n_j) of the board.
+            generation : int (optional)
+                Generation of the board state.
+            pbc : bool (optional)
+                Whether the board uses periodic boundaries.
+            rule : str (optional)
+                Rule of the board, in B/S notation.
+            origin : tuple (optional)
+                Position of cell (0, 0) of the board, for boards
+                cut from an unbounded grid.
+        Output:
+            Opens a writer that takes the board a block of rows
+            at a time, through write_rows, so the whole board is
+            never held in memory. The file is written under a
+            temporary name and only takes its place on close.
+        '''
+        self.path = path
+        self.shape = tuple(shape)
+        self.rows_written = 0
+        rule = rule.encode('ascii')
+        if len(rule) > RULE_BYTES:
+            raise ValueError('rule {} is too long for a board file'.format(rule.decode()))
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, FLAG_PBC if pbc else 0,
+                                    self.shape[0], self.shape[1], origin[0], origin[1],
+                                    generation, rule))
+
+    def write_rows(self, rows):
+        # Append the next rows, a 2-D array of 0 and 1
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.shape[1] != self.shape[1] or self.rows_written + len(rows) > self.shape[0]:
+            raise ValueError('rows do not fit in a board of shape {}'.format(self.shape))
+        self.file.write(np.packbits(rows, axis=1, bitorder='little').tobytes())
+        self.rows_written += len(rows)
+
+    def close(self):
+        self.file.close()
+        if self.rows_written != self.shape[0]:
+            os.remove(self.path + '.tmp')
+            raise ValueError('{} of {} rows were written'.format(self.rows_written,
+                                                                self.shape[0]))
+        os.replace(self.path + '.tmp', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.path + '.tmp')
+
+
+def save_board(path, state, generation=0, pbc=False, rule=DEFAULT_RULE,
+               origin=(0, 0), rows_per_block=1024):
+    '''
+    Params:
+        path : str
+            Path of the board file.
+        state : np.ndarray
+            2-D uint8 array with the board state.
+        generation, pbc, rule, origin : (optional)
+            Stored in the header, as in BoardWriter.
+        rows_per_block : int (optional)
+            Rows packed at a time.
+    Output:
+        Saves the board, packing it a block of rows at a time.
+    '''
+    with BoardWriter(path, state.shape, generation, pbc, rule, origin) as writer:
+        for i in range(0, state.shape[0], rows_per_block):
+            writer.write_rows(state[i:i + rows_per_block])
+
+
+def save_cells(path, alive_cells, generation=0, rule=DEFAULT_RULE, rows_per_block=1024):
+    '''
+    Params:
+        path : str
+            Path of the board file.
+        alive_cells : np.ndarray
+            Array with shape (n, 2) with the position of the
+            alive cells of an unbounded grid.
+        generation, rule : (optional)
+            Stored in the header, as in BoardWriter.
+        rows_per_block : int (optional)
+            Rows built and packed at a time.
+    Output:
+        Saves the bounding box of the alive cells, with its
+        corner as the origin of the board.
+    '''
+    alive_cells = np.asarray(alive_cells, dtype=np.int64).reshape(-1, 2)
+    if len(alive_cells) == 0:
+        save_board(path, np.zeros((0, 0), dtype=np.uint8), generation, rule=rule)
+        return
+    low = alive_cells.min(axis=0)
+    alive_cells = alive_cells[np.argsort(alive_cells[:, 0], kind='stable')] - low
+    shape = tuple(alive_cells.max(axis=0) + 1)
+    bounds = np.searchsorted(alive_cells[:, 0], np.arange(0, shape[0] + rows_per_block, 
+                                                         rows_per_block))
+    with BoardWriter(path, shape, generation, False, rule, tuple(low)) as writer:
+        for k, i in enumerate(range(0, shape[0], rows_per_block)):
+            block = np.zeros((min(rows_per_block, shape[0] - i), shape[1]), dtype=np.uint8)
+            cells = alive_cells[bounds[k]:bounds[k + 1]]
+            block[cells[:, 0] - i, cells[:, 1]] = 1
+            writer.write_rows(block)
+
+
+# Define board file class
+class BoardFile():
+    def __init__(self, path):
+        '''
+        Params:
+            path : str
+                Path of a board file.
+        Output:
+            Opens the file and reads its header. The cells are
+            memory mapped, so they are only read from disk when
+            a block of the board is accessed.
+        '''
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADERS[VERSION].size)
+        if len(header) < PREFIX.size:
+            raise ValueError('{} is not a board file'.format(path))
+        magic, version = PREFIX.unpack(header[:PREFIX.size])
+        if magic != MAGIC or version not in HEADERS or len(header) < HEADERS[version].size:
+            raise ValueError('{} is not a board file'.format(path))
+        header_size = HEADERS[version].size
+        (magic, version, flags, n_i, n_j, origin_i, origin_j,
+         self.generation, rule) = HEADERS[version].unpack(header[:header_size])
+        self.shape = (n_i, n_j)
+        self.origin = (origin_i, origin_j)
+        self.pbc = bool(flags & FLAG_PBC)
+        self.rule = rule.rstrip(b'\0').decode('ascii')
+        if n_i * n_j == 0:
+            # Empty files cannot be mapped
+            self.packed = np.zeros((n_i, row_bytes(n_j)), dtype=np.uint8)
+        else:
+            self.packed = np.memmap(path, dtype=np.uint8, mode='r', offset=header_size,
+                                    shape=(n_i, row_bytes(n_j)))
+
+    def read(self, low=(0, 0), high=None):
+        '''
+        Params:
+            low, high : tuple (optional)
+                Corners of the block of cells to read, with
+                low <= (i, j) < high. Defaults to the whole board.
+        Output:
+            Returns a 2-D uint8 array with the block. Only the
+            bytes of the block are read from the file.
+        '''
+        high = self.shape if high is None else high
+        i_0, j_0 = max(low[0], 0), max(low[1], 0)
+        i_1, j_1 = min(high[0], self.shape[0]), min(high[1], self.shape[1])
+        if i_1 <= i_0 or j_1 <= j_0:
+            return np.zeros((max(i_1 - i_0, 0), max(j_1 - j_0, 0)), dtype=np.uint8)
+        block = self.packed[i_0:i_1, j_0 // 8:row_bytes(j_1)]
+        cells = np.unpackbits(block, axis=1, bitorder='little')
+        return cells[:, j_0 % 8:j_0 % 8 + j_1 - j_0]
+
+    def to_array(self):
+        return self.read()
+
+    def alive_cells(self, rows_per_block=1024):
+        # Position of the alive cells, with the origin added,
+        # read a block of rows at a time
+        alive_cells = [np.zeros((0, 2), dtype=np.int64)]
+        for i in range(0, self.shape[0], rows_per_block):
+            block = self.read((i, 0), (i + rows_per_block, self.shape[1]))
+            alive_cells.append(np.argwhere(block) + (i + self.origin[0], self.origin[1]))
+        return np.concatenate(alive_cells)
+
+
+# Define checkpoint writer class
+class CheckpointWriter():
+    def __init__(self, directory, keep=None):
+        '''
+        Params:
+            directory : str
+                Directory for the checkpoints.
+            keep : int (optional)
+                If given, only the latest keep checkpoints are
+                kept on disk.
+        Output:
+            Initializes a writer for the periodic checkpoints of
+            a long run, saved as gen_<generation>.board files.
+        '''
+        self.directory = directory
+        self.keep = keep
+        self.paths = []
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, state, generation, pbc=False, rule=DEFAULT_RULE):
+        path = os.path.join(self.directory, 'gen_{:09d}.board'.format(generation))
+        save_board(path, state, generation, pbc, rule)
+        self.paths.append(path)
+        if self.keep is not None:
+            while len(self.paths) > self.keep:
+                os.remove(self.paths.pop(0))
+        return path
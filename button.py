@@ -25,18 +25,37 @@ class Button():
         self.color = color
         self.on_color = on_color
         self.rect = pygame.Rect(self.x, self.y, self.size, self.size)
+        # Cached image of the button, drawn again only when the
+        # state it shows changes
         self.img = pygame.Surface((self.size, self.size))
-        self.img.fill(self.color)
+        self.hover = False
+        self.drawn = None
+
+    def state(self):
+        # Everything the image depends on
+        return self.hover
+
+    @property
+    def dirty(self):
+        return self.state() != self.drawn
 
     def update(self, mpos):
-        self.img.fill(self.color)
-        if self.rect.collidepoint(mpos):
-            self.img.fill(self.on_color)
-            return True
-        return False
+        self.hover = bool(self.rect.collidepoint(mpos))
+        return self.hover
+
+    def draw(self, img):
+        # Draw the button on its image, at (0, 0)
+        img.fill(self.on_color if self.hover else self.color)
 
     def render(self, surf):
+        # Blit the cached image, drawing it first if the state
+        # changed. Returns the rectangle of the screen covered
+        state = self.state()
+        if state != self.drawn:
+            self.draw(self.img)
+            self.drawn = state
         surf.blit(self.img, (self.x, self.y))
+        return self.rect
 
 
 # Play button
@@ -45,37 +64,34 @@ class PlayButton(Button):
                  size=20, color=(200, 200, 200), 
                  on_color=(255, 255, 255)):
         super().__init__(x, y, size, color, on_color)
-        self.play_color = play_color_off
         self.play_color_off = play_color_off
         self.play_color_on = play_color_on
         self.sim = sim
 
-    def update(self, mpos):
-        self.img.fill(self.color)
-        self.play_color = self.play_color_off
-        if self.rect.collidepoint(mpos):
-            self.img.fill(self.on_color)
-            self.play_color = self.play_color_on
-            return True
-        return False
+    @property
+    def play_color(self):
+        return self.play_color_on if self.hover else self.play_color_off
+
+    def state(self):
+        return self.hover, self.sim.running
     
-    def render(self, surf):
-        super().render(surf)
+    def draw(self, img):
+        super().draw(img)
         if self.sim.running:
             render_points = [
-                (self.x + self.size / 4, self.y + self.size / 4),
-                (self.x + 3 * self.size / 4, self.y + self.size / 4),
-                (self.x + 3 * self.size / 4, self.y + 3 * self.size / 4),
-                (self.x + self.size / 4, self.y + 3 * self.size / 4)
+                (self.size / 4, self.size / 4),
+                (3 * self.size / 4, self.size / 4),
+                (3 * self.size / 4, 3 * self.size / 4),
+                (self.size / 4, 3 * self.size / 4)
             ]
         else:
             render_points = [
-                (self.x + self.size / 4, self.y + self.size / 4),
-                (self.x + 3 * self.size / 4, self.y + self.size / 2),
-                (self.x + self.size / 4, self.y + 3 * self.size / 4)
+                (self.size / 4, self.size / 4),
+                (3 * self.size / 4, self.size / 2),
+                (self.size / 4, 3 * self.size / 4)
             ]
 
-        pygame.draw.polygon(surf, self.play_color, render_points)
+        pygame.draw.polygon(img, self.play_color, render_points)
 
 
 # Reset camera button
@@ -85,16 +101,19 @@ class RefocusButton(PlayButton):
                  on_color=(255, 255, 255)):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
+
+    def state(self):
+        return self.hover, self.sim.centered
     
-    def render(self, surf):
-        surf.blit(self.img, (self.x, self.y))
+    def draw(self, img):
+        Button.draw(self, img)
 
-        center = (self.x + self.size / 2, self.y + self.size / 2)
-        pygame.draw.circle(surf, self.play_color, center, 
+        center = (self.size / 2, self.size / 2)
+        pygame.draw.circle(img, self.play_color, center, 
                             radius=self.size/3, width=int(self.size/13))
         # Smaller circle when display is not centered
         if not self.sim.centered:
-            pygame.draw.circle(surf, self.play_color, center, 
+            pygame.draw.circle(img, self.play_color, center, 
                             radius=self.size/7, width=int(self.size/15))
 
 
@@ -106,20 +125,23 @@ class RandomResetButton(PlayButton):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
 
-    def render(self, surf):
-        surf.blit(self.img, (self.x, self.y))
-
-        rect_pos = [(self.x + 0.25 * self.size, self.y + 0.2 * self.size),
-                    (self.x + 0.25 * self.size, self.y + 0.4 * self.size), 
-                    (self.x + 0.25 * self.size, self.y + 0.6 * self.size),
-                    (self.x + 0.45 * self.size, self.y + 0.2 * self.size),
-                    (self.x + 0.45 * self.size, self.y + 0.4 * self.size), 
-                    (self.x + 0.45 * self.size, self.y + 0.6 * self.size),
-                    (self.x + 0.65 * self.size, self.y + 0.2 * self.size),
-                    (self.x + 0.65 * self.size, self.y + 0.4 * self.size), 
-                    (self.x + 0.65 * self.size, self.y + 0.6 * self.size)]
+    def state(self):
+        return self.hover
+
+    def draw(self, img):
+        Button.draw(self, img)
+
+        rect_pos = [(0.25 * self.size, 0.2 * self.size),
+                    (0.25 * self.size, 0.4 * self.size), 
+                    (0.25 * self.size, 0.6 * self.size),
+                    (0.45 * self.size, 0.2 * self.size),
+                    (0.45 * self.size, 0.4 * self.size), 
+                    (0.45 * self.size, 0.6 * self.size),
+                    (0.65 * self.size, 0.2 * self.size),
+                    (0.65 * self.size, 0.4 * self.size), 
+                    (0.65 * self.size, 0.6 * self.size)]
         for pos in rect_pos:
-            pygame.draw.rect(surf, self.play_color, 
+            pygame.draw.rect(img, self.play_color, 
                             [pos[0], pos[1], self.size//10, self.size//10], 0)
 
 
@@ -131,16 +153,19 @@ class ClearButton(PlayButton):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
 
-    def render(self, surf):
-        surf.blit(self.img, (self.x, self.y))
+    def state(self):
+        return self.hover
+
+    def draw(self, img):
+        Button.draw(self, img)
         # First line
-        start_pos_1 = (self.x + self.size / 4, self.y + self.size / 4)
-        end_pos_1 = (self.x + 3 * self.size / 4, self.y + 3 * self.size / 4)
-        pygame.draw.line(surf, self.play_color, start_pos_1, end_pos_1, width=int(self.size/13))
+        start_pos_1 = (self.size / 4, self.size / 4)
+        end_pos_1 = (3 * self.size / 4, 3 * self.size / 4)
+        pygame.draw.line(img, self.play_color, start_pos_1, end_pos_1, width=int(self.size/13))
         # Second line
-        start_pos_2 = (self.x + 3 * self.size / 4, self.y + self.size / 4)
-        end_pos_2 = (self.x + self.size / 4, self.y + 3 * self.size / 4)
-        pygame.draw.line(surf, self.play_color, start_pos_2, end_pos_2, width=int(self.size/13))
+        start_pos_2 = (3 * self.size / 4, self.size / 4)
+        end_pos_2 = (self.size / 4, 3 * self.size / 4)
+        pygame.draw.line(img, self.play_color, start_pos_2, end_pos_2, width=int(self.size/13))
 
 
 # PBC Button
@@ -151,30 +176,34 @@ class PBCButton(PlayButton):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
 
-    def render(self, surf):
-        pygame.draw.rect(surf, self.play_color, 
-                            [self.x + 0.2 * self.size, self.y + 0.2 * self.size, 
+    def state(self):
+        return self.hover, self.sim.grid.pbc
+
+    def draw(self, img):
+        Button.draw(self, img)
+        pygame.draw.rect(img, self.play_color, 
+                            [0.2 * self.size, 0.2 * self.size, 
                              0.6 * self.size, 0.6 * self.size], int(self.size/13))
 
         if self.sim.grid.pbc:
             # Draw horizontal lines
-            x_range = [self.x + 0.2 * self.size, self.x + 0.8 * self.size]
-            y_1 = self.y + 0.3 * self.size
-            y_2 = self.y + 0.65 * self.size
-            pygame.draw.line(surf, self.sim.margin_color, 
+            x_range = [0.2 * self.size, 0.8 * self.size]
+            y_1 = 0.3 * self.size
+            y_2 = 0.65 * self.size
+            pygame.draw.line(img, self.sim.margin_color, 
                             (x_range[0], y_1), (x_range[1], y_1), 
                              width=int(self.size/10))
-            pygame.draw.line(surf, self.sim.margin_color, 
+            pygame.draw.line(img, self.sim.margin_color, 
                             (x_range[0], y_2), (x_range[1], y_2), 
                              width=int(self.size/10))
             # Draw vertical lines
-            y_range = [self.y + 0.2 * self.size, self.y + 0.8 * self.size]
-            x_1 = self.x + 0.3 * self.size
-            x_2 = self.x + 0.65 * self.size
-            pygame.draw.line(surf, self.sim.margin_color, 
+            y_range = [0.2 * self.size, 0.8 * self.size]
+            x_1 = 0.3 * self.size
+            x_2 = 0.65 * self.size
+            pygame.draw.line(img, self.sim.margin_color, 
                             (x_1, y_range[0]), (x_1, y_range[1]), 
                              width=int(self.size/10))
-            pygame.draw.line(surf, self.sim.margin_color, 
+            pygame.draw.line(img, self.sim.margin_color, 
                             (x_2, y_range[0]), (x_2, y_range[1]), 
                              width=int(self.size/10))
 
@@ -186,18 +215,43 @@ class BackButton(PlayButton):
                  on_color=(255, 255, 255)):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
-        self.img = pygame.Surface((int(self.size / 6), int(1.05 * self.size/2)))
-        self.img.fill(self.play_color)
 
-    def render(self, surf):
+    def state(self):
+        return self.hover
+
+    def draw(self, img):
+        Button.draw(self, img)
         render_points = [
-            (self.x + self.size / 2, self.y + self.size / 4),
-            (self.x + self.size / 4, self.y + self.size / 2),
-            (self.x + self.size / 2, self.y + 3 * self.size / 4)
+            (self.size / 2, self.size / 4),
+            (self.size / 4, self.size / 2),
+            (self.size / 2, 3 * self.size / 4)
         ]
-        pygame.draw.polygon(surf, self.play_color, render_points)
-        self.img.fill(self.play_color)
-        surf.blit(self.img, (self.x + 1.25 * self.size / 2, self.y + self.size / 4))
+        pygame.draw.polygon(img, self.play_color, render_points)
+        img.fill(self.play_color, (1.25 * self.size / 2, self.size / 4, 
+                                   int(self.size / 6), int(1.05 * self.size/2)))
+
+# Jump button
+class JumpButton(PlayButton):
+    def __init__(self, sim, play_color_on, play_color_off, x, y, 
+                 size=20, color=(200, 200, 200), 
+                 on_color=(255, 255, 255)):
+        super().__init__(sim, play_color_on, play_color_off, x, y, 
+                         size, color, on_color)
+
+    def state(self):
+        return self.hover
+
+    def draw(self, img):
+        Button.draw(self, img)
+        # Draw two triangles, as a fast forward symbol
+        for x_0 in [0.2 * self.size, 0.5 * self.size]:
+            render_points = [
+                (x_0, self.size / 4),
+                (x_0 + 0.3 * self.size, self.size / 2),
+                (x_0, 3 * self.size / 4)
+            ]
+            pygame.draw.polygon(img, self.play_color, render_points)
+
 
 # Menu button
 class MenuButton(PlayButton):
@@ -206,23 +260,27 @@ class MenuButton(PlayButton):
                  on_color=(255, 255, 255)):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
+
+    def state(self):
+        return self.hover, self.sim.show_menu
     
-    def render(self, surf):
+    def draw(self, img):
+        Button.draw(self, img)
         if self.sim.show_menu:
             render_points = [
-                (self.x + self.size / 4, self.y + self.size / 4),
-                (self.x + 3 * self.size / 4, self.y + self.size / 4),
-                (self.x + self.size / 2, self.y + 3 * self.size / 4)
+                (self.size / 4, self.size / 4),
+                (3 * self.size / 4, self.size / 4),
+                (self.size / 2, 3 * self.size / 4)
             ]
 
         else:
             render_points = [
-                (self.x + self.size / 4, self.y + self.size / 4),
-                (self.x + 3 * self.size / 4, self.y + self.size / 2),
-                (self.x + self.size / 4, self.y + 3 * self.size / 4)
+                (self.size / 4, self.size / 4),
+                (3 * self.size / 4, self.size / 2),
+                (self.size / 4, 3 * self.size / 4)
             ]
 
-        pygame.draw.polygon(surf, self.play_color, render_points)
+        pygame.draw.polygon(img, self.play_color, render_points)
 
 
 # Unselection button
@@ -233,12 +291,16 @@ class UnselectButton(PlayButton):
         super().__init__(sim, play_color_on, play_color_off, x, y, 
                          size, color, on_color)
 
-    def render(self, surf):
+    def state(self):
+        return self.hover, self.sim.drawing_asset
+
+    def draw(self, img):
+        Button.draw(self, img)
         width = int(self.size / 40)
         if self.sim.drawing_asset:
             width = 0
-        center = (self.x + self.size / 2, self.y + self.size / 2)
-        pygame.draw.circle(surf, self.play_color, center, 
+        center = (self.size / 2, self.size / 2)
+        pygame.draw.circle(img, self.play_color, center, 
                             radius=self.size/4, width=width)
         
 
@@ -256,6 +318,8 @@ class AssetButton():
         self.on_color = on_color
         self.rect_pos = rect_pos
         self.rect = pygame.Rect(rect_pos[0], rect_pos[1], self.size[0], self.size[1])
+        # Rendered text for each color
+        self.labels = dict()
 
     def update(self, mpos):
         self.text_color = self.off_color
@@ -264,5 +328,63 @@ class AssetButton():
             return True
         return False
 
+    def move(self, y):
+        # Move the button vertically, for scrolling menus
+        self.y = y
+        self.rect.y = y
+
     def render(self, surf, font):
-        surf.blit(font.render(self.text, True, self.text_color), (self.x, self.y))
\ No newline at end of file
+        if self.text_color not in self.labels:
+            self.labels[self.text_color] = font.render(self.text, True, self.text_color)
+        surf.blit(self.labels[self.text_color], (self.x, self.y))
+
+
+# Text label
+class Label():
+    def __init__(self, font, color, x, y, background=None):
+        '''
+        Params:
+            font : pygame.font.Font
+                Font of the text.
+            color : tuple
+                Color of the text.
+            x, y : float
+                Position of the top left corner of the text.
+            background : tuple (optional)
+                Color filled behind the text when it is drawn, 
+                which erases the previous text. Labels without 
+                one are drawn over other content, so their area
+                can only be drawn again along with it.
+        Output:
+            Initializes a label that renders its text once, and 
+            again only when set_text changes it.
+        '''
+        self.font = font
+        self.color = color
+        self.x = x
+        self.y = y
+        self.background = background
+        self.text = None
+        self.img = None
+        self.dirty = False
+        # Screen area covered by the last text drawn
+        self.drawn_rect = None
+
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            self.img = self.font.render(text, True, self.color)
+            self.dirty = True
+
+    def render(self, surf):
+        # Blit the text, after erasing the previous one if there
+        # is a background. Returns the rectangle of the screen 
+        # covered
+        rect = pygame.Rect(self.x, self.y, *self.img.get_size())
+        area = rect if self.drawn_rect is None else rect.union(self.drawn_rect)
+        if self.background is not None:
+            surf.fill(self.background, area)
+        surf.blit(self.img, rect)
+        self.drawn_rect = rect
+        self.dirty = False
+        return area
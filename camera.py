@@ -0,0 +1,93 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import pygame
+import numpy as np
+
+# Import scripts
+from render import cell_lookup
+
+
+# Define camera class
+class Camera():
+    def __init__(self, sim):
+        '''
+        Params:
+            sim : Simulation
+                Instance of the Simulation class, whose display
+                offset and size set the pan and zoom.
+        Output:
+            Initializes a camera that maps screen pixels to the
+            display cells, numbered from the top left corner of
+            the grid area (the board starts at display cell 
+            margin). The mappings only depend on the pan and zoom,
+            so they are computed once per camera change.
+        '''
+        self.sim = sim
+        self.n_cells = int(sim.grid_size * 1.1)
+        self.margin = int(sim.grid_size * 0.09)
+        self._unscaled = [cell_lookup(sim.width, self.n_cells), 
+                          cell_lookup(sim.height, self.n_cells)]
+        self._key = None
+        self.update()
+
+    def _axis(self, axis):
+        size = [self.sim.width, self.sim.height][axis]
+        screen_size = self.sim.screen.get_size()[axis]
+        offset = self.sim.display_offset[axis]
+        scaled_size = self.sim.display_size[axis]
+        # Pixel of the unscaled display shown at each screen pixel
+        pixel = (np.arange(screen_size) - offset) * size // scaled_size
+        inside = (pixel >= 0) & (pixel < size)
+        lookup = np.full(screen_size, self.n_cells)
+        lookup[inside] = self._unscaled[axis][pixel[inside]]
+        # Display cell under each screen pixel, gaps included
+        cell = pixel * self.n_cells // size
+        return lookup, cell
+
+    def update(self):
+        # Recompute the mappings if the pan or zoom changed
+        key = (tuple(self.sim.display_offset), tuple(self.sim.display_size))
+        if key == self._key:
+            return
+        self._key = key
+        # Display cell drawn at each screen pixel column and row,
+        # n_cells for the gaps between cells
+        self.lookup_x, self.cell_x = self._axis(0)
+        self.lookup_y, self.cell_y = self._axis(1)
+        # Range of display cells on screen
+        self.low = (int(self.cell_x[0]), int(self.cell_y[0]))
+        self.high = (int(self.cell_x[-1]) + 1, int(self.cell_y[-1]) + 1)
+
+    def display_cell(self, mpos):
+        # Display cell under the mouse
+        x = min(max(int(mpos[0]), 0), len(self.cell_x) - 1)
+        y = min(max(int(mpos[1]), 0), len(self.cell_y) - 1)
+        return int(self.cell_x[x]), int(self.cell_y[y])
+
+    def grid_cell(self, mpos):
+        # Grid cell under the mouse, relative to the grid view
+        x, y = self.display_cell(mpos)
+        return x - self.margin, y - self.margin
+
+    def cell_rect(self, x, y):
+        # Screen rectangle covered by the given display cell
+        cols = np.flatnonzero(self.lookup_x == x)
+        rows = np.flatnonzero(self.lookup_y == y)
+        if len(cols) == 0 or len(rows) == 0:
+            return None
+        return pygame.Rect(int(cols[0]), int(rows[0]), len(cols), len(rows))
@@ -0,0 +1,357 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Soup search, which runs random soups on all CPU cores until they
+# stabilize and counts the objects left in their ash. Example:
+#
+#     python -m census --soups 100000 --output runs/census.csv \
+#                      --export library
+
+# Import modules
+import argparse
+import csv
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Import scripts
+from ensemble import Ensemble
+from engine import NumpyEngine
+from grid import GridAsset
+from patterns import write_plaintext
+from rules import parse_rule, LIFE
+
+
+# Offsets of the cells connected to a cell, itself included
+CONNECTED = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+
+# Canonical description of every object seen by this process,
+# keyed by the rule and the code of the object as it was found
+_canonical = dict()
+
+
+def connected_objects(mask):
+    '''
+    Params:
+        mask : np.ndarray
+            2-D bool array.
+    Output:
+        Returns a list with an (n, 2) array of the [i, j]
+        positions of each group of cells of mask that are
+        connected through any of their 8 neighbors.
+    '''
+    remaining = set(map(tuple, np.argwhere(mask).tolist()))
+    objects = []
+    while remaining:
+        stack = [remaining.pop()]
+        cells = []
+        while stack:
+            i, j = stack.pop()
+            cells.append((i, j))
+            for di, dj in CONNECTED:
+                if (i + di, j + dj) in remaining:
+                    remaining.remove((i + di, j + dj))
+                    stack.append((i + di, j + dj))
+        objects.append(np.array(cells, dtype=np.int64))
+    return objects
+
+
+def encode(cells):
+    # Code of the cells, translated to the origin: the size of
+    # their bounding box and the hex digits of its rows of bits
+    cells = cells - cells.min(axis=0)
+    width, height = cells.max(axis=0) + 1
+    bitmap = np.zeros((height, width), dtype=np.uint8)
+    bitmap[cells[:, 1], cells[:, 0]] = 1
+    return '{}x{}_{}'.format(width, height, np.packbits(bitmap, axis=1).tobytes().hex())
+
+
+def orientations(cells):
+    # The 8 orientations of the cells, as the pattern menu
+    # rotates and flips them
+    asset = GridAsset(None)
+    asset.set_alive_cells(cells)
+    for _ in range(2):
+        for _ in range(4):
+            yield asset.alive_cells
+            asset.rotate()
+        asset.flip()
+
+
+def phases(cells, rule, max_period):
+    '''
+    Params:
+        cells : np.ndarray
+            (n, 2) array with the cells of an object.
+        rule : Rule
+            Rule of the object.
+        max_period : int
+            Amount of generations to try.
+    Output:
+        Returns the list of cell arrays of each phase of the
+        object stepped on its own, or None if it does not return
+        to its first phase within max_period generations, in
+        which case it is not an object on its own.
+    '''
+    cells = cells - cells.min(axis=0)
+    # Room for the object to change by max_period cells on each
+    # side, so that the edges of the board never matter
+    margin = max_period + 1
+    size = int(cells.max()) + 1 + 2 * margin
+    state = np.zeros((size, size), dtype=np.uint8)
+    state[cells[:, 0] + margin, cells[:, 1] + margin] = 1
+    first = state
+    engine = NumpyEngine(rule)
+    found = [cells]
+    for _ in range(max_period):
+        state = engine.step(state, False)
+        if np.array_equal(state, first):
+            return found
+        found.append(np.argwhere(state) - margin)
+    return None
+
+
+def identify(cells, rule=LIFE, max_period=64):
+    '''
+    Params:
+        cells : np.ndarray
+            (n, 2) array with the cells of an object, in one of
+            its phases.
+        rule : Rule (optional)
+            Rule of the object.
+        max_period : int (optional)
+            Longest period of an object.
+    Output:
+        Returns a tuple (name, period, cells), where cells is
+        the canonical phase and orientation of the object: the
+        one with the smallest code over its phases, rotations
+        and flips. The name is 'xs' and the population for still
+        lifes, 'xp' and the period for oscillators, or 'zz' for
+        cells that are not stable on their own, followed by the
+        canonical code. Results are kept in a hash table, so
+        each object is only stepped and rotated once.
+    '''
+    key = (str(rule), encode(cells))
+    if key in _canonical:
+        return _canonical[key]
+    found = phases(cells, rule, max_period)
+    if found is None:
+        prefix, period, found = 'zz', 0, [cells]
+    else:
+        period = len(found)
+        prefix = 'xs{}'.format(len(cells)) if period == 1 else 'xp{}'.format(period)
+    code, best = min(((encode(oriented), oriented) for phase in found
+                      for oriented in orientations(phase)), key=lambda item: item[0])
+    best = best - best.min(axis=0)
+    _canonical[key] = ('{}_{}'.format(prefix, code), period, best)
+    return _canonical[key]
+
+
+# Define census class
+class Census():
+    def __init__(self):
+        '''
+        Output:
+            Initializes an empty census, with the count of each
+            object, a sample of each one with the lowest soup
+            seed it was found in, and the seeds of the soups that
+            did not stabilize.
+        '''
+        self.soups = 0
+        self.counts = Counter()
+        self.samples = dict()
+        self.unstable = []
+        # Objects cut by the edge of the board, not counted
+        self.edge = 0
+
+    def add_object(self, cells, seed, rule=LIFE, max_period=64):
+        name, period, canonical = identify(cells, rule, max_period)
+        self.counts[name] += 1
+        if name not in self.samples or seed < self.samples[name]['seed']:
+            self.samples[name] = {'seed': seed, 'period': period, 'cells': canonical}
+
+    def add_board(self, state, period, seed, rule=LIFE, max_period=64):
+        '''
+        Params:
+            state : np.ndarray
+                2-D uint8 array with a stable board.
+            period : int
+                Period of the board.
+            seed : int
+                Seed of the soup of the board.
+        Output:
+            Counts the objects of the board. Objects are the
+            groups of connected cells over all the phases of the
+            board, so that the parts of an oscillator are kept
+            together. Objects with cells on the edge of the board
+            may only be stable because of it, and are not
+            counted.
+        '''
+        n_i, n_j = state.shape
+        engine = NumpyEngine(rule)
+        union = state.astype(bool)
+        phase = state
+        for _ in range(period - 1):
+            phase = engine.step(phase, False)
+            union |= phase.astype(bool)
+        self.soups += 1
+        for cells in connected_objects(union):
+            i, j = cells[:, 0], cells[:, 1]
+            if i.min() == 0 or j.min() == 0 or i.max() == n_i - 1 or j.max() == n_j - 1:
+                self.edge += 1
+                continue
+            # The cells of the object in the stable state
+            cells = cells[state[i, j] == 1]
+            if len(cells):
+                self.add_object(cells, seed, rule, max_period)
+
+    def merge(self, other):
+        # Add the counts of another census, such as the one of a
+        # batch of soups searched by another process
+        self.soups += other.soups
+        self.edge += other.edge
+        self.unstable += other.unstable
+        self.counts.update(other.counts)
+        for name, sample in other.samples.items():
+            if name not in self.samples or sample['seed'] < self.samples[name]['seed']:
+                self.samples[name] = sample
+
+    def save(self, path):
+        # Write the census as a CSV file, from the most common
+        # object. The file is replaced at once, so it can be read
+        # while the search runs
+        temp = path + '.tmp'
+        with open(temp, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['object', 'count', 'period', 'population', 'seed'])
+            for name, count in self.counts.most_common():
+                sample = self.samples[name]
+                writer.writerow([name, count, sample['period'], len(sample['cells']), sample['seed']])
+        os.replace(temp, path)
+
+
+def search(seeds, size=64, soup_size=16, density=0.5, rule=LIFE,
+           max_generations=10000, max_period=64):
+    '''
+    Params:
+        seeds : list
+            Seeds of the soups to search.
+        size : int (optional)
+            Number of cells along each dimension of the board
+            around each soup.
+        soup_size : int (optional)
+            Size of the square soups, placed at the center of
+            the boards.
+        density : float (optional)
+            Fraction of alive cells of the soups.
+        rule : Rule (optional)
+            Life-like rule of the boards.
+        max_generations : int (optional)
+            Soups not stable after this many generations are
+            listed as unstable.
+        max_period : int (optional)
+            Longest period detected.
+    Output:
+        Returns the Census of the soups, which are all stepped
+        together as an Ensemble.
+    '''
+    ensemble = Ensemble(len(seeds), size, seeds=seeds, density=density, rule=rule,
+                        max_period=max_period, soup_size=soup_size)
+    ensemble.run(max_generations)
+    census = Census()
+    for b, seed in enumerate(ensemble.seeds.tolist()):
+        if ensemble.stable_at[b] < 0:
+            census.unstable.append(seed)
+        else:
+            census.add_board(ensemble.state(b), int(ensemble.period[b]), seed, rule, max_period)
+    return census
+
+
+def export(census, directory, names):
+    # Write the sample of each of the given objects as a
+    # plaintext file, which the pattern menu can load
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        path = os.path.join(directory, name + '.cells')
+        if not os.path.exists(path):
+            write_plaintext(path, census.samples[name]['cells'], name)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Search random soups and count the objects they leave.')
+    parser.add_argument('--soups', type=int, default=10000)
+    parser.add_argument('--first-seed', type=int, default=0,
+                        help='seed of the first soup, the next soups use the next seeds')
+    parser.add_argument('--batch', type=int, default=500,
+                        help='soups stepped together by each task')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes, by default one per CPU')
+    parser.add_argument('--size', type=int, default=64,
+                        help='number of cells along each dimension of the board around each soup')
+    parser.add_argument('--soup-size', type=int, default=16)
+    parser.add_argument('--density', type=float, default=0.5)
+    parser.add_argument('--rule', default='B3/S23',
+                        help='Life-like rule, in B/S notation or by name')
+    parser.add_argument('--max-generations', type=int, default=10000)
+    parser.add_argument('--max-period', type=int, default=64)
+    parser.add_argument('--output', default='census.csv',
+                        help='CSV file with the census, updated after every batch')
+    parser.add_argument('--export', default=None, metavar='DIRECTORY',
+                        help='write a plaintext file of every object found, '
+                             'such as the library folder of the pattern menu')
+    parser.add_argument('--export-min-population', type=int, default=1,
+                        help='only export objects with at least this many cells')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        rule = parse_rule(args.rule)
+        # Fail before starting the workers if the rule is not
+        # supported
+        Ensemble(1, args.size, rule=rule)
+    except ValueError as error:
+        raise SystemExit(error)
+    last = args.first_seed + args.soups
+    batches = [list(range(first, min(first + args.batch, last)))
+               for first in range(args.first_seed, last, args.batch)]
+    census = Census()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        results = [pool.submit(search, seeds, args.size, args.soup_size, args.density, rule,
+                               args.max_generations, args.max_period) for seeds in batches]
+        for result in results:
+            batch = result.result()
+            new = [name for name in batch.counts if name not in census.counts]
+            census.merge(batch)
+            census.save(args.output)
+            if args.export is not None:
+                export(census, args.export,
+                       [name for name in new if len(census.samples[name]['cells']) >= args.export_min_population])
+            elapsed = time.perf_counter() - start
+            print('{} soups, {} objects, {} kinds, {} new, {:.0f} soups/s'.format(
+                  census.soups + len(census.unstable), sum(census.counts.values()),
+                  len(census.counts), len(new), (census.soups + len(census.unstable)) / elapsed))
+    if census.unstable:
+        print('{} soups did not stabilize, seeds: {}'.format(
+              len(census.unstable), ' '.join(map(str, census.unstable[:20]))))
+
+
+if __name__ == '__main__':
+    main()
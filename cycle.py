@@ -0,0 +1,158 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+from collections import deque
+import numpy as np
+
+
+def mix64(values):
+    '''
+    Params:
+        values : np.ndarray
+            Array of integers.
+    Output:
+        Returns a uint64 array with a pseudo-random key for
+        each value (the splitmix64 finalizer), which serves as
+        the Zobrist key of the cell with that position.
+    '''
+    x = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def cell_keys(grid, indexes=None):
+    # Zobrist keys of the alive cells of the grid, or of the
+    # given flat indexes of a bounded grid
+    if indexes is not None:
+        return mix64(indexes)
+    if not hasattr(grid, 'get_alive_array'):
+        # Packed cells are unpacked into a copy, so they stay packed
+        state = grid.get_cells() if getattr(grid, 'packed', None) is not None else grid.state
+        indexes = np.flatnonzero(state)
+        if state.dtype == np.uint8:
+            return mix64(indexes)
+        # Cells with continuous states, the key also depends on
+        # the exact state
+        values = state.reshape(-1)[indexes].astype(np.float32).view(np.uint32)
+        return mix64(mix64(values) ^ indexes.astype(np.uint64))
+    alive_cells = grid.get_alive_array().astype(np.uint64)
+    return mix64((alive_cells[:, 0] << np.uint64(32)) ^ (alive_cells[:, 1] & np.uint64(0xFFFFFFFF)))
+
+
+def xor_all(keys):
+    return np.bitwise_xor.reduce(keys) if len(keys) else np.uint64(0)
+
+
+def same_state(a, b):
+    # Whether two grid snapshots hold the same cells. Sparse 
+    # snapshots are dicts of tiles, where empty tiles may be kept
+    if isinstance(a, dict) or isinstance(b, dict):
+        if not (isinstance(a, dict) and isinstance(b, dict)):
+            return False
+        a = {key: tile for key, tile in a.items() if tile.any()}
+        b = {key: tile for key, tile in b.items() if tile.any()}
+        return a.keys() == b.keys() and all(np.array_equal(a[key], b[key]) for key in a)
+    return a.dtype == b.dtype and np.array_equal(a, b)
+
+
+# Define cycle detector class
+class CycleDetector():
+    def __init__(self, max_entries=4096):
+        '''
+        Params:
+            max_entries : int (optional)
+                Amount of recent generations whose hash is kept,
+                which is the longest period that can be detected.
+        Output:
+            Initializes a detector that hashes the grid after
+            each generation, as the XOR of the keys of its alive
+            cells. When the cells that changed are known the
+            hash is updated with their keys only. A repeated hash
+            is only a candidate cycle, since different states may
+            share a hash: a snapshot of the grid is kept, and the
+            cycle is confirmed if the grid is the same one period
+            later. Then self.period and self.entry hold the period
+            and the generation of the repeat, from which the grid
+            is periodic.
+        '''
+        self.max_entries = max_entries
+        self.reset()
+
+    def reset(self):
+        # Forget the hashes, after the grid was edited
+        self.hashes = dict()
+        self.order = deque()
+        self.value = None
+        self.last = None
+        self.period = None
+        self.entry = None
+        # Generation, period and snapshot of the candidate cycle
+        self.candidate = None
+
+    def record(self, generation, grid):
+        '''
+        Params:
+            generation : int
+                Generation of the grid state.
+            grid : Grid or SparseGrid
+                Grid at that generation.
+        Output:
+            Returns True if this generation confirms a cycle for
+            the first time.
+        '''
+        if self.period is not None:
+            return False
+        # Sparse grids are always hashed in full. The bounded
+        # grids are not checked with hasattr(grid, 'state'), which
+        # would unpack packed cells
+        changes = None if hasattr(grid, 'get_alive_array') else grid.last_changes
+        if self.last is None or generation != self.last + 1 or changes is None:
+            if self.last is not None and generation != self.last + 1:
+                self.reset()
+            self.value = xor_all(cell_keys(grid))
+        else:
+            self.value ^= xor_all(cell_keys(grid, changes))
+        self.last = generation
+
+        # Compare the grid with the candidate one period later
+        if self.candidate is not None and generation == self.candidate[0] + self.candidate[1]:
+            start, period, snapshot = self.candidate
+            self.candidate = None
+            if same_state(snapshot, grid.snapshot()):
+                self.entry, self.period = start, period
+                return True
+
+        value = int(self.value)
+        if value in self.hashes:
+            if self.candidate is None:
+                self.candidate = (generation, generation - self.hashes[value], grid.snapshot())
+            return False
+        self.hashes[value] = generation
+        self.order.append((generation, value))
+        if len(self.order) > self.max_entries:
+            old_generation, old_value = self.order.popleft()
+            if self.hashes.get(old_value) == old_generation:
+                del self.hashes[old_value]
+        return False
+
+    def equivalent(self, generation):
+        # Generation in the first period of the cycle with the
+        # same state as the given one, or None if it is unknown
+        if self.period is None or generation < self.entry:
+            return None
+        return self.entry + (generation - self.entry) % self.period
@@ -0,0 +1,167 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import numpy as np
+
+# Import scripts
+from rules import LIFE
+
+
+# Offsets of the 8 cells in the Moore neighborhood
+MOORE_OFFSETS = [(-1, -1), (-1, 0), (-1, 1),
+                 (0, -1),           (0, 1),
+                 (1, -1),  (1, 0),  (1, 1)]
+
+
+def random_soup(size, seed=None, density=0.5):
+    '''
+    Params:
+        size : int
+            Number of cells along each dimension of the grid.
+        seed : int (optional)
+            Seed of the random state.
+        density : float (optional)
+            Fraction of alive cells.
+    Output:
+        Returns a 2-D uint8 array with a random state, always
+        the same for the same seed.
+    '''
+    rng = np.random.default_rng(seed)
+    return (rng.random((size, size)) < density).astype(np.uint8)
+
+
+def neighbor_count(state, pbc):
+    '''
+    Params:
+        state : np.ndarray
+            2-D uint8 array with the state (0 or 1) of each
+            cell, indexed as state[i, j].
+        pbc : bool
+            If True the boundaries loop around, otherwise
+            cells outside the grid are considered dead.
+    Output:
+        Returns a 2-D uint8 array with the amount of alive
+        neighbors of each cell.
+    '''
+    # Pad the grid with a one cell halo, either with dead
+    # cells or with the opposite edge of the grid
+    mode = 'wrap' if pbc else 'constant'
+    return padded_count(np.pad(state, 1, mode=mode))
+
+
+def padded_count(padded):
+    '''
+    Params:
+        padded : np.ndarray
+            2-D uint8 array with the state of a block of cells
+            surrounded by a one cell halo.
+    Output:
+        Returns a 2-D uint8 array with the amount of alive
+        neighbors of each cell inside the halo.
+    '''
+    n_i, n_j = padded.shape[0] - 2, padded.shape[1] - 2
+
+    # Add up the 8 shifted copies of the grid
+    counts = np.zeros((n_i, n_j), dtype=np.uint8)
+    for di, dj in MOORE_OFFSETS:
+        counts += padded[1 + di:1 + di + n_i, 1 + dj:1 + dj + n_j]
+    return counts
+
+
+# Define vectorized engine class
+class NumpyEngine():
+    '''
+    Steps the whole grid at once using shifted sums of
+    the state array, instead of visiting cells one by one.
+    The next state of each cell comes from the lookup table
+    of the rule, so every Life-like rule costs the same.
+    '''
+    def __init__(self, rule=LIFE):
+        self.rule = rule
+
+    def step(self, state, pbc):
+        '''
+        Params:
+            state : np.ndarray
+                2-D uint8 array with the current grid state.
+            pbc : bool
+                Whether to use periodic boundary conditions.
+        Output:
+            Returns a new 2-D uint8 array with the state of
+            the grid after one generation.
+        '''
+        return self.rule.apply(state, neighbor_count(state, pbc))
+
+    def advance(self, state, pbc, generations):
+        # Step the grid the given amount of generations
+        for _ in range(generations):
+            state = self.step(state, pbc)
+        return state
+
+    def step_frontier(self, state, pbc, changed):
+        '''
+        Params:
+            state : np.ndarray
+                2-D uint8 array with the current grid state. It
+                must be contiguous, since it is updated in place.
+            pbc : bool
+                Whether to use periodic boundary conditions.
+            changed : np.ndarray
+                Flat indexes of the cells that changed in the
+                last generation.
+        Output:
+            Steps the grid one generation in place, recomputing
+            only the changed cells and their neighbors, which are
+            the only ones that can change next. Returns the flat
+            indexes of the cells that changed in this generation.
+        '''
+        n_i, n_j = state.shape
+        flat = state.reshape(-1)
+        if len(changed) == 0:
+            return changed
+
+        # Candidate cells are the changed cells and their neighbors
+        i, j = np.divmod(changed, n_j)
+        offsets = np.array([(0, 0)] + MOORE_OFFSETS)
+        cand_i = (i[:, None] + offsets[:, 0]).ravel()
+        cand_j = (j[:, None] + offsets[:, 1]).ravel()
+        if pbc:
+            cand_i %= n_i
+            cand_j %= n_j
+        else:
+            inside = (cand_i >= 0) & (cand_i < n_i) & (cand_j >= 0) & (cand_j < n_j)
+            cand_i, cand_j = cand_i[inside], cand_j[inside]
+        candidates = np.sort(cand_i * n_j + cand_j)
+        candidates = candidates[np.concatenate(([True], candidates[1:] != candidates[:-1]))]
+
+        # Count the alive neighbors of each candidate
+        i, j = np.divmod(candidates, n_j)
+        counts = np.zeros(len(candidates), dtype=np.uint8)
+        for di, dj in MOORE_OFFSETS:
+            n_pos_i, n_pos_j = i + di, j + dj
+            if pbc:
+                counts += flat[(n_pos_i % n_i) * n_j + n_pos_j % n_j]
+            else:
+                inside = (n_pos_i >= 0) & (n_pos_i < n_i) & (n_pos_j >= 0) & (n_pos_j < n_j)
+                counts[inside] += flat[n_pos_i[inside] * n_j + n_pos_j[inside]]
+
+        # Apply the rule and write back only the cells that changed
+        old = flat[candidates]
+        new = self.rule.apply(old, counts)
+        changed = candidates[new != old]
+        flat[changed] = new[new != old]
+        return changed
@@ -0,0 +1,315 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Ensembles of many small boards stepped together, for statistics
+# over random soups. Example:
+#
+#     python -m ensemble --boards 1000 --size 100 --generations 5000 \
+#                        --output runs/ensemble.csv
+
+# Import modules
+import argparse
+import csv
+import time
+import numpy as np
+
+# Import scripts
+from engine import random_soup
+from rules import Rule, parse_rule, LIFE
+
+
+# Define ensemble class
+class Ensemble():
+    def __init__(self, n_boards, grid_size, seeds=None, density=0.5, pbc=False,
+                 rule=LIFE, max_period=64, soup_size=None):
+        '''
+        Params:
+            n_boards : int
+                Number of boards.
+            grid_size : int
+                Number of cells along each dimension of every
+                board.
+            seeds : iterable (optional)
+                Seed of the random soup of each board, by default
+                0 to n_boards - 1. Board b starts in the same state
+                as headless.build_grid(grid_size, seeds[b], density).
+            density : float (optional)
+                Fraction of alive cells of the soups.
+            pbc : bool (optional)
+                Whether the boards use periodic boundary
+                conditions.
+            rule : Rule (optional)
+                Life-like rule of every board.
+            max_period : int (optional)
+                Longest period detected. Boards that repeat a
+                state within this many generations are stable.
+            soup_size : int (optional)
+                Size of the square soup, placed at the center of
+                an otherwise empty board. By default the soup
+                fills the whole board.
+        Output:
+            Initializes an ensemble that keeps all the boards in
+            a single 3-D array and steps them with the same
+            vectorized operations. After every generation the
+            population of each board is recorded, and the boards
+            whose state repeats are marked as stable and no
+            longer stepped.
+        '''
+        if not isinstance(rule, Rule):
+            raise ValueError('Ensembles only support Life-like rules: {}'.format(rule))
+        seeds = np.arange(n_boards) if seeds is None else np.asarray(list(seeds))
+        if len(seeds) != n_boards:
+            raise ValueError('Expected {} seeds, got {}'.format(n_boards, len(seeds)))
+        self.seeds = seeds
+        self.grid_size = grid_size
+        self.pbc = pbc
+        self.rule = rule
+        self.max_period = max_period
+        self.generation = 0
+
+        # Boards still being stepped, each with a one cell halo,
+        # and the index of each of them in the ensemble. Rows are
+        # padded with dead cells to whole 64 bit words, for the
+        # hash
+        n = grid_size
+        width = -(-(n + 2) // 8) * 8
+        self.padded = np.zeros((n_boards, n + 2, width), dtype=np.uint8)
+        soup_size = n if soup_size is None else min(soup_size, n)
+        low = 1 + (n - soup_size) // 2
+        for b, seed in enumerate(seeds.tolist()):
+            self.padded[b, low:low + soup_size, low:low + soup_size] = random_soup(soup_size, seed, density)
+        self.active = np.arange(n_boards)
+        # Final state of the boards that are no longer stepped
+        self.final = np.zeros((n_boards, n, n), dtype=np.uint8)
+
+        # Statistics of each board. stable_at is the generation
+        # where the cycle of a stable board starts, -1 until then
+        self.population = self._population()
+        self.initial_population = self.population.copy()
+        self.populations = [self.population.copy()]
+        self.stable_at = np.full(n_boards, -1)
+        self.period = np.zeros(n_boards, dtype=int)
+
+        # Random odd keys for the hash of each board, and the
+        # hashes of the last max_period generations of the active
+        # boards, with generation g in column g % max_period
+        rng = np.random.default_rng(0x5EED)
+        n_words = (n + 2) * width // 8
+        self.keys = rng.integers(0, 2 ** 63, n_words, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.hashes = np.zeros((n_boards, max_period), dtype=np.uint64)
+        self.hashes[:, 0] = self._hash()
+        self._allocate()
+
+    def _allocate(self):
+        # Work arrays for the neighbor counts of the active boards
+        a, n = len(self.active), self.grid_size
+        self.rows = np.empty((a, n + 2, n), dtype=np.uint8)
+        self.counts = np.empty((a, n, n), dtype=np.uint8)
+
+    def _population(self):
+        # Alive cells of each active board. The halo is dead
+        return self.padded.reshape(len(self.active), -1).sum(axis=1, dtype=np.int32)
+
+    def _hash(self):
+        # 64 bit hash of each active board, as the sum of its
+        # words of 8 cells times the random keys. Boards that
+        # differ in a single word never collide, since the keys
+        # are odd, and other collisions are unlikely but possible
+        words = self.padded.reshape(len(self.active), -1).view(np.uint64)
+        return (words * self.keys).sum(axis=1, dtype=np.uint64)
+
+    @property
+    def n_boards(self):
+        return len(self.seeds)
+
+    @property
+    def done(self):
+        # Whether every board is stable
+        return len(self.active) == 0
+
+    def state(self, b):
+        # Current state of board b, or for stable boards the
+        # state once they became stable
+        n = self.grid_size
+        rows = np.flatnonzero(self.active == b)
+        if len(rows):
+            return self.padded[rows[0], 1:n + 1, 1:n + 1].copy()
+        return self.final[b].copy()
+
+    def states(self):
+        # State of every board, as in state, as a 3-D array
+        n = self.grid_size
+        states = self.final.copy()
+        states[self.active] = self.padded[:, 1:n + 1, 1:n + 1]
+        return states
+
+    def step(self):
+        # Step every active board one generation, and update the
+        # statistics
+        if self.done:
+            return
+        p, n = self.padded, self.grid_size
+        if self.pbc:
+            # Fill the halo with the opposite edges
+            p[:, 0, 1:n + 1], p[:, n + 1, 1:n + 1] = p[:, n, 1:n + 1], p[:, 1, 1:n + 1]
+            p[:, :, 0], p[:, :, n + 1] = p[:, :, n], p[:, :, 1]
+
+        # Neighbor counts as sums of three rows of sums of three
+        # columns, minus the cell itself
+        state = p[:, 1:n + 1, 1:n + 1]
+        rows, counts = self.rows, self.counts
+        np.add(p[:, :, :n], p[:, :, 1:n + 1], out=rows)
+        rows += p[:, :, 2:n + 2]
+        np.add(rows[:, :n], rows[:, 1:n + 1], out=counts)
+        counts += rows[:, 2:]
+        counts -= state
+        state[...] = self.rule.apply(state, counts)
+        if self.pbc:
+            # Keep the halo dead, so that it does not change the
+            # population and the hash
+            p[:, [0, n + 1], :] = 0
+            p[:, :, [0, n + 1]] = 0
+        self.generation += 1
+        g = self.generation
+
+        self.population[self.active] = self._population()
+        self.populations.append(self.population.copy())
+
+        # Boards whose hash matches one of the last max_period
+        # generations are stable, with the shortest such period
+        hashes = self._hash()
+        column = g % self.max_period
+        distance = (g - np.arange(self.max_period) - 1) % self.max_period + 1
+        distance[distance > g] = 0
+        matches = (self.hashes == hashes[:, None]) & (distance > 0)
+        self.hashes[:, column] = hashes
+        stable = matches.any(axis=1)
+        if stable.any():
+            periods = np.where(matches, distance, self.max_period + 1).min(axis=1)[stable]
+            boards = self.active[stable]
+            self.period[boards] = periods
+            self.stable_at[boards] = g - periods
+            self.final[boards] = state[stable]
+            # Keep stepping only the boards that are not stable
+            keep = ~stable
+            self.padded = self.padded[keep]
+            self.hashes = self.hashes[keep]
+            self.active = self.active[keep]
+            self._allocate()
+
+    def run(self, generations, report=None, report_every=100):
+        '''
+        Params:
+            generations : int
+                Maximum amount of generations to step.
+            report : function (optional)
+                Called with the ensemble every report_every
+                generations.
+        Output:
+            Steps the boards until every one is stable or the
+            given amount of generations is reached.
+        '''
+        for _ in range(generations):
+            if self.done:
+                break
+            self.step()
+            if report is not None and self.generation % report_every == 0:
+                report(self)
+
+    def populations_array(self):
+        # Population of each board after every generation, with
+        # one row per generation. Stable boards keep the last
+        # population recorded
+        return np.stack(self.populations)
+
+    def statistics(self):
+        '''
+        Output:
+            Returns a dict of arrays with one entry per board:
+            its seed, the populations at the start and now, the
+            generation where it became periodic and its period
+            (-1 and 0 if it is still active), and the density of
+            its final ash, the alive cells left once it is
+            stable.
+        '''
+        cells = self.grid_size ** 2
+        stable = self.stable_at >= 0
+        return {'seed': self.seeds,
+                'initial_population': self.initial_population,
+                'population': self.population,
+                'stable_at': self.stable_at,
+                'period': self.period,
+                'ash_density': np.where(stable, self.population / cells, np.nan)}
+
+    def save(self, path):
+        # Write the statistics as a CSV file, one row per board
+        stats = self.statistics()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['board'] + list(stats))
+            for b in range(self.n_boards):
+                writer.writerow([b] + [value[b] for value in stats.values()])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Step many random soups together and collect statistics.')
+    parser.add_argument('--boards', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=100,
+                        help='number of cells along each dimension of every board')
+    parser.add_argument('--first-seed', type=int, default=0,
+                        help='seed of the first board, the next boards use the next seeds')
+    parser.add_argument('--density', type=float, default=0.5)
+    parser.add_argument('--generations', type=int, default=5000,
+                        help='maximum amount of generations')
+    parser.add_argument('--pbc', action='store_true')
+    parser.add_argument('--rule', default='B3/S23',
+                        help='Life-like rule, in B/S notation or by name')
+    parser.add_argument('--max-period', type=int, default=64)
+    parser.add_argument('--output', default=None,
+                        help='CSV file for the statistics of each board')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        rule = parse_rule(args.rule)
+        ensemble = Ensemble(args.boards, args.size,
+                            seeds=range(args.first_seed, args.first_seed + args.boards),
+                            density=args.density, pbc=args.pbc, rule=rule,
+                            max_period=args.max_period)
+    except ValueError as error:
+        raise SystemExit(error)
+    start = time.perf_counter()
+
+    def report(ensemble):
+        print('generation {}: {} boards active, {:.1f} s'.format(
+              ensemble.generation, len(ensemble.active), time.perf_counter() - start))
+
+    ensemble.run(args.generations, report=report)
+    stats = ensemble.statistics()
+    stable = stats['stable_at'] >= 0
+    print('{} of {} boards stable after {} generations'.format(
+          stable.sum(), ensemble.n_boards, ensemble.generation))
+    if stable.any():
+        print('mean time to stabilization {:.1f}, mean ash density {:.4f}'.format(
+              stats['stable_at'][stable].mean(), stats['ash_density'][stable].mean()))
+    if args.output is not None:
+        ensemble.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,13 +15,30 @@ limitations under the License.
 '''
 
 # Import modules
-import pygame
-import random
+import numpy as np
+
+# Import scripts
+from engine import NumpyEngine
+from hashlife import HashLifeEngine
+from storage import CellStorage, CellsView
+from boardfile import save_board
+from bitlife import PackedBoard, changed_cells, flip_cells, save_packed
+from ltl import LtLEngine
+from rules import LtLRule, parse_rule
+# render is only imported by the render methods, so that the
+# grids can be used without pygame, as in headless runs
 
 
 # Define Grid class
 class Grid():
-    def __init__(self, sim, grid_size):
+    # Cell shown at the top left corner of the grid area, which
+    # is always the origin for bounded grids
+    view = (0, 0)
+    # Generations stepped between checks for an interrupted jump
+    jump_chunk = 64
+    max_jump_exponent = 9
+
+    def __init__(self, sim, grid_size, engine=None, incremental=True):
         '''
         Params:
             sim : Simulation
@@ -31,198 +48,441 @@ class Grid():
                 Number of cells along each dimension of the 
                 grid. This means that the total amount of 
                 cells in the grid will be grid_size * grid_size.
+            engine : engine instance (optional)
+                Backend used to step the grid. It must provide
+                step(state, pbc) and advance(state, pbc, generations)
+                methods and a rule attribute. Defaults to NumpyEngine,
+                with the rule of Life. Larger than Life rules always
+                use LtLEngine. With engines that have a true packed
+                attribute, such as SwarEngine, the cells are kept in
+                a PackedBoard between generations.
+            incremental : bool (optional)
+                If True, only the cells that changed in the last
+                generation and their neighbors are recomputed, as 
+                long as the engine supports it and they are less 
+                than frontier_density of the grid.
         Output:
             Initializes an instance of the Grid class.
         '''
         self.sim = sim
         self.grid_size = grid_size
-        self.pbc = False
-        
-        # Build the grid
-        self.cells = dict()
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                self.cells[str(i)+';'+str(j)] = {'pos': [i, j],
-                                                 'state': random.randint(0,1)}
-
-        self.alive_cells = [self.cells[cell]['pos'] for cell in self.cells if self.cells[cell]['state'] == 1]
-
-    def get_cells(self):
-        out_cells = dict()
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                out_cells[str(i) + ';' + str(j)] = {'pos': [i, j], 
-                                        'state': 0 + self.cells[str(i)+';'+str(j)]['state']}
-        return out_cells
+        self._pbc = False
+        self.engine = NumpyEngine() if engine is None else engine
 
-    def clear(self):
-        # Clear the grid
-        self.cells = dict()
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                self.cells[str(i)+';'+str(j)] = {'pos': [i, j],
-                                                 'state': 0}
+        # Active frontier, with the flat indexes of the cells that
+        # changed in the last generation. None means unknown, which
+        # forces a full sweep
+        self.incremental = incremental
+        self.frontier_density = 0.001
+        self.frontier = None
+        self._edited = []
+
+        # HashLife engine used for long jumps, it keeps its
+        # caches between jumps
+        self.jump_engine = HashLifeEngine()
+        # PackedBoard with the cells while a packed engine steps
+        # them, or None while they are in the storage
+        self.packed = None
+        self.rule = self.engine.rule
+
+        # Build the grid, the state of cell (i, j) is
+        # stored in self.state[i, j]
+        self._storage = CellStorage(self.grid_size)
+        self.cells = CellsView(self)
+        self.reset_random()
+
+    @property
+    def storage(self):
+        # Cell storage, the packed cells are unpacked into it
+        # on the first access
+        self.unpack()
+        return self._storage
+
+    def unpack(self):
+        # Move the packed cells back to the storage, as engines
+        # without packed support and edits need
+        if self.packed is not None:
+            self._storage.load(self.packed.to_array())
+            self.packed = None
+
+    @property
+    def state(self):
+        return self.storage.state
+
+    @state.setter
+    def state(self, state):
+        self.packed = None
+        self._storage.load(state)
+        self.frontier = None
+
+    @property
+    def pbc(self):
+        return self._pbc
+
+    @pbc.setter
+    def pbc(self, pbc):
+        # Edge cells change neighbors, so the frontier is lost
+        self._pbc = pbc
+        if self.packed is not None:
+            self.packed.pbc = pbc
+        self.frontier = None
+
+    @property
+    def rule(self):
+        return self.engine.rule
 
-        self.alive_cells = []
+    @rule.setter
+    def rule(self, rule):
+        # Cells that did not change may change under the new rule,
+        # so the frontier is lost
+        if isinstance(rule, LtLRule) != isinstance(self.engine, LtLEngine):
+            self.unpack()
+            self.engine = LtLEngine(rule) if isinstance(rule, LtLRule) else NumpyEngine(rule)
+        else:
+            self.engine.rule = rule
+            if self.packed is not None:
+                self.packed.rule = rule
+        if self.jump_engine.supports(rule):
+            self.jump_engine.rule = rule
+        self.frontier = None
+
+    @property
+    def alive_cells(self):
+        # Positions of the alive cells, as [i, j] lists
+        return [list(self.storage.position(idx)) for idx in self.storage.alive]
+
+    @property
+    def population(self):
+        if self.packed is not None:
+            return self.packed.population
+        return self.storage.population
+
+    def is_alive(self, i, j):
+        if not self.storage.contains(i, j):
+            return False
+        return self.storage.get(self.storage.index(i, j)) == 1
+
+    def set_cell(self, i, j, value):
+        if self.storage.contains(i, j):
+            idx = self.storage.index(i, j)
+            self.storage.set(idx, value)
+            self._edited.append(idx)
+
+    def get_cells(self, out=None):
+        # Copy of the state, written into out if it fits. Packed 
+        # cells are unpacked for it, but stay packed
+        state = self.packed.to_array() if self.packed is not None else self.state
+        if isinstance(out, np.ndarray) and out.shape == state.shape:
+            np.copyto(out, state)
+            return out
+        return state if self.packed is not None else state.copy()
+
+    def set_cells(self, state):
+        # State array, or the packed words of a snapshot
+        if state.dtype == np.uint64:
+            if getattr(self.engine, 'packed', False):
+                self.packed = PackedBoard(state, self.grid_size, self.pbc, self.rule)
+                self._storage.release()
+                self.frontier = None
+                self._edited = []
+            else:
+                self.state = PackedBoard(state, self.grid_size).to_array()
+            return
+        self.state = state
+
+    def snapshot(self):
+        # Read-only copy-on-write view of the state, or of the
+        # packed words, which are never written in place
+        if self.packed is not None:
+            snapshot = self.packed.words.view()
+            snapshot.flags.writeable = False
+            return snapshot
+        return self.storage.snapshot()
+
+    @property
+    def last_changes(self):
+        # Flat indexes of the cells that changed in the last 
+        # generation, or None if they are not known
+        if self._edited:
+            return None
+        return self.frontier
+
+    def flip_cells(self, indexes):
+        # Flip the given flat indexes, as stored in last_changes
+        self.frontier = None
+        self._edited = []
+        if self.packed is not None:
+            # The words may be shared with a snapshot
+            self.packed.words = self.packed.words.copy()
+            flip_cells(self.packed.words, indexes, self.grid_size)
+            return
+        self.storage.detach()
+        self.state.reshape(-1)[indexes] ^= 1
+        self.storage.flip(indexes)
+
+    def stamp(self, cells, offset=(0, 0), mode='union'):
+        '''
+        Params:
+            cells : np.ndarray
+                Array with shape (n, 2) with the position of the
+                alive cells of a pattern.
+            offset : tuple (optional)
+                Grid cell where the pattern origin is placed.
+            mode : str (optional)
+                'union' sets the pattern cells alive, 'xor' flips
+                them, and 'replace' also kills every other cell 
+                in the bounding box of the pattern.
+        Output:
+            Writes the pattern to the grid in one go. Cells out of
+            the grid wrap around with PBC, or are dropped if not.
+        '''
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2) + offset
+        if len(cells) == 0:
+            return
+        n = self.grid_size
+        flat = self.state.reshape(-1)
+        if mode == 'replace':
+            # Every cell of the bounding box is written
+            low, high = cells.min(axis=0), cells.max(axis=0) + 1
+            i, j = np.arange(low[0], high[0]), np.arange(low[1], high[1])
+            if self.pbc:
+                i, j = np.unique(i % n), np.unique(j % n)
+            else:
+                i, j = i[(i >= 0) & (i < n)], j[(j >= 0) & (j < n)]
+            region = (i[:, None] * n + j).ravel()
+        if self.pbc:
+            cells %= n
+        else:
+            cells = cells[np.all((cells >= 0) & (cells < n), axis=1)]
+        indexes = np.sort(cells[:, 0] * n + cells[:, 1])
+        unique = np.ones(len(indexes), dtype=bool)
+        unique[1:] = indexes[1:] != indexes[:-1]
+        indexes = indexes[unique]
+
+        # New values of the written cells
+        if mode == 'replace':
+            region = np.sort(region)
+            new = np.zeros(len(region), dtype=np.uint8)
+            new[np.searchsorted(region, indexes)] = 1
+        else:
+            region = indexes
+            new = 1 - flat[region] if mode == 'xor' else np.ones(len(region), dtype=np.uint8)
+
+        # Only the cells that change are written and tracked
+        changed = new != flat[region]
+        region, new = region[changed], new[changed]
+        self.storage.put(region, new)
+        if len(region) > self.frontier_density * flat.size:
+            self.frontier = None
+            self._edited = []
+        else:
+            self._edited.extend(region.tolist())
+
+    def save(self, path, generation=0):
+        if self.packed is not None:
+            save_packed(path, self.packed, generation)
+            return
+        save_board(path, self.state, generation, self.pbc, str(self.rule))
+
+    def load(self, board):
+        # Load a BoardFile, with its rule. Boards of another size
+        # are placed at the origin and cut to fit
+        self.rule = parse_rule(board.rule)
+        self.pbc = board.pbc
+        if board.shape == (self.grid_size, self.grid_size) and board.origin == (0, 0):
+            self.state = board.to_array()
+        else:
+            self.clear()
+            self.stamp(board.alive_cells())
+
+    def clear(self):
+        # Clear the grid, an empty grid never changes unless
+        # the rule has birth on 0 neighbors
+        self.packed = None
+        self._storage.fill(0)
+        self.frontier = None if self.rule.b0 else np.zeros(0, dtype=np.intp)
+        self._edited = []
 
     def reset_random(self):
         # Rebuild the grid
-        self.cells = dict()
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                self.cells[str(i)+';'+str(j)] = {'pos': [i, j],
-                                                 'state': random.randint(0,1)}
-
-        self.alive_cells = [self.cells[cell]['pos'] for cell in self.cells if self.cells[cell]['state'] == 1]
-
-    def toggle_cell(self, mpos):
-        pos = [(mpos[0] - self.sim.display_offset[0]) * self.sim.width / self.sim.display_size[0], 
-               (mpos[1] - self.sim.display_offset[1]) *  self.sim.height / self.sim.display_size[1]]
-        x = (int(pos[0]) * int(self.sim.grid_size * 1.1) / self.sim.width) - int(self.sim.grid_size*0.09)
-        y = (int(pos[1]) * int(self.sim.grid_size * 1.1) / self.sim.height) - int(self.sim.grid_size*0.09)
-        idx = str(int(x)) + ';' + str(int(y))
-        if idx in self.cells:
-            old_state = 0 + self.cells[idx]['state']
-            if old_state == 0:
-                self.alive_cells.append(self.cells[idx]['pos'])
-            elif old_state == 1:
-                self.alive_cells.remove(self.cells[idx]['pos'])
-            self.cells[idx]['state'] = int(1 - old_state)
-
-    def get_neighbors(self, idx):
-        i, j = self.cells[idx]['pos']
-        # General neighbor indexes
-        next_i, prev_i = i + 1, i - 1
-        next_j, prev_j = j + 1, j - 1
-        # Check for boundaries and resolve PBC
-        if i == 0 and self.pbc:
-            prev_i = self.grid_size - 1
-        if i == (self.grid_size - 1) and self.pbc:
-            next_i = 0
-        if j == 0 and self.pbc:
-            prev_j = self.grid_size - 1
-        if j == (self.grid_size - 1) and self.pbc:
-            next_j = 0
-
-        neighbor_pos = [str(next_i) + ';' + str(j),
-                        str(prev_i) + ';' + str(j),
-                        str(i) + ';' + str(next_j),
-                        str(i) + ';' + str(prev_j),
-                        str(next_i) + ';' + str(next_j),
-                        str(prev_i) + ';' + str(next_j),
-                        str(next_i) + ';' + str(prev_j),
-                        str(prev_i) + ';' + str(prev_j)]
-
-        # Check that the neighbor positions are actually in the grid
-        for n_pos in neighbor_pos.copy():
-            if not n_pos in self.cells:
-                neighbor_pos.remove(n_pos)
-
-        return neighbor_pos
-
-    def get_alive_condition(self, idx):
-        neighbor_pos = self.get_neighbors(idx)
-
-        alive_neighbors = sum([self.cells[pos]['state'] for pos in neighbor_pos])
-        
-        # Compute alive condition:
-        # Death by underpopulation
-        if self.cells[idx]['state'] == 1 and alive_neighbors < 2:
-            return -1
-        # Death by overpopulation
-        if self.cells[idx]['state'] == 1 and alive_neighbors > 3:
-            return -1
-        # Birth by reproduction
-        if self.cells[idx]['state'] == 0 and alive_neighbors == 3:
-            return 1
-
-        return 0
+        self.state = np.random.randint(0, 2, (self.grid_size, self.grid_size), 
+                                       dtype=np.uint8)
+
+    def toggle_cell(self, i, j):
+        if self.storage.contains(i, j):
+            self.set_cell(i, j, 1 - self.is_alive(i, j))
 
     def update(self):
-        # Init empty list for new alive cells
-        new_alive = []
-        alive_cells = []
-        dead_cells = []
-        for cell in self.cells:
-            alive_condition = self.get_alive_condition(cell)
-            if alive_condition == 1:
-                new_alive.append(self.cells[cell]['pos'])
-                alive_cells.append(cell)
-            elif alive_condition == -1:
-                self.alive_cells.remove(self.cells[cell]['pos'])
-                dead_cells.append(cell)
-
-        self.alive_cells.extend(new_alive)
-        # Update cells
-        for cell in alive_cells:
-            self.cells[cell]['state'] = 1
-        for cell in dead_cells:
-            self.cells[cell]['state'] = 0
-
-    def render(self, surf):
+        if getattr(self.engine, 'packed', False):
+            self._step_packed()
+            return
+
+        # Add the cells edited since the last generation to the frontier
+        if self.frontier is not None and self._edited:
+            self.frontier = np.concatenate([self.frontier, 
+                                            np.array(self._edited, dtype=np.intp)])
+        self._edited = []
+
+        # Only step the active frontier while it is sparse
+        use_frontier = (self.incremental and self.frontier is not None 
+                        and hasattr(self.engine, 'step_frontier') 
+                        and len(self.frontier) <= self.frontier_density * self.state.size)
+        if use_frontier:
+            self.storage.detach()
+            self.frontier = self.engine.step_frontier(self.state, self.pbc, self.frontier)
+            self.storage.flip(self.frontier)
+            return
+
+        # Else step the whole grid one generation
+        new_state = self.engine.step(self.state, self.pbc)
+        frontier = None
+        if self.incremental:
+            frontier = np.flatnonzero(new_state != self.state)
+        self.state = new_state
+        self.frontier = frontier
+
+    def _step_packed(self, generations=1):
+        # Step the packed cells, packing them first after they
+        # were unpacked. The byte per cell buffer is released
+        # until they are unpacked again
+        if self.packed is None:
+            self.packed = PackedBoard.from_array(self._storage.state, self.pbc, self.rule)
+            self._storage.release()
+        old = self.packed.words
+        self.packed.advance(generations)
+        self._edited = []
+        self.frontier = None
+        if self.incremental and generations == 1:
+            self.frontier = changed_cells(old, self.packed.words, self.grid_size)
+
+    def advance(self, generations):
+        if getattr(self.engine, 'packed', False):
+            self._step_packed(generations)
+            return
+        # Engines that support the active frontier are stepped one 
+        # generation at a time, the rest advance all at once
+        if self.incremental and hasattr(self.engine, 'step_frontier'):
+            for _ in range(generations):
+                self.update()
+            return
+        self._edited = []
+        self.state = self.engine.advance(self.state, self.pbc, generations)
+
+    @property
+    def jump_mode(self):
+        # How jump advances the grid: 'window' with HashLife, 
+        # or 'step' generation by generation
+        if self.pbc or not self.jump_engine.supports(self.rule):
+            return 'step'
+        return 'window'
+
+    def jump(self, generations, interrupt=None):
+        '''
+        Params:
+            generations : int
+                Amount of generations to advance.
+            interrupt : function (optional)
+                Called between chunks of stepped generations. The
+                jump stops early once it returns True.
+        Output:
+            Jumps ahead with HashLife, which treats the board as a
+            window onto the unbounded plane: cells are not stopped
+            by the closed edges, so the result differs from 
+            stepping once anything reaches them. PBC and the rules
+            that HashLife does not support are stepped instead,
+            jump_chunk generations at a time. Returns the amount
+            of generations advanced.
+        '''
+        if self.jump_mode == 'step':
+            done = 0
+            while done < generations:
+                if interrupt is not None and interrupt():
+                    break
+                steps = min(self.jump_chunk, generations - done)
+                self.advance(steps)
+                done += steps
+            return done
+        self._edited = []
+        self.state = self.jump_engine.advance(self.state, False, generations)
+        return generations
+
+    def render(self, surf, cells=None):
         # Render a white square at the position of each 
-        # cell that is alive
-        for cell in self.alive_cells:
-            pos = [(int(self.sim.grid_size*0.09) + cell[0]) * self.sim.width // int(self.sim.grid_size * 1.1), 
-                   (int(self.sim.grid_size*0.09) + cell[1]) * self.sim.height // int(self.sim.grid_size * 1.1)]
-            cell_surf = pygame.Surface((self.sim.width // int(self.sim.grid_size * 1.1), 
-                                        self.sim.height // int(self.sim.grid_size * 1.1)))
-            cell_surf.fill((255,255,255))
-            surf.blit(cell_surf, pos)
+        # cell that is alive, all in a single blit. Only the
+        # cells in view are copied to the renderer. cells is 
+        # a state array to render instead of the current one
+        state = self.state if cells is None else cells
+        camera = self.sim.camera
+        from render import get_renderer
+        renderer = get_renderer(self.sim, (255,255,255))
+        renderer.clear()
+        i_0, j_0 = max(camera.low[0] - camera.margin, 0), max(camera.low[1] - camera.margin, 0)
+        i_1 = min(camera.high[0] - camera.margin, self.grid_size)
+        j_1 = min(camera.high[1] - camera.margin, self.grid_size)
+        if i_1 > i_0 and j_1 > j_0:
+            renderer.set_block(state[i_0:i_1, j_0:j_1], 
+                               (i_0 + camera.margin, j_0 + camera.margin))
+        renderer.draw(surf, camera)
 
 
 # Class for grid patterns
 class GridAsset():
+    modes = ['union', 'xor', 'replace']
+
     def __init__(self, sim):
-        self.alive_cells = []
         self.sim = sim
+        self.pattern = np.zeros((0, 2), dtype=np.int64)
+        # Orientation, as the amount of clockwise rotations done
+        # after an optional flip. Each orientation of the pattern
+        # is computed once and cached
+        self.rotation = 0
+        self.flipped = False
+        self.orientations = dict()
+        self.mode = 'union'
+
+    @property
+    def alive_cells(self):
+        key = (self.rotation, self.flipped)
+        if key not in self.orientations:
+            cells = self.pattern.copy()
+            if self.flipped:
+                cells[:, 0] = -cells[:, 0]
+            for _ in range(self.rotation):
+                cells = np.stack([-cells[:, 1], cells[:, 0]], axis=1)
+            self.orientations[key] = cells
+        return self.orientations[key]
     
     def set_alive_cells(self, pattern):
-        self.alive_cells = pattern.copy()
+        self.pattern = np.array(pattern, dtype=np.int64).reshape(-1, 2)
+        self.rotation, self.flipped = 0, False
+        self.orientations = dict()
 
     def rotate(self):
         # Do a pi/2 clock rotation
-        new_alive_cells = []
-        for pos in self.alive_cells.copy():
-            new_alive_cells.append([-pos[1], pos[0]])
-        self.set_alive_cells(new_alive_cells)
+        self.rotation = (self.rotation + 1) % 4
 
     def flip(self):
-        # Do a flip over the y axis
-        new_alive_cells = []
-        for pos in self.alive_cells.copy():
-            new_alive_cells.append([-pos[0], pos[1]])
-        self.set_alive_cells(new_alive_cells)
-
-    def print_to_grid(self, mpos, grid):
-        # Get reference cell position from mouse pos
-        ref_pos = [(mpos[0] - self.sim.display_offset[0]) * self.sim.width / self.sim.display_size[0], 
-               (mpos[1] - self.sim.display_offset[1]) *  self.sim.height / self.sim.display_size[1]]
-        ref_x = (int(ref_pos[0]) * int(self.sim.grid_size * 1.1) / self.sim.width) - int(self.sim.grid_size*0.09)
-        ref_y = (int(ref_pos[1]) * int(self.sim.grid_size * 1.1) / self.sim.height) - int(self.sim.grid_size*0.09)
-        # Print pattern to the grid
-        for pos in self.alive_cells:
-            idx = str(int(pos[0] + ref_x)) + ';' + str(int(pos[1] + ref_y))
-            if idx in grid.cells:
-                grid.cells[idx]['state'] = 1
-                if not grid.cells[idx]['pos'] in grid.alive_cells:
-                    grid.alive_cells.append(grid.cells[idx]['pos'])
+        # Do a flip over the y axis. Flipping after a rotation
+        # is the same as flipping first and rotating backwards
+        self.rotation = -self.rotation % 4
+        self.flipped = not self.flipped
+
+    def cycle_mode(self):
+        self.mode = self.modes[(self.modes.index(self.mode) + 1) % len(self.modes)]
+
+    def print_to_grid(self, ref, grid):
+        # Print pattern to the grid, with its origin at the 
+        # ref cell of the grid
+        grid.stamp(self.alive_cells, ref, self.mode)
 
     def render(self, surf, mpos):
         # Get reference from mouse pos
-        ref_pos = [(mpos[0] - self.sim.display_offset[0]) * self.sim.width / self.sim.display_size[0], 
-                (mpos[1] - self.sim.display_offset[1]) *  self.sim.height / self.sim.display_size[1]]
-        ref_x = (int(ref_pos[0]) * int(self.sim.grid_size * 1.1) / self.sim.width) - int(self.sim.grid_size * 0.09)
-        ref_y = (int(ref_pos[1]) * int(self.sim.grid_size * 1.1) / self.sim.height) - int(self.sim.grid_size*0.09)
-        toggle_pos = [int(ref_x) * self.sim.width // int(self.sim.grid_size * 1.1), 
-                      int(ref_y) * self.sim.height // int(self.sim.grid_size * 1.1)]
+        ref = self.sim.camera.display_cell(mpos)
         
         # Render grey squares at the position of each 
-        # cell in the pattern
-        for cell in self.alive_cells:
-            pos = [(int(self.sim.grid_size*0.09) + cell[0]) * self.sim.width // int(self.sim.grid_size * 1.1), 
-                   (int(self.sim.grid_size*0.09) + cell[1]) * self.sim.height // int(self.sim.grid_size * 1.1)]
-            cell_surf = pygame.Surface((self.sim.width // int(self.sim.grid_size * 1.1), 
-                                        self.sim.height // int(self.sim.grid_size * 1.1)))
-            cell_surf.fill((200,200,200))
-            surf.blit(cell_surf, (toggle_pos[0] + pos[0], toggle_pos[1] + pos[1]))
\ No newline at end of file
+        # cell in the pattern, all in a single blit
+        from render import get_renderer
+        renderer = get_renderer(self.sim, (200,200,200))
+        renderer.clear()
+        renderer.set_cells(self.alive_cells + ref)
+        renderer.draw(surf, self.sim.camera)
\ No newline at end of file
@@ -0,0 +1,409 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+from collections import OrderedDict
+import numpy as np
+
+# Import scripts
+from engine import MOORE_OFFSETS
+from rules import Rule, LIFE
+
+
+# Rough memory cost of each cached node and result, in bytes
+NODE_BYTES = 200
+RESULT_BYTES = 150
+
+
+def base_table(rule=LIFE):
+    '''
+    Params:
+        rule : Rule (optional)
+            Rule used to step the blocks.
+    Output:
+        Returns an array with the result of every possible 4x4
+        block, indexed by the block code (bit x + 4 * y holds
+        cell (x, y)). Each entry holds the central 2x2 block
+        after one generation, encoded the same way with the 
+        bits 0, 1, 2 and 3 for cells (1, 1), (2, 1), (1, 2)
+        and (2, 2).
+    '''
+    codes = np.arange(1 << 16)
+    shifts = np.arange(4)[:, None] + 4 * np.arange(4)[None, :]
+    cells = ((codes[:, None, None] >> shifts) & 1).astype(np.uint8)
+    # Neighbor count of the central cells only
+    center = cells[:, 1:3, 1:3]
+    counts = np.zeros(center.shape, dtype=np.uint8)
+    for di, dj in MOORE_OFFSETS:
+        counts += cells[:, 1 + di:3 + di, 1 + dj:3 + dj]
+    new = rule.apply(center, counts).astype(np.int64)
+    return new[:, 0, 0] | new[:, 1, 0] << 1 | new[:, 0, 1] << 2 | new[:, 1, 1] << 3
+
+
+# Quadtree node
+class Node():
+    '''
+    Square block of 2^k x 2^k cells. Level 0 nodes are single
+    cells, and any other node is made of four level k-1 children:
+    a (low x, low y), b (high x, low y), c (low x, high y) and
+    d (high x, high y). Nodes are hash-consed by HashLifeEngine,
+    so equal blocks are always the same object.
+    '''
+    __slots__ = ('k', 'a', 'b', 'c', 'd', 'n')
+
+    def __init__(self, k, a, b, c, d, n):
+        self.k = k
+        self.a, self.b, self.c, self.d = a, b, c, d
+        # Population of the block
+        self.n = n
+
+
+# Define HashLife engine class
+class HashLifeEngine():
+    def __init__(self, max_memory=256, rule=LIFE):
+        '''
+        Params:
+            max_memory : float (optional)
+                Approximate memory cap for the node table and the
+                result cache, in MB. Least recently used results
+                are evicted first, and the node table is flushed
+                when it alone goes over the cap.
+            rule : Rule (optional)
+                Life-like rule, without birth on 0 neighbors.
+        Output:
+            Initializes an instance of the HashLifeEngine class,
+            which treats the board as a window onto an unbounded
+            plane. Jumps are therefore exact for closed boards as
+            long as nothing reaches the edges.
+        '''
+        self.max_memory = max_memory
+        self.off = Node(0, None, None, None, None, 0)
+        self.on = Node(0, None, None, None, None, 1)
+        self.nodes = dict()
+        self.results = OrderedDict()
+        self._empty = [self.off]
+        self.rule = rule
+
+    @property
+    def rule(self):
+        return self._rule
+
+    @rule.setter
+    def rule(self, rule):
+        if not self.supports(rule):
+            raise ValueError('HashLife only supports Life-like rules without birth '
+                             'on 0 neighbors: {}'.format(rule))
+        self._rule = rule
+        self.table = base_table(rule).tolist()
+        # Cached results belong to the previous rule
+        self.results.clear()
+
+    @staticmethod
+    def supports(rule):
+        # Blocks are stepped with the Moore neighborhood, and empty
+        # space must stay empty for empty nodes to be shared
+        return isinstance(rule, Rule) and not rule.b0
+
+    # Node construction
+    def join(self, a, b, c, d):
+        # Canonical node with the given children
+        key = (a, b, c, d)
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node(a.k + 1, a, b, c, d, a.n + b.n + c.n + d.n)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, k):
+        # Canonical empty node of level k
+        while len(self._empty) <= k:
+            e = self._empty[-1]
+            self._empty.append(self.join(e, e, e, e))
+        return self._empty[k]
+
+    def centre(self, m):
+        # Node one level up with m in its center
+        z = self.empty(m.k - 1)
+        return self.join(self.join(z, z, z, m.a), self.join(z, z, m.b, z),
+                         self.join(z, m.c, z, z), self.join(m.d, z, z, z))
+
+    def is_padded(self, m):
+        # True if all alive cells are in the central half of m
+        return (m.a.n == m.a.d.n and m.b.n == m.b.c.n and
+                m.c.n == m.c.b.n and m.d.n == m.d.a.n)
+
+    # Evolution
+    def _base(self, m):
+        # Center 2x2 block of a 4x4 node after one generation
+        code = 0
+        for quad, x, y in ((m.a, 0, 0), (m.b, 2, 0), (m.c, 0, 2), (m.d, 2, 2)):
+            code |= (quad.a.n << (x + 4 * y) | quad.b.n << (x + 1 + 4 * y) |
+                     quad.c.n << (x + 4 * y + 4) | quad.d.n << (x + 1 + 4 * y + 4))
+        new = self.table[code]
+        cell = lambda bit: self.on if (new >> bit) & 1 else self.off
+        return self.join(cell(0), cell(1), cell(2), cell(3))
+
+    def successor(self, m, j):
+        '''
+        Params:
+            m : Node
+                Node of level k >= 2.
+            j : int
+                The center of m is advanced 2^j generations,
+                with j <= k - 2.
+        Output:
+            Returns the central level k-1 node of m after
+            2^j generations.
+        '''
+        if m.n == 0:
+            return m.a
+        key = (m, j)
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+            return result
+
+        if m.k == 2:
+            result = self._base(m)
+        else:
+            a, b, c, d = m.a, m.b, m.c, m.d
+            # Nine overlapping sub-nodes, advanced to half size
+            half = j < m.k - 2
+            sj = j if half else j - 1
+            c1 = self.successor(a, sj)
+            c2 = self.successor(self.join(a.b, b.a, a.d, b.c), sj)
+            c3 = self.successor(b, sj)
+            c4 = self.successor(self.join(a.c, a.d, c.a, c.b), sj)
+            c5 = self.successor(self.join(a.d, b.c, c.b, d.a), sj)
+            c6 = self.successor(self.join(b.c, b.d, d.a, d.b), sj)
+            c7 = self.successor(c, sj)
+            c8 = self.successor(self.join(c.b, d.a, c.d, d.c), sj)
+            c9 = self.successor(d, sj)
+            if half:
+                # Already advanced 2^j, just take the centers
+                result = self.join(self.join(c1.d, c2.c, c4.b, c5.a),
+                                   self.join(c2.d, c3.c, c5.b, c6.a),
+                                   self.join(c4.d, c5.c, c7.b, c8.a),
+                                   self.join(c5.d, c6.c, c8.b, c9.a))
+            else:
+                # Advance another 2^(j-1) generations
+                result = self.join(self.successor(self.join(c1, c2, c4, c5), sj),
+                                   self.successor(self.join(c2, c3, c5, c6), sj),
+                                   self.successor(self.join(c4, c5, c7, c8), sj),
+                                   self.successor(self.join(c5, c6, c8, c9), sj))
+
+        self.results[key] = result
+        if len(self.results) % 65536 == 0:
+            self.collect()
+        return result
+
+    def jump(self, root, j):
+        '''
+        Params:
+            root : Node
+                Root node, centered at the origin.
+            j : int
+                The root is advanced 2^j generations.
+        Output:
+            Returns a new root, centered at the origin, with the
+            state of the unbounded plane after 2^j generations.
+        '''
+        while root.k < j + 2 or not self.is_padded(root):
+            root = self.centre(root)
+        root = self.successor(self.centre(root), j)
+        self.collect()
+        return root
+
+    def advance_node(self, root, generations):
+        # Advance the root any amount of generations, one
+        # power of two jump for each bit of the amount
+        j = 0
+        while generations:
+            if generations & 1:
+                root = self.jump(root, j)
+            generations >>= 1
+            j += 1
+        return root
+
+    def collect(self):
+        # Keep the caches under the memory cap
+        limit = self.max_memory * 1e6
+        if len(self.nodes) * NODE_BYTES > limit:
+            self.nodes.clear()
+            self.results.clear()
+            self._empty = [self.off]
+        while self.results and len(self.nodes) * NODE_BYTES + len(self.results) * RESULT_BYTES > limit:
+            self.results.popitem(last=False)
+
+    # Conversion from and to arrays
+    def _leaf4(self, code):
+        # Level 2 node from a 16 bit code, with the bit
+        # x + 4 * y holding the state of cell (x, y)
+        cell = lambda x, y: self.on if (code >> (x + 4 * y)) & 1 else self.off
+        quad = lambda x, y: self.join(cell(x, y), cell(x + 1, y), 
+                                      cell(x, y + 1), cell(x + 1, y + 1))
+        return self.join(quad(0, 0), quad(2, 0), quad(0, 2), quad(2, 2))
+
+    def from_array(self, state):
+        '''
+        Params:
+            state : np.ndarray
+                2-D uint8 array with the grid state.
+        Output:
+            Returns a root node centered at the origin, with cell
+            (i, j) of the array at position (i - s / 2, j - s / 2),
+            where s is the side of the root.
+        '''
+        size = max(4, 1 << int(np.ceil(np.log2(max(state.shape)))))
+        cells = np.zeros((size, size), dtype=np.int64)
+        cells[:state.shape[0], :state.shape[1]] = state
+
+        # Encode each 4x4 block as an integer and build one node
+        # for each distinct block
+        weights = 1 << (np.arange(4)[:, None] + 4 * np.arange(4)[None, :])
+        codes = np.einsum('axby,xy->ab', cells.reshape(size // 4, 4, size // 4, 4), weights)
+        codes, ids = np.unique(codes, return_inverse=True)
+        nodes = [self._leaf4(code) for code in codes.tolist()]
+        ids = ids.reshape(size // 4, size // 4)
+
+        # Join the blocks level by level, once per distinct quadruple
+        while ids.shape[0] > 1:
+            quads = np.stack([ids[0::2, 0::2], ids[1::2, 0::2], 
+                              ids[0::2, 1::2], ids[1::2, 1::2]], axis=-1)
+            shape = quads.shape[:2]
+            quads, ids = np.unique(quads.reshape(-1, 4), axis=0, return_inverse=True)
+            nodes = [self.join(nodes[a], nodes[b], nodes[c], nodes[d]) 
+                     for a, b, c, d in quads.tolist()]
+            ids = ids.reshape(shape)
+        return nodes[ids[0, 0]]
+
+    def to_array(self, root, shape=None, origin=None):
+        '''
+        Params:
+            root : Node
+                Node to convert.
+            shape : tuple (optional)
+                Shape of the output window. Defaults to the
+                whole node.
+            origin : tuple (optional)
+                Position of the first cell of the window, in
+                node coordinates. Defaults to (0, 0).
+        Output:
+            Returns a 2-D uint8 array with the cells of the node
+            inside the window.
+        '''
+        size = 1 << root.k
+        shape = (size, size) if shape is None else shape
+        origin = (0, 0) if origin is None else origin
+        out = np.zeros(shape, dtype=np.uint8)
+
+        def fill(node, x, y):
+            side = 1 << node.k
+            # Skip empty nodes and nodes outside of the window
+            if (node.n == 0 or x + side <= origin[0] or y + side <= origin[1]
+                or x >= origin[0] + shape[0] or y >= origin[1] + shape[1]):
+                return
+            if node.k == 0:
+                out[x - origin[0], y - origin[1]] = 1
+                return
+            half = side // 2
+            fill(node.a, x, y)
+            fill(node.b, x + half, y)
+            fill(node.c, x, y + half)
+            fill(node.d, x + half, y + half)
+
+        fill(root, 0, 0)
+        return out
+
+    def from_cells(self, alive_cells):
+        '''
+        Params:
+            alive_cells : np.ndarray
+                Array with shape (n, 2) with the position of each 
+                alive cell, at any coordinates.
+        Output:
+            Returns a root node centered at the origin and the
+            position of the root corner, in the coordinates of 
+            alive_cells. Only the occupied blocks are visited, so
+            the cost does not depend on the bounding box area.
+        '''
+        low = alive_cells.min(axis=0)
+        cells = alive_cells - low
+        extent = int(cells.max()) + 1
+        k_root = max(2, int(np.ceil(np.log2(extent))))
+
+        # Encode the occupied 4x4 blocks
+        blocks, bits = np.divmod(cells, 4)
+        blocks, ids = np.unique(blocks, axis=0, return_inverse=True)
+        codes = np.zeros(len(blocks), dtype=np.int64)
+        np.bitwise_or.at(codes, ids.ravel(), 1 << (bits[:, 0] + 4 * bits[:, 1]))
+        nodes = {tuple(key): self._leaf4(code) 
+                 for key, code in zip(blocks.tolist(), codes.tolist())}
+
+        # Join the blocks level by level, filling in empty nodes
+        for k in range(3, k_root + 1):
+            children = dict()
+            for (x, y), node in nodes.items():
+                children.setdefault((x // 2, y // 2), dict())[(x % 2, y % 2)] = node
+            z = self.empty(k - 1)
+            nodes = {key: self.join(quads.get((0, 0), z), quads.get((1, 0), z), 
+                                    quads.get((0, 1), z), quads.get((1, 1), z))
+                     for key, quads in children.items()}
+        return nodes[(0, 0)], low
+
+    def to_cells(self, root, corner=(0, 0)):
+        # Array with the position of each alive cell of the root,
+        # with the root corner placed at the given position
+        alive_cells = []
+
+        def collect(node, x, y):
+            if node.n == 0:
+                return
+            if node.k == 0:
+                alive_cells.append((x, y))
+                return
+            half = 1 << (node.k - 1)
+            collect(node.a, x, y)
+            collect(node.b, x + half, y)
+            collect(node.c, x, y + half)
+            collect(node.d, x + half, y + half)
+
+        collect(root, corner[0], corner[1])
+        return np.array(alive_cells, dtype=np.int64).reshape(-1, 2)
+
+    def advance_cells(self, alive_cells, generations):
+        # Advance a set of alive cells on the unbounded plane
+        if len(alive_cells) == 0:
+            return alive_cells
+        root, corner = self.from_cells(alive_cells)
+        # Keep track of the position of the root center
+        center = np.asarray(corner) + (1 << root.k) // 2
+        root = self.advance_node(root, generations)
+        return self.to_cells(root, center - (1 << root.k) // 2)
+
+    # Grid engine interface
+    def advance(self, state, pbc, generations):
+        if pbc:
+            raise ValueError('HashLife does not support periodic boundaries')
+        root = self.from_array(state)
+        # Remember where the board was, relative to the center
+        offset = (1 << root.k) // 2
+        root = self.advance_node(root, generations)
+        origin = ((1 << root.k) // 2 - offset,) * 2
+        return self.to_array(root, state.shape, origin)
+
+    def step(self, state, pbc):
+        return self.advance(state, pbc, 1)
@@ -0,0 +1,311 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Headless batch runner, which never opens a window. Example:
+#
+#     python -m headless --size 1000 --seed 1 --generations 500 \
+#                        --snapshot-every 100 --output runs/soup
+
+# Import modules
+import argparse
+import os
+import time
+import numpy as np
+
+# Import scripts
+from grid import Grid
+from engine import NumpyEngine, random_soup
+from bitlife import SwarEngine, PackedBoard, PackedGrid, WORD_BITS
+from hashlife import HashLifeEngine
+from parallel import ParallelEngine
+from patterns import read_pattern
+from cycle import CycleDetector
+from boardfile import BoardFile, CheckpointWriter
+from rules import Rule, parse_rule, RULES, LTL_RULES, LIFE
+
+
+ENGINES = {'numpy': NumpyEngine, 
+           'swar': SwarEngine, 
+           'hashlife': HashLifeEngine, 
+           'parallel': ParallelEngine}
+
+
+def build_grid(size, seed=None, density=0.5, pattern=None, 
+               engine='numpy', pbc=False, rule=LIFE):
+    '''
+    Params:
+        size : int
+            Number of cells along each dimension of the grid.
+        seed : int (optional)
+            Seed for the random initial state.
+        density : float (optional)
+            Fraction of alive cells in the random initial state.
+            Ignored if a pattern is given.
+        pattern : str (optional)
+            Path to an RLE (.rle) or plaintext (.cells) pattern 
+            file, which is placed at the center of an empty grid.
+        engine : str (optional)
+            Name of the engine backend, one of ENGINES.
+        pbc : bool (optional)
+            Whether to use periodic boundary conditions.
+        rule : Rule or LtLRule (optional)
+            Rule used to step the grid. Larger than Life rules
+            always use LtLEngine.
+    Output:
+        Returns a Grid that is not attached to any Simulation.
+    '''
+    grid = Grid(None, size, engine=ENGINES[engine]())
+    grid.rule = rule
+    grid.pbc = pbc
+    if pattern is None:
+        grid.set_cells(random_soup(size, seed, density))
+        return grid
+
+    state = np.zeros((size, size), dtype=np.uint8)
+    alive_cells = centered_pattern(pattern, size)
+    state[alive_cells[:, 0], alive_cells[:, 1]] = 1
+    grid.set_cells(state)
+    return grid
+
+
+def centered_pattern(pattern, size):
+    # Cells of a pattern file centered on a grid of the given
+    # size, dropping the cells that do not fit
+    alive_cells = read_pattern(pattern)[1]
+    if len(alive_cells) == 0:
+        return alive_cells.reshape(0, 2)
+    alive_cells = alive_cells - alive_cells.min(axis=0)
+    alive_cells += (size - (alive_cells.max(axis=0) + 1)) // 2
+    inside = np.all((alive_cells >= 0) & (alive_cells < size), axis=1)
+    return alive_cells[inside]
+
+
+def build_packed_grid(size, seed=None, density=0.5, pattern=None, pbc=False, rule=LIFE):
+    '''
+    Params:
+        As in build_grid, without the engine.
+    Output:
+        Returns a PackedGrid with the same initial state as
+        build_grid, built without ever holding a byte per cell.
+        It is stepped with the SWAR kernel.
+    '''
+    if not isinstance(rule, Rule):
+        raise ValueError('Packed grids only support Life-like rules: {}'.format(rule))
+    if pattern is None:
+        return PackedGrid(PackedBoard.soup(size, seed, density, pbc, rule))
+    board = PackedBoard(np.zeros((size, -(-size // WORD_BITS)), dtype=np.uint64), size, pbc, rule)
+    i, j = centered_pattern(pattern, size).T
+    np.bitwise_or.at(board.words, (i, j // WORD_BITS),
+                     np.left_shift(np.uint64(1), (j % WORD_BITS).astype(np.uint64)))
+    return PackedGrid(board)
+
+
+def load_grid(path, engine='numpy', rule=None):
+    # Grid with the state of a board file, and its generation.
+    # The rule of the board is used unless another one is given
+    board = BoardFile(path)
+    grid = Grid(None, max(board.shape), engine=ENGINES[engine]())
+    grid.load(board)
+    if rule is not None:
+        grid.rule = rule
+    return grid, board.generation
+
+
+def load_packed_grid(path, rule=None):
+    # PackedGrid with the state of a board file, as load_grid
+    board = BoardFile(path)
+    rule = parse_rule(board.rule) if rule is None else rule
+    if not isinstance(rule, Rule):
+        raise ValueError('Packed grids only support Life-like rules: {}'.format(rule))
+    return PackedGrid(PackedBoard.from_board(board, rule)), board.generation
+
+
+def save_state(grid, output, generation):
+    path = os.path.join(output, 'gen_{:09d}.npy'.format(generation))
+    np.save(path, grid.get_cells())
+    return path
+
+
+def run(grid, generations, snapshot_every=0, output=None, report=print, 
+        on_cycle=None, snapshot_format='npy', first_generation=0):
+    '''
+    Params:
+        grid : Grid or PackedGrid
+            Grid to advance.
+        generations : int
+            Amount of generations to advance.
+        snapshot_every : int (optional)
+            If positive, a snapshot of the grid is saved every
+            snapshot_every generations.
+        output : str (optional)
+            Directory for the snapshots and the final state. 
+            Nothing is written if it is None.
+        report : callable (optional)
+            Called with a progress line after each chunk.
+        on_cycle : str (optional)
+            If 'stop' or 'skip', the grid is hashed after every
+            generation to detect when it becomes periodic. Then
+            the run either stops, or skips to the last generation
+            stepping less than one period.
+        snapshot_format : str (optional)
+            'npy' saves NumPy arrays, 'board' saves bit-packed
+            board files, see boardfile.py.
+        first_generation : int (optional)
+            Generation of the initial state, for resumed runs. 
+            Only used to name the snapshots.
+    Output:
+        Returns a dict with the run statistics. If a cycle was
+        found it includes its period and the generation where
+        it started.
+    '''
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+    checkpoints = None
+    if output is not None and snapshot_format == 'board':
+        checkpoints = CheckpointWriter(output)
+    chunk = snapshot_every if snapshot_every > 0 else generations
+
+    detector = None
+    if on_cycle is not None:
+        detector = CycleDetector()
+        detector.record(0, grid)
+
+    generation = 0
+    start = time.perf_counter()
+    while generation < generations:
+        steps = min(chunk, generations - generation)
+        if detector is None:
+            grid.advance(steps)
+            generation += steps
+        else:
+            for _ in range(steps):
+                grid.update()
+                generation += 1
+                if detector.record(generation, grid):
+                    break
+        if detector is not None and detector.period is not None:
+            report('cycle of period {} from generation {}'.format(
+                   detector.period, first_generation + detector.entry))
+            if on_cycle == 'skip':
+                grid.advance((generations - generation) % detector.period)
+                generation = generations
+            break
+        elapsed = time.perf_counter() - start
+        if output is not None and snapshot_every > 0:
+            if checkpoints is not None:
+                checkpoints.save(grid.state, first_generation + generation, grid.pbc, 
+                                 str(grid.rule))
+            else:
+                save_state(grid, output, first_generation + generation)
+        report('generation {} | population {} | {:.1f} gen/s'.format(
+               first_generation + generation, grid.population, 
+               generation / max(elapsed, 1e-9)))
+    elapsed = time.perf_counter() - start
+
+    if checkpoints is not None:
+        grid.save(os.path.join(output, 'final.board'), first_generation + generation)
+    elif output is not None:
+        np.save(os.path.join(output, 'final.npy'), grid.get_cells())
+    stats = {'generations': generation, 
+             'seconds': elapsed, 
+             'gens_per_second': generation / max(elapsed, 1e-9), 
+             'population': grid.population}
+    if detector is not None and detector.period is not None:
+        stats['period'] = detector.period
+        stats['cycle_start'] = first_generation + detector.entry
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the cellular automata without a window.')
+    parser.add_argument('--size', type=int, default=100, 
+                        help='number of cells along each dimension')
+    parser.add_argument('--seed', type=int, default=None, 
+                        help='seed for the random initial state')
+    parser.add_argument('--density', type=float, default=0.5, 
+                        help='fraction of alive cells in the random initial state')
+    parser.add_argument('--pattern', default=None, 
+                        help='RLE (.rle) or plaintext (.cells) file to start from instead of a random state')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='numpy', 
+                        help='engine backend. hashlife treats the board as a window onto '
+                             'the unbounded plane, so patterns are not stopped by the '
+                             'closed edges, and it does not support --pbc')
+    parser.add_argument('--packed', action='store_true', 
+                        help='keep the board at one bit per cell between generations, '
+                             'with the swar engine and a Life-like rule. Cells are only '
+                             'unpacked for snapshots, and --on-cycle is not supported')
+    parser.add_argument('--pbc', action='store_true', 
+                        help='use periodic boundary conditions')
+    parser.add_argument('--rule', default=None, 
+                        help='rule in B/S notation, such as B36/S23, a Larger than Life '
+                             'rule such as R5,C0,M1,S34..58,B34..45,NM, or one of: {}. '
+                             'Defaults to Life, or to the rule of the loaded board'.format(
+                             ', '.join(list(RULES) + list(LTL_RULES))))
+    parser.add_argument('--generations', type=int, default=1000)
+    parser.add_argument('--snapshot-every', type=int, default=0, 
+                        help='save the state every this many generations')
+    parser.add_argument('--output', default=None, 
+                        help='directory for the snapshots and the final state')
+    parser.add_argument('--snapshot-format', choices=['npy', 'board'], default='npy', 
+                        help='save snapshots as NumPy arrays or as bit-packed board files')
+    parser.add_argument('--load', default=None, 
+                        help='board file to resume from, instead of a new grid')
+    parser.add_argument('--on-cycle', choices=['stop', 'skip'], default=None, 
+                        help='stop, or skip to the end, once the grid becomes periodic')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    first_generation = 0
+    try:
+        rule = None if args.rule is None else parse_rule(args.rule)
+        if args.packed and (args.engine != 'swar' or args.on_cycle is not None):
+            raise ValueError('--packed needs --engine swar, and does not support --on-cycle')
+        if args.packed and args.load is not None:
+            grid, first_generation = load_packed_grid(args.load, rule=rule)
+        elif args.packed:
+            grid = build_packed_grid(args.size, seed=args.seed, density=args.density, 
+                                     pattern=args.pattern, pbc=args.pbc, 
+                                     rule=LIFE if rule is None else rule)
+        elif args.load is not None:
+            grid, first_generation = load_grid(args.load, engine=args.engine, rule=rule)
+        else:
+            grid = build_grid(args.size, seed=args.seed, density=args.density, 
+                              pattern=args.pattern, engine=args.engine, pbc=args.pbc, 
+                              rule=LIFE if rule is None else rule)
+        # Boards loaded from a file keep their own boundaries
+        if args.engine == 'hashlife' and grid.pbc:
+            raise ValueError('The hashlife engine does not support periodic boundaries, '
+                             'use another engine or closed boundaries')
+    except ValueError as error:
+        raise SystemExit(error)
+    try:
+        stats = run(grid, args.generations, snapshot_every=args.snapshot_every, 
+                    output=args.output, on_cycle=args.on_cycle, 
+                    snapshot_format=args.snapshot_format, first_generation=first_generation)
+    finally:
+        # Stop the worker processes of the parallel engine
+        if hasattr(getattr(grid, 'engine', None), 'close'):
+            grid.engine.close()
+    print('{generations} generations in {seconds:.3f} s ({gens_per_second:.1f} gen/s), '
+          'final population {population}'.format(**stats))
+    if 'period' in stats:
+        print('periodic with period {period} from generation {cycle_start}'.format(**stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+def snapshot_bytes(snapshot):
+    # Memory used by a grid snapshot, either an array or a
+    # dict of tiles
+    if isinstance(snapshot, dict):
+        return sum(tile.nbytes for tile in snapshot.values())
+    return snapshot.nbytes
+
+
+# Define history class
+class History():
+    def __init__(self, keyframe_every=64, max_bytes=32 * 2**20):
+        '''
+        Params:
+            keyframe_every : int (optional)
+                Maximum amount of generations between two
+                keyframes.
+            max_bytes : int (optional)
+                Memory budget. When it is exceeded the oldest
+                generations are dropped, a keyframe at a time.
+        Output:
+            Initializes an empty history. Each retained generation
+            is stored either as a keyframe, a snapshot of the
+            whole grid, or as a delta with the flat indexes of
+            the cells that flipped since the previous generation.
+            Births and deaths are both flips, so the same delta
+            steps the grid forwards and backwards.
+        '''
+        self.keyframe_every = keyframe_every
+        self.max_bytes = max_bytes
+        # Generation -> ('key', snapshot) or ('delta', indexes)
+        self.entries = dict()
+        self.oldest = None
+        self.newest = None
+        self.nbytes = 0
+        # Generation of the grid state, while it matches the
+        # history
+        self.current = None
+        self._since_keyframe = 0
+
+    def __contains__(self, generation):
+        return generation in self.entries
+
+    def clear(self):
+        self.entries = dict()
+        self.oldest = self.newest = self.current = None
+        self.nbytes = 0
+
+    def _store(self, generation, kind, data):
+        # Retained generations are kept contiguous, anything
+        # before a gap is dropped
+        if self.newest is not None and generation != self.newest + 1:
+            self.clear()
+        self.entries[generation] = (kind, data)
+        self.nbytes += snapshot_bytes(data)
+        self._since_keyframe = 0 if kind == 'key' else self._since_keyframe + 1
+        if self.oldest is None:
+            self.oldest = generation
+        self.newest = self.current = generation
+        self._evict()
+
+    def _evict(self):
+        # Drop the oldest keyframe and its deltas, as long as
+        # another keyframe is left
+        while self.nbytes > self.max_bytes:
+            generation = self.oldest + 1
+            while generation <= self.newest and self.entries[generation][0] != 'key':
+                generation += 1
+            if generation > self.newest:
+                return
+            for old in range(self.oldest, generation):
+                self.nbytes -= snapshot_bytes(self.entries.pop(old)[1])
+            self.oldest = generation
+            if self.current is not None and self.current < generation:
+                self.current = None
+
+    def truncate(self, generation):
+        # Drop the generations after the given one
+        if self.newest is None or generation >= self.newest:
+            return
+        if generation < self.oldest:
+            self.clear()
+            return
+        for old in range(generation + 1, self.newest + 1):
+            self.nbytes -= snapshot_bytes(self.entries.pop(old)[1])
+        self.newest = generation
+        self._since_keyframe = generation - self._keyframe_before(generation)
+        if self.current is not None and self.current > generation:
+            self.current = None
+
+    def record(self, generation, grid):
+        '''
+        Params:
+            generation : int
+                Generation of the grid state.
+            grid : Grid or SparseGrid
+                Grid that was just stepped to this generation.
+        Output:
+            Stores the generation as a delta if the grid knows
+            which cells changed since the previous generation,
+            or else as a keyframe. Generations after it are
+            dropped first.
+        '''
+        self.truncate(generation - 1)
+        changes = grid.last_changes
+        if (changes is None or self.newest != generation - 1 or self.current != self.newest
+                or self._since_keyframe >= self.keyframe_every):
+            self._store(generation, 'key', grid.snapshot())
+        else:
+            self._store(generation, 'delta', changes.copy())
+
+    def edit(self, generation, grid):
+        # The grid state at this generation was changed by hand,
+        # replace it with a keyframe and drop the later ones
+        self.truncate(generation - 1)
+        self._store(generation, 'key', grid.snapshot())
+
+    def _keyframe_before(self, generation):
+        while self.entries[generation][0] != 'key':
+            generation -= 1
+        return generation
+
+    def seek(self, generation, grid):
+        '''
+        Params:
+            generation : int
+                Retained generation to go to.
+            grid : Grid or SparseGrid
+                Grid to write the state to.
+        Output:
+            Sets the grid to the state of the given generation.
+            Within the deltas of a keyframe the grid is stepped
+            by flipping the changed cells, which costs as much as
+            the amount of changes. Otherwise the nearest keyframe
+            is restored first. Returns False if the generation
+            is not retained.
+        '''
+        if generation not in self.entries:
+            return False
+        key = self._keyframe_before(generation)
+        current = self.current
+        incremental = (current is not None and current in self.entries
+                       and self._keyframe_before(current) == key
+                       and abs(generation - current) <= generation - key)
+        if not incremental:
+            grid.set_cells(self.entries[key][1])
+            current = key
+        # Deltas of the generations between current and the target
+        if generation > current:
+            for step in range(current + 1, generation + 1):
+                grid.flip_cells(self.entries[step][1])
+        else:
+            for step in range(current, generation, -1):
+                grid.flip_cells(self.entries[step][1])
+        self.current = generation
+        return True
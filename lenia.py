@@ -0,0 +1,394 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import os
+import numpy as np
+
+# render is only imported by the render methods, so that the
+# grids can be used without pygame, as in headless runs
+
+
+# Some Lenia rules: kernel radius, kernel ring heights, growth
+# center and width, and time step
+LENIA_RULES = {'Orbium': (13, (1,), 0.15, 0.015, 0.1),
+               'Hydrogeminium': (18, (0.5, 1, 2 / 3), 0.26, 0.036, 0.1),
+               'Wide': (26, (1,), 0.15, 0.017, 0.1)}
+# Extension of the files saved by LeniaGrid
+LENIA_EXTENSION = '.npz'
+
+
+# Define Lenia rule class
+class LeniaRule():
+    def __init__(self, radius=13, peaks=(1,), mu=0.15, sigma=0.015, dt=0.1):
+        '''
+        Params:
+            radius : int (optional)
+                Radius of the kernel, in cells.
+            peaks : tuple (optional)
+                Height of each concentric ring of the kernel.
+            mu, sigma : float (optional)
+                Center and width of the growth function.
+            dt : float (optional)
+                Time step of each generation.
+        Output:
+            Initializes a Lenia rule. Each generation the cells,
+            with states between 0 and 1, are convolved with a
+            smooth ring shaped kernel, and the result u changes
+            them by dt * (2 * exp(-(u - mu)^2 / (2 sigma^2)) - 1).
+        '''
+        self.radius = int(radius)
+        self.peaks = tuple(float(peak) for peak in peaks)
+        self.mu = float(mu)
+        self.sigma = float(sigma)
+        self.dt = float(dt)
+
+    @classmethod
+    def named(cls, name):
+        return cls(*LENIA_RULES[name])
+
+    def __str__(self):
+        return 'Lenia R{} m{:g} s{:g} T{:g}'.format(self.radius, self.mu, self.sigma,
+                                                    1 / self.dt)
+
+    def __eq__(self, other):
+        return isinstance(other, LeniaRule) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def key(self):
+        return (self.radius, self.peaks, self.mu, self.sigma, self.dt)
+
+    def kernel(self):
+        '''
+        Output:
+            Returns a float32 array with shape (2R + 1, 2R + 1)
+            with the kernel, normalized to add up to 1. Ring k
+            covers the distances from k / n to (k + 1) / n of
+            the radius, n being the amount of rings.
+        '''
+        offsets = np.arange(-self.radius, self.radius + 1)
+        distance = np.hypot(offsets[:, None], offsets[None, :]) / self.radius
+        rings = len(self.peaks) * distance
+        ring = np.minimum(rings.astype(int), len(self.peaks) - 1)
+        # Smooth bump inside each ring, zero at its edges
+        x = rings - ring
+        with np.errstate(divide='ignore', over='ignore'):
+            bump = np.exp(4 - 1 / (x * (1 - x)))
+        bump[(x <= 0) | (x >= 1) | (distance >= 1)] = 0
+        kernel = bump * np.array(self.peaks)[ring]
+        return (kernel / kernel.sum()).astype(np.float32)
+
+    def growth(self, potential):
+        # Growth of each cell, between -1 and 1
+        return 2 * np.exp(-(potential - self.mu) ** 2 / (2 * self.sigma ** 2)) - 1
+
+
+def fast_size(n):
+    # Smallest size of at least n with no prime factors other
+    # than 2, 3 and 5, for which FFTs are fastest
+    while True:
+        m = n
+        for factor in (2, 3, 5):
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+
+# Kernel spectra, by rule and transform shape
+_spectra = dict()
+
+
+def kernel_spectrum(rule, shape):
+    '''
+    Params:
+        rule : LeniaRule
+            Rule whose kernel is transformed.
+        shape : tuple
+            Shape of the transforms.
+    Output:
+        Returns the real FFT of the kernel, centered on cell
+        (0, 0) and wrapped around the edges. Spectra are cached,
+        so each one is only computed once per board size.
+    '''
+    key = (rule.radius, rule.peaks, tuple(shape))
+    if key not in _spectra:
+        kernel = rule.kernel()
+        padded = np.zeros(shape, dtype=np.float32)
+        size = kernel.shape[0]
+        padded[:size, :size] = kernel
+        padded = np.roll(padded, (-rule.radius, -rule.radius), axis=(0, 1))
+        _spectra[key] = np.fft.rfft2(padded)
+    return _spectra[key]
+
+
+# Define Lenia engine class
+class LeniaEngine():
+    def __init__(self, rule=None):
+        '''
+        Params:
+            rule : LeniaRule (optional)
+                Rule of the engine, Orbium by default.
+        Output:
+            Initializes an engine for float32 grids with states
+            between 0 and 1. The convolution with the kernel is
+            done with FFTs, so each generation costs O(N log N)
+            whatever the size of the kernel.
+        '''
+        self.rule = LeniaRule.named('Orbium') if rule is None else rule
+
+    def potential(self, state, pbc):
+        # Convolution of the state with the kernel. FFTs wrap
+        # around, so closed grids are padded with radius dead
+        # cells that no kernel reaches across
+        n_i, n_j = state.shape
+        if pbc:
+            shape = state.shape
+        else:
+            shape = (fast_size(n_i + self.rule.radius), fast_size(n_j + self.rule.radius))
+        spectrum = kernel_spectrum(self.rule, shape)
+        potential = np.fft.irfft2(np.fft.rfft2(state, s=shape) * spectrum, s=shape)
+        return potential[:n_i, :n_j]
+
+    def step(self, state, pbc):
+        growth = self.rule.growth(self.potential(state, pbc))
+        return np.clip(state + self.rule.dt * growth, 0, 1).astype(np.float32)
+
+    def advance(self, state, pbc, generations):
+        for _ in range(generations):
+            state = self.step(state, pbc)
+        return state
+
+
+# Define Lenia file class
+class LeniaFile():
+    def __init__(self, path):
+        '''
+        Params:
+            path : str
+                Path of a file saved by LeniaGrid.save.
+        Output:
+            Reads the file, with the same attributes as the
+            BoardFile class, so grids load both the same way.
+        '''
+        try:
+            with np.load(path) as data:
+                self.state = data['state'].astype(np.float32)
+                self.generation = int(data['generation'])
+                self.pbc = bool(data['pbc'])
+                radius, mu, sigma, dt = data['rule'].tolist()
+                self.rule = LeniaRule(int(radius), data['peaks'].tolist(), mu, sigma, dt)
+        except (KeyError, TypeError) as error:
+            raise ValueError('{} is not a Lenia file: {}'.format(path, error))
+        self.shape = self.state.shape
+        self.origin = (0, 0)
+
+    def to_array(self):
+        return self.state
+
+
+# Define Lenia grid class
+class LeniaGrid():
+    # Cell shown at the top left corner of the grid area
+    view = (0, 0)
+    # Jumps are stepped one FFT generation at a time, so they are
+    # capped and can be stopped between chunks
+    jump_mode = 'step'
+    jump_chunk = 8
+    max_jump_exponent = 4
+
+    def __init__(self, sim, grid_size, rule=None):
+        '''
+        Params:
+            sim : Simulation
+                Instance of the Simulation class on which
+                the grid will be implemented.
+            grid_size : int
+                Number of cells along each dimension.
+            rule : LeniaRule (optional)
+                Rule of the grid, Orbium by default.
+        Output:
+            Initializes a grid of float32 cells stepped with a
+            LeniaEngine. It has the methods of the Grid class,
+            treating the cells with a state of at least 0.5 as
+            alive when a binary state is needed, so the same
+            controls work on it.
+        '''
+        self.sim = sim
+        self.grid_size = grid_size
+        self.pbc = False
+        self.engine = LeniaEngine(rule)
+        self.state = np.zeros((grid_size, grid_size), dtype=np.float32)
+        self.reset_random()
+
+    @property
+    def rule(self):
+        return self.engine.rule
+
+    @rule.setter
+    def rule(self, rule):
+        self.engine.rule = rule
+
+    @property
+    def alive_cells(self):
+        # Positions of the alive cells, as [i, j] lists
+        return np.argwhere(self.state >= 0.5).tolist()
+
+    @property
+    def population(self):
+        return int(np.count_nonzero(self.state >= 0.5))
+
+    @property
+    def mass(self):
+        # Total of the cell states
+        return float(self.state.sum())
+
+    def is_alive(self, i, j):
+        if not (0 <= i < self.grid_size and 0 <= j < self.grid_size):
+            return False
+        return bool(self.state[i, j] >= 0.5)
+
+    def set_cell(self, i, j, value):
+        if 0 <= i < self.grid_size and 0 <= j < self.grid_size:
+            self.state[i, j] = value
+
+    def toggle_cell(self, i, j):
+        self.set_cell(i, j, 0.0 if self.is_alive(i, j) else 1.0)
+
+    def get_cells(self, out=None):
+        # Copy of the state, written into out if it fits
+        if isinstance(out, np.ndarray) and out.shape == self.state.shape \
+                and out.dtype == self.state.dtype:
+            np.copyto(out, self.state)
+            return out
+        return self.state.copy()
+
+    def set_cells(self, state):
+        self.state = np.array(state, dtype=np.float32)
+
+    def snapshot(self):
+        return self.state.copy()
+
+    @property
+    def last_changes(self):
+        # Every cell may change in every generation
+        return None
+
+    def stamp(self, cells, offset=(0, 0), mode='union'):
+        '''
+        Params:
+            cells, offset, mode :
+                As in Grid.stamp. Pattern cells are set to 1,
+                or flipped to 1 minus their state with 'xor'.
+        Output:
+            Writes the pattern to the grid in one go.
+        '''
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2) + offset
+        if len(cells) == 0:
+            return
+        n = self.grid_size
+        if mode == 'replace':
+            low, high = cells.min(axis=0), cells.max(axis=0) + 1
+            i, j = np.arange(low[0], high[0]), np.arange(low[1], high[1])
+            if self.pbc:
+                i, j = i % n, j % n
+            else:
+                i, j = i[(i >= 0) & (i < n)], j[(j >= 0) & (j < n)]
+            self.state[np.ix_(i, j)] = 0
+        if self.pbc:
+            cells %= n
+        else:
+            cells = cells[np.all((cells >= 0) & (cells < n), axis=1)]
+        if mode == 'xor':
+            # Repeated cells flip once
+            flat = np.sort(cells[:, 0] * n + cells[:, 1])
+            flat = flat[np.concatenate(([True], flat[1:] != flat[:-1]))]
+            self.state.reshape(-1)[flat] = 1 - self.state.reshape(-1)[flat]
+        else:
+            self.state[cells[:, 0], cells[:, 1]] = 1
+
+    def save(self, path, generation=0):
+        # Saved under a temporary name first, just like board files
+        rule = self.rule
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, state=self.state, generation=generation, pbc=self.pbc,
+                     rule=np.array([rule.radius, rule.mu, rule.sigma, rule.dt]),
+                     peaks=np.array(rule.peaks))
+        os.replace(path + '.tmp', path)
+
+    def load(self, board):
+        # Load a LeniaFile, or the cells of a BoardFile, placed at
+        # the origin and cut to fit
+        self.pbc = board.pbc
+        state = np.zeros((self.grid_size, self.grid_size), dtype=np.float32)
+        cells = board.to_array()[:self.grid_size, :self.grid_size]
+        state[:cells.shape[0], :cells.shape[1]] = cells
+        if isinstance(board, LeniaFile):
+            self.rule = board.rule
+        self.state = state
+
+    def clear(self):
+        self.state = np.zeros((self.grid_size, self.grid_size), dtype=np.float32)
+
+    def reset_random(self):
+        # Random states in the central half of the grid, which
+        # leaves room for the patterns that grow out of it
+        n = self.grid_size
+        self.clear()
+        self.state[n // 4:n - n // 4, n // 4:n - n // 4] = np.random.random(
+            (n - 2 * (n // 4), n - 2 * (n // 4)))
+
+    def update(self):
+        self.state = self.engine.step(self.state, self.pbc)
+
+    def advance(self, generations):
+        self.state = self.engine.advance(self.state, self.pbc, generations)
+
+    def jump(self, generations, interrupt=None):
+        # There is no faster way ahead than stepping, which is done
+        # jump_chunk generations at a time, stopping early once
+        # interrupt returns True. Returns the generations advanced
+        generations = min(generations, 10 ** self.max_jump_exponent)
+        done = 0
+        while done < generations:
+            if interrupt is not None and interrupt():
+                break
+            steps = min(self.jump_chunk, generations - done)
+            self.advance(steps)
+            done += steps
+        return done
+
+    def render(self, surf, cells=None):
+        # Render each cell with the color of its state, all in a
+        # single blit. Dead cells are transparent
+        state = self.state if cells is None else cells
+        camera = self.sim.camera
+        from render import get_renderer
+        renderer = get_renderer(self.sim, 'colormap')
+        renderer.clear()
+        i_0, j_0 = max(camera.low[0] - camera.margin, 0), max(camera.low[1] - camera.margin, 0)
+        i_1 = min(camera.high[0] - camera.margin, self.grid_size)
+        j_1 = min(camera.high[1] - camera.margin, self.grid_size)
+        if i_1 > i_0 and j_1 > j_0:
+            # Palette index of each state, 0 is only for dead cells
+            block = state[i_0:i_1, j_0:j_1]
+            levels = np.ceil(block * 255).astype(np.uint8)
+            renderer.set_block(levels, (i_0 + camera.margin, j_0 + camera.margin))
+        renderer.draw(surf, camera)
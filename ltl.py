@@ -0,0 +1,142 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def summed_area(values):
+    '''
+    Params:
+        values : np.ndarray
+            2-D array.
+    Output:
+        Returns the int32 summed-area table of values, with an
+        extra leading row and column of zeros, so that entry
+        (x, y) holds the sum of values[:x, :y].
+    '''
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.int32)
+    np.cumsum(values, axis=0, dtype=np.int32, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def box_counts(padded, radius):
+    '''
+    Params:
+        padded : np.ndarray
+            2-D uint8 array with the state of a block of cells
+            surrounded by a halo of radius cells.
+        radius : int
+            Range of the neighborhood.
+    Output:
+        Returns an int32 array with the amount of alive cells in
+        the (2R + 1) x (2R + 1) square around each cell inside the
+        halo, itself included. Each count takes four lookups in
+        the summed-area table, whatever the radius.
+    '''
+    table = summed_area(padded)
+    width = 2 * radius + 1
+    return (table[width:, width:] - table[:-width, width:]
+            - table[width:, :-width] + table[:-width, :-width])
+
+
+def diamond_counts(padded, radius):
+    '''
+    Params:
+        padded : np.ndarray
+            2-D uint8 array with the state of a block of cells
+            surrounded by a halo of radius cells.
+        radius : int
+            Range of the neighborhood.
+    Output:
+        Returns an int32 array with the amount of alive cells
+        within radius steps of each cell inside the halo, itself
+        included. The block is rotated by 45 degrees, with cell
+        (i, j) moved to (i + j, i - j), which turns every diamond
+        into a square, and the squares are counted with a
+        summed-area table.
+    '''
+    a, b = padded.shape
+    n_i, n_j = a - 2 * radius, b - 2 * radius
+    # Rotated block, with a margin of radius cells on each side.
+    # Positions that no cell is moved to stay empty
+    size = a + b - 1 + 2 * radius
+    rotated = np.zeros((size, size), dtype=np.uint8)
+    step = rotated.itemsize
+    # Cell (i, j) goes to row radius + i + j and column
+    # radius + b - 1 + i - j, so i moves along the diagonal and
+    # j along the anti-diagonal
+    start = radius * size + radius + b - 1
+    view = as_strided(rotated.reshape(-1)[start:], shape=(a, b),
+                      strides=((size + 1) * step, (size - 1) * step))
+    view[...] = padded
+
+    # Square of side 2R + 1 around the rotated position of each
+    # inner cell, read from the table along the same diagonals
+    table = summed_area(rotated)
+    width = 2 * radius + 1
+    length = size + 1
+    step = table.itemsize
+    # Top left corner of the square of inner cell (0, 0), which is
+    # padded cell (radius, radius)
+    corner = (2 * radius) * length + b - 1
+
+    def lookup(di, dj):
+        return as_strided(table.reshape(-1)[corner + di * length + dj:], shape=(n_i, n_j),
+                          strides=((length + 1) * step, (length - 1) * step))
+    return lookup(width, width) - lookup(0, width) - lookup(width, 0) + lookup(0, 0)
+
+
+# Define Larger than Life engine class
+class LtLEngine():
+    def __init__(self, rule):
+        '''
+        Params:
+            rule : LtLRule
+                Larger than Life rule.
+        Output:
+            Initializes an engine for rules with a neighborhood
+            of any radius. Neighbor counts come from summed-area
+            tables, so each generation costs the same for any
+            radius.
+        '''
+        self.rule = rule
+
+    def neighbor_count(self, state, pbc):
+        # Pad the grid with a halo of radius cells, either with
+        # dead cells or with the opposite edges of the grid
+        radius = self.rule.radius
+        if pbc:
+            padded = np.pad(state, radius, mode='wrap')
+        else:
+            padded = np.pad(state, radius, mode='constant')
+        if self.rule.neighborhood == 'moore':
+            counts = box_counts(padded, radius)
+        else:
+            counts = diamond_counts(padded, radius)
+        if not self.rule.middle:
+            counts -= state
+        return counts
+
+    def step(self, state, pbc):
+        return self.rule.apply(state, self.neighbor_count(state, pbc))
+
+    def advance(self, state, pbc, generations):
+        for _ in range(generations):
+            state = self.step(state, pbc)
+        return state
@@ -16,16 +16,37 @@ limitations under the License.
 
 # Import modules
 import pygame
+import argparse
+import os
 import sys
+import numpy as np
 
 # Import scripts
 from grid import Grid, GridAsset
-from button import PlayButton, RefocusButton, RandomResetButton, ClearButton, PBCButton, BackButton, MenuButton, UnselectButton, AssetButton
+from sparse import SparseGrid
+from lenia import LeniaGrid, LeniaRule, LENIA_RULES, LENIA_EXTENSION
+from camera import Camera
+from speed import SpeedController
+from profiler import FrameProfiler
+from patterns import PatternLibrary, BUILTIN_PATTERNS
+from worker import SimulationWorker
+from hashlife import HashLifeEngine
+from rules import parse_rule, RULES, LTL_RULES
+from button import PlayButton, RefocusButton, RandomResetButton, ClearButton, PBCButton, BackButton, JumpButton, MenuButton, UnselectButton, AssetButton, Label
 
 
 # Define main simulation class
 class Simulation():
-    def __init__(self):
+    def __init__(self, profile_path=None):
+        '''
+        Params:
+            profile_path : str (optional)
+                File to stream the timings of every frame to, as
+                CSV, or as JSON lines if it ends in .jsonl.
+        Output:
+            Initializes the window, the grid and its worker, and
+            the interface.
+        '''
         self.width = 640
         self.height = 640
         self.margin_color = (107, 103, 105)
@@ -36,11 +57,10 @@ class Simulation():
         self.text_color_2 = (250, 250, 250)
         self.text_color_3 = (178, 176, 178)
 
-        # Initialize screen and display
+        # Initialize screen
         pygame.init()
         pygame.display.set_caption('Cellular Automata')
         self.screen = pygame.display.set_mode((self.width, self.height))
-        self.display = pygame.Surface((self.width, self.height))
 
         # Display manipulation settings
         self.display_size = list(self.screen.get_size())
@@ -51,16 +71,43 @@ class Simulation():
         self.centered = True
 
         self.clock = pygame.time.Clock()
+        # Generations per frame and frame rate
+        self.speed = SpeedController(fps=60)
 
         # Initialize the grid
         self.grid_size = 100
         self.grid = Grid(self, self.grid_size)
         self.iteration = 0
-        # Save initial grid state
-        self.initial_state = self.grid.get_cells()
+        # Period of the grid and the generation it started, once
+        # it becomes periodic
+        self.period = (None, None)
+        # Named rules cycled through with G, and the current rule
+        self.rules = [parse_rule(name) for name in list(RULES) + list(LTL_RULES)
+                      if not parse_rule(name).b0]
+        self.rule = self.grid.rule
+        # Unbounded mode, where the grid is a SparseGrid and 
+        # scrolling moves the view over the cells
+        self.unbounded = False
+        self.view_speed = 2
+        # Continuous mode, where the grid is a LeniaGrid
+        self.continuous = False
+        # Once the worker starts, the grid it steps may be replaced
+        # on its thread, so self.grid and both modes are only set
+        # from the published frames, on this thread
+        self.lenia_rules = [LeniaRule.named(name) for name in LENIA_RULES]
+        # Camera with the screen to cell mappings
+        self.camera = Camera(self)
+        # Worker thread that steps the grid. From now on the grid
+        # is only changed through commands submitted to it
+        self.worker = SimulationWorker(self.grid, self.speed)
+        # Timings of the phases of each frame, shown with P
+        self.profiler = FrameProfiler(profile_path)
+        self.worker.profile = self.profiler.enabled
+        self.population = None
 
         # Initialize font
         self.font = pygame.font.SysFont('Times New Roman', 26)
+        self.small_font = pygame.font.SysFont('Times New Roman', 16)
 
         # Initialize buttons
         self.play_button = PlayButton(self, self.button_color_on, self.button_color_off, 3, 50, 
@@ -75,18 +122,53 @@ class Simulation():
                             color=self.margin_color, on_color=self.margin_color, size=40)
         self.back_button = BackButton(self, self.button_color_on, self.button_color_off, 3, 250, 
                             color=self.margin_color, on_color=self.margin_color, size=40)
+        self.jump_button = JumpButton(self, self.button_color_on, self.button_color_off, 3, 290, 
+                            color=self.margin_color, on_color=self.margin_color, size=40)
         self.menu_button = MenuButton(self, self.button_color_on, self.text_color_3, 
                             self.width * 0.7, 7, 
-                            color=self.margin_color, on_color=self.margin_color, size=30)
+                            color=self.menu_color, on_color=self.menu_color, size=30)
         self.unselect_button = UnselectButton(self, self.button_color_on, self.text_color_3, 
                             self.width * 0.93, self.height * 0.005, 
-                            color=self.margin_color, on_color=self.margin_color, size=40)
+                            color=self.menu_color, on_color=self.menu_color, size=40)
+        self.buttons = [self.play_button, self.refocus_button, self.rr_button, 
+                        self.clear_button, self.pbc_button, self.back_button, 
+                        self.jump_button]
 
         # Initialize iteration label
         self.iteration_box = pygame.Surface((0.12 * self.width, 0.05 * self.height))
         self.iteration_box.fill((0,0,0))
         self.iteration_label = self.font.render('Iteration', True, self.text_color_1)
 
+        # Text labels, rendered again only when their text changes.
+        # The period and the rule are drawn over the grid
+        self.iteration_text = Label(self.font, self.text_color_2, self.width * 0.245, 
+                                    self.height * 0.014, background=(0, 0, 0))
+        self.jump_text = Label(self.font, self.text_color_1, self.width * 0.39, 
+                               self.height * 0.014, background=self.margin_color)
+        self.speed_text = Label(self.font, self.text_color_1, self.width * 0.56, 
+                                self.height * 0.014, background=self.margin_color)
+        self.period_text = Label(self.font, self.text_color_3, self.width * 0.09, self.height * 0.94)
+        self.rule_text = Label(self.font, self.text_color_3, self.width * 0.5, self.height * 0.94)
+        # How the jump button advances the grid, shown while it is
+        # hovered or a jump runs
+        self.jump_hint = Label(self.small_font, self.text_color_3, self.width * 0.09, 
+                               self.height * 0.9)
+        self.jump_mode = None
+        self.labels = [self.iteration_text, self.jump_text, self.speed_text]
+        # The whole screen is drawn again when the grid, the view
+        # or the cursor change, or after any input. Otherwise only
+        # the widgets that changed are drawn and updated
+        self.redraw = True
+        self.scene = None
+
+        # Amount of generations advanced by the jump button, as 
+        # a power of 10
+        self.jump_exponent = 6
+        self.max_jump_exponent = 9
+        self.jump_hints = {'window': 'HashLife jump: cells pass through the closed edges',
+                           'step': 'Stepped jump: click jump again to stop it',
+                           'plane': ''}
+
         # Initialize patterns visualization
         self.patterns_box = pygame.Surface((0.3 * self.width, 0.07 * self.height))
         self.patterns_box.fill(self.menu_color)
@@ -98,64 +180,134 @@ class Simulation():
         self.menu_speed = 30
 
         # Initialize pattern assets
-        self.assets = {'8-Line': {'alive_cells': [(0,i) for i in range(8)]},
-                       'Glider': {'alive_cells': [(0,0), (0,1), (0,2), (1,2), (2,1)]},
-                       'Gosper gun': {'alive_cells': [(0,0),(0,1),(1,0),(1,1), 
-                                                      (10,0),(10,1),(10,2),(11,-1),(11,3),
-                                                      (12,-2),(12,4),(13,-2),(13,4),(14,1),
-                                                      (15,-1),(15,3),(16,0),(16,1),(16,2),
-                                                      (17,1),(20,-2),(20,-1),(20,0),(21,-2),
-                                                      (21,-1),(21,0),(22,-3),(22,1),(24,-3),
-                                                      (24,-4),(24,1),(24,2),(34,-2),(34,-1),
-                                                      (35,-2),(35,-1)]},
-                        'Snark': {'alive_cells': [(0,9),(1,9),(1,10),(1,11),(2,12),(3,12),
-                                                  (3,11),(6,3),(6,4),(7,3),(8,3),(8,1),(8,0),
-                                                  (9,0),(9,3),(9,4),(9,5),(9,10),(9,11),
-                                                  (10,10),(10,11),(10,1),(10,2),(10,6),
-                                                  (11,3),(11,4),(11,5),(11,6),(12,3),(12,19),
-                                                  (12,20),(13,19),(13,21),(14,21),(15,21),
-                                                  (15,22),(13,4),(13,5),(13,6),(14,7),(15,2),
-                                                  (15,3),(15,4),(15,5),(15,6),(16,2),(17,4),
-                                                  (18,3),(18,4)]}}
-
-        for i, asset in enumerate(self.assets):
-            y = (i + 1) * 0.07 * self.height + 0.02 * self.height
-            rect_x = self.width * 0.7
-            self.assets[asset]['button'] = AssetButton(asset, x=self.width*0.03, y=y, 
-                                                size=[0.3 * self.width, 0.07 * self.height], 
-                                                off_color=self.text_color_3, 
-                                                on_color=(255, 255, 255), 
-                                                rect_pos=[rect_x, y])
-            self.assets[asset]['on_asset'] = False
+        self.assets = {name: {'alive_cells': alive_cells} 
+                       for name, alive_cells in BUILTIN_PATTERNS.items()}
+
+        for asset in self.assets:
+            self.add_asset_button(asset, asset)
         
         self.selected_asset = None
         self.drawing_asset = False
 
+        # Patterns from the library folder are indexed and loaded
+        # in the background, and added to the menu when ready
+        self.library = PatternLibrary(os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                                                   'library'))
+        self.library_index = self.library.index_async()
+        self.asset_loading = None
+        # First asset shown in the menu, and amount of rows
+        self.menu_scroll = 0
+        self.menu_rows = int(0.93 / 0.07)
+        # Asset under the mouse in the menu
+        self.on_asset = None
+
+        # Board file for quick saves
+        self.save_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                                      'saves', 'quicksave.board')
+        self.lenia_save_path = os.path.join(os.path.dirname(self.save_path), 
+                                            'quicksave' + LENIA_EXTENSION)
+
         # Simulation manipulation
         self.running = False
         self.grid_area = pygame.Rect(0.07 * self.width, 0.07 * self.height, self.width, self.height)
 
-        # Cell toggle visualization
-        self.toggle_rect = pygame.Surface((self.width // int(self.grid_size * 1.1), 
-                                        self.height // int(self.grid_size * 1.1)))
-        self.toggle_rect.fill((200,200,200))
-
         # Initialize margins
         self.margin_y = pygame.Surface((0.07 * self.width, self.height))
         self.margin_x = pygame.Surface((self.width, 0.07 * self.height))
         self.margin_y.fill(self.margin_color)
         self.margin_x.fill(self.margin_color)
 
+    def add_asset_button(self, asset, text):
+        # The button is moved to its row when the menu is shown
+        rect_x = self.width * 0.7
+        self.assets[asset]['button'] = AssetButton(text, x=self.width*0.03, y=0, 
+                                            size=[0.3 * self.width, 0.07 * self.height], 
+                                            off_color=self.text_color_3, 
+                                            on_color=(255, 255, 255), 
+                                            rect_pos=[rect_x, 0])
+
+    def visible_assets(self):
+        # Assets in the rows of the menu, with their row
+        names = list(self.assets)[self.menu_scroll:self.menu_scroll + self.menu_rows]
+        return list(enumerate(names))
+
+    def select_asset(self, alive_cells):
+        self.drawing_asset = True
+        self.selected_asset = GridAsset(self)
+        self.selected_asset.set_alive_cells(alive_cells)
+
+    def next_rule(self, worker):
+        # Switch to the next named rule that the grid supports. 
+        # Runs on the worker thread, so the modes come from the
+        # worker grid
+        grid = worker.grid
+        if isinstance(grid, LeniaGrid):
+            rules = self.lenia_rules
+        else:
+            rules = [rule for rule in self.rules 
+                     if not isinstance(grid, SparseGrid) or HashLifeEngine.supports(rule)]
+        current = grid.rule
+        grid.rule = rules[(rules.index(current) + 1) % len(rules)] \
+                    if current in rules else rules[0]
+
+    def toggle_unbounded(self, worker):
+        # Move the alive cells to a new grid of the other kind, 
+        # dropping those outside the bounded grid. Runs on the
+        # worker thread, which is the only one that replaces
+        # worker.grid. Unbounded grids can only use the rules
+        # supported by HashLife
+        grid = worker.grid
+        unbounded = isinstance(grid, SparseGrid)
+        if isinstance(grid, LeniaGrid) or (not unbounded and not HashLifeEngine.supports(grid.rule)):
+            return
+        alive_cells = np.array(grid.alive_cells, dtype=np.int64).reshape(-1, 2)
+        if unbounded:
+            new_grid = Grid(self, self.grid_size)
+            new_grid.rule = grid.rule
+            new_grid.clear()
+            new_grid.stamp(alive_cells)
+        else:
+            new_grid = SparseGrid(self, self.grid_size, rule=grid.rule)
+            new_grid.set_alive_array(alive_cells)
+        worker.grid = new_grid
+        # The history only holds states of the old grid
+        worker.history.clear()
+
+    def toggle_continuous(self, worker):
+        # Move the cells to a new grid with continuous states, with
+        # the alive cells at 1, or back to a binary grid, with the
+        # cells of at least 0.5 alive. Runs on the worker thread
+        grid = worker.grid
+        if isinstance(grid, SparseGrid):
+            return
+        state = grid.state
+        if isinstance(grid, LeniaGrid):
+            new_grid = Grid(self, self.grid_size)
+            new_grid.set_cells((state >= 0.5).astype(np.uint8))
+        else:
+            new_grid = LeniaGrid(self, self.grid_size)
+            new_grid.set_cells(state)
+        new_grid.pbc = grid.pbc
+        worker.grid = new_grid
+        worker.history.clear()
+
     def run(self):
         # Main simulation loop
+        self.worker.start()
         while True:
-            self.screen.fill((0, 0, 0))
-            self.display.fill((0, 0, 0))
-            self.display.set_colorkey((0, 0, 0))
-
-            # Update display offset
-            self.display_offset[0] += self.display_scroll[0] * self.scroll_speed
-            self.display_offset[1] += self.display_scroll[1] * self.scroll_speed
+            # Phases are only timed while profiling
+            profiling = self.profiler.enabled
+            if profiling:
+                self.profiler.start()
+
+            # Update display offset, or the view of the cells in 
+            # unbounded mode
+            if self.unbounded:
+                self.grid.view[0] -= self.display_scroll[0] * self.view_speed
+                self.grid.view[1] -= self.display_scroll[1] * self.view_speed
+            else:
+                self.display_offset[0] += self.display_scroll[0] * self.scroll_speed
+                self.display_offset[1] += self.display_scroll[1] * self.scroll_speed
 
             # Limit the offset so that the user cannot go outside the
             # grid
@@ -165,6 +317,9 @@ class Simulation():
             self.display_offset[1] = min(self.display_offset[1], 0)
             self.display_offset[1] = max(self.display_offset[1], 
                                          self.screen.get_size()[1] - self.display_size[1])
+            self.camera.update()
+            if profiling:
+                self.profiler.lap('view')
 
             # Get mouse position and button status
             mpos = pygame.mouse.get_pos()
@@ -174,42 +329,104 @@ class Simulation():
             on_clear = self.clear_button.update(mpos)
             on_pbc = self.pbc_button.update(mpos)
             on_back = self.back_button.update(mpos)
+            on_jump = self.jump_button.update(mpos)
             on_menu = self.menu_button.update(mpos)
             on_grid = self.grid_area.collidepoint(mpos)
             on_unselect = False
             if self.drawing_asset:
                 on_unselect = self.unselect_button.update(mpos)
 
+            # Add the library patterns once they are indexed
+            if self.library_index is not None and self.library_index.done():
+                for entry in self.library_index.result():
+                    asset = 'library/' + entry['file']
+                    self.assets[asset] = {'alive_cells': None, 'entry': entry}
+                    self.add_asset_button(asset, entry['name'][:18])
+                self.library_index = None
+
+            # Select a library pattern once it is loaded
+            if self.asset_loading is not None and self.asset_loading.done():
+                self.select_asset(self.asset_loading.result())
+                self.asset_loading = None
+
             # If the menu has been requested update its position
-            # and get status for each asset
+            # and get status for each asset in view
             if self.show_menu:
                 self.running = False
                 self.menu_y += self.menu_speed
                 self.menu_y = min(self.menu_y, 0)
-                for asset in self.assets:
-                    self.assets[asset]['on_asset'] = self.assets[asset]['button'].update(mpos)
-
-            # If an asset has been selected, render its position on the grid
-            if self.drawing_asset:
-                self.selected_asset.render(self.display, mpos)
+                self.on_asset = None
+                for row, asset in self.visible_assets():
+                    button = self.assets[asset]['button']
+                    button.move((row + 1) * 0.07 * self.height + 0.02 * self.height)
+                    if button.update(mpos):
+                        self.on_asset = asset
 
             if not self.show_menu:
                 self.menu_y -= self.menu_speed
                 self.menu_y = max(self.menu_y, (0.06 - 1) * self.height)
-
-            # As long as we are in iteration 0, store the initial grid status
-            if self.iteration == 0:
-                self.initial_state = self.grid.get_cells()
-
-            # Update grid and render alive cells
-            if self.running:
-                self.grid.update()
-                self.iteration += 1
-            self.grid.render(self.display)
+            if profiling:
+                self.profiler.lap('buttons')
+
+            # The grid is stepped by the worker, render the last
+            # frame it published
+            if self.worker.error is not None:
+                raise self.worker.error
+            frame = self.worker.frames.acquire()
+            # Grid of the frame, which the view and the modes follow
+            self.grid = frame['grid']
+            self.unbounded = isinstance(self.grid, SparseGrid)
+            self.continuous = isinstance(self.grid, LeniaGrid)
+            self.iteration = frame['generation']
+            self.period = frame['period'], frame['cycle_start']
+            self.rule = frame['rule']
+            self.population = frame['population']
+            self.jump_mode = frame['jump_mode']
+            self.max_jump_exponent = frame['max_jump_exponent']
+            self.jump_exponent = min(self.jump_exponent, self.max_jump_exponent)
+            if self.worker.jumping:
+                self.jump_hint.set_text('Jumping, click jump again to stop')
+            elif on_jump:
+                self.jump_hint.set_text(self.jump_hints[self.jump_mode])
+            else:
+                self.jump_hint.set_text('')
+            if self.period[0] is not None:
+                self.period_text.set_text('Period {} from {}'.format(*self.period))
+            else:
+                self.period_text.set_text('')
+            self.rule_text.set_text(str(self.rule))
+            # Redraw everything if anything on the grid area changed,
+            # or while the menu or the overlay are shown
+            if self.drawing_asset:
+                cursor = mpos
+            else:
+                cursor = self.camera.display_cell(mpos) if on_grid else None
+            scene = (frame['serial'], tuple(self.display_offset), tuple(self.display_size), 
+                     tuple(self.grid.view), cursor, self.selected_asset, self.menu_y)
+            full = (self.redraw or scene != self.scene or self.profiler.overlay
+                    or self.menu_y > (0.06 - 1) * self.height
+                    or self.period_text.dirty or self.rule_text.dirty or self.jump_hint.dirty)
+            self.redraw = False
+            self.scene = scene
+            if full:
+                self.screen.fill((0, 0, 0))
+                # If an asset has been selected, render its position on the grid
+                if self.drawing_asset:
+                    self.selected_asset.render(self.screen, mpos)
+                frame['grid'].render(self.screen, frame['cells'])
+            self.worker.frames.release()
+            if profiling:
+                self.profiler.lap('render')
 
             # Event handling
             for event in pygame.event.get():
+                # Any input but moving the mouse may change what is
+                # shown on the grid
+                if event.type != pygame.MOUSEMOTION:
+                    self.redraw = True
                 if event.type == pygame.QUIT:
+                    self.worker.stop()
+                    self.profiler.close()
                     pygame.quit()
                     sys.exit()
 
@@ -223,41 +440,55 @@ class Simulation():
                             self.display_scroll = [0, 0]
                             self.display_offset = [0, 0]
                             self.centered = True
+                            if self.unbounded:
+                                self.grid.view = [0, 0]
                         # If random reset, generate a new random grid
                         if on_reset:
-                            self.grid.reset_random()
-                            self.iteration = 0
+                            self.worker.submit(lambda w: w.restart(w.grid.reset_random))
                         # If on clear button then clear the grid
                         if on_clear:
-                            self.grid.clear()
-                            self.iteration = 0
+                            self.worker.submit(lambda w: w.restart(w.grid.clear))
                         # If on PBC, toggle PBC configuration in the grid
-                        if on_pbc:
-                            self.grid.pbc = not self.grid.pbc
+                        if on_pbc and not self.unbounded:
+                            self.worker.submit(lambda w: setattr(w.grid, 'pbc', not w.grid.pbc))
                         # If on back, return to initial grid state
                         if on_back:
-                            self.grid.cells = self.initial_state.copy()
-                            self.grid.alive_cells = [self.initial_state[cell]['pos'] for cell in self.initial_state if self.initial_state[cell]['state'] == 1]
-                            self.iteration = 0
+                            self.worker.submit(lambda w: w.back(), edit=False)
                             self.running = False
+                        # If on jump, advance the grid several generations
+                        # If on jump, advance the grid several generations,
+                        # or stop the stepped jump that is running
+                        if on_jump and self.worker.jumping:
+                            self.worker.cancel_jump.set()
+                        elif on_jump:
+                            jump = 10 ** self.jump_exponent
+                            self.worker.submit(lambda w, jump=jump: w.jump(jump), edit=False)
                         # If we are in the grid area try to toggle the 
-                        # closest cell
-                        if on_grid:
+                        # closest cell. The cell is found now, but the
+                        # change is applied by the worker between
+                        # generations
+                        if on_grid and not self.show_menu:
+                            ref = self.camera.grid_cell(mpos)
+                            ref = (ref[0] + self.grid.view[0], ref[1] + self.grid.view[1])
                             # If we have selected a pattern, print it
-                            if self.drawing_asset and not self.show_menu:
-                                self.selected_asset.print_to_grid(mpos, self.grid)
+                            if self.drawing_asset:
+                                self.worker.submit(lambda w, asset=self.selected_asset, ref=ref: 
+                                                   asset.print_to_grid(ref, w.grid))
                             # Else toggle the cell
-                            elif not self.show_menu:
-                                self.grid.toggle_cell(mpos)
+                            else:
+                                self.worker.submit(lambda w, ref=ref: w.grid.toggle_cell(*ref))
                         # Check if any pattern has been selected from 
                         # the menu
                         if self.show_menu:
-                            for asset in self.assets:
-                                if self.assets[asset]['on_asset']:
-                                    self.drawing_asset = True
-                                    self.selected_asset = GridAsset(self)
-                                    self.selected_asset.set_alive_cells(self.assets[asset]['alive_cells'])
-                                    self.show_menu = False
+                            if self.on_asset is not None:
+                                asset = self.assets[self.on_asset]
+                                # Library patterns are loaded in the 
+                                # background
+                                if asset['alive_cells'] is None:
+                                    self.asset_loading = self.library.load_async(asset['entry'])
+                                else:
+                                    self.select_asset(asset['alive_cells'])
+                                self.show_menu = False
 
                         # If on menu button open patterns menu
                         if on_menu:
@@ -268,13 +499,20 @@ class Simulation():
                             self.selected_asset = None
                         
 
+                    # Scroll the menu
+                    on_menu_box = self.show_menu and mpos[0] >= self.width * 0.7
+                    max_scroll = max(len(self.assets) - self.menu_rows, 0)
+                    if event.button == 4 and on_menu_box:
+                        self.menu_scroll = max(self.menu_scroll - 1, 0)
+                    if event.button == 5 and on_menu_box:
+                        self.menu_scroll = min(self.menu_scroll + 1, max_scroll)
                     # Zoom in
-                    if event.button == 4:
+                    if event.button == 4 and not on_menu_box:
                         self.display_size[0] += self.display_zoom
                         self.display_size[1] += self.display_zoom
                         self.centered = False
                     # Zoom out
-                    if event.button == 5:
+                    if event.button == 5 and not on_menu_box:
                         self.display_size[0] = max(self.display_size[0] - self.display_zoom, 
                                                     self.screen.get_size()[0])
                         self.display_size[1] = max(self.display_size[1] - self.display_zoom, 
@@ -299,6 +537,62 @@ class Simulation():
                         self.selected_asset.rotate()
                     if event.key == pygame.K_f and self.drawing_asset:
                         self.selected_asset.flip()
+                    if event.key == pygame.K_m and self.drawing_asset:
+                        self.selected_asset.cycle_mode()
+                    # Save the grid, or load the last save
+                    save_path = self.lenia_save_path if self.continuous else self.save_path
+                    if event.key == pygame.K_s:
+                        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                        self.worker.submit(lambda w, path=save_path: w.save(path), edit=False)
+                    if event.key == pygame.K_l and os.path.exists(save_path):
+                        self.running = False
+                        self.worker.submit(lambda w, path=save_path: w.load(path))
+                    # Switch between bounded and unbounded grids
+                    if event.key == pygame.K_u:
+                        self.worker.submit(self.toggle_unbounded)
+                    # Switch between binary and continuous grids
+                    if event.key == pygame.K_v:
+                        self.worker.submit(self.toggle_continuous)
+                    # Speed mode, and generations per frame in 
+                    # uncapped mode
+                    if event.key == pygame.K_t:
+                        self.speed.cycle_mode()
+                    if event.key == pygame.K_PERIOD:
+                        self.speed.faster()
+                    if event.key == pygame.K_COMMA:
+                        self.speed.slower()
+                    # Step backwards or forwards through the 
+                    # history, or go to its oldest or newest
+                    # generation
+                    if event.key == pygame.K_b:
+                        self.running = False
+                        self.worker.submit(lambda w: w.step_back(), edit=False)
+                    if event.key == pygame.K_n:
+                        self.running = False
+                        self.worker.submit(lambda w: w.step_forward(), edit=False)
+                    if event.key == pygame.K_HOME:
+                        self.running = False
+                        self.worker.submit(lambda w: w.seek(w.history.oldest), edit=False)
+                    if event.key == pygame.K_END:
+                        self.running = False
+                        self.worker.submit(lambda w: w.seek(w.history.newest), edit=False)
+                    # Next named rule
+                    if event.key == pygame.K_g:
+                        self.worker.submit(self.next_rule)
+                    # Stop automatically once the grid is periodic
+                    if event.key == pygame.K_c:
+                        self.worker.stop_on_cycle = not self.worker.stop_on_cycle
+                    # Show or hide the profiling overlay. The worker
+                    # only keeps its counters while profiling
+                    if event.key == pygame.K_p:
+                        self.profiler.toggle_overlay()
+                        self.worker.profile = self.profiler.enabled
+                        self.worker.submit(lambda w: None, edit=False)
+                    # Jump size
+                    if event.key == pygame.K_RIGHTBRACKET:
+                        self.jump_exponent = min(self.jump_exponent + 1, self.max_jump_exponent)
+                    if event.key == pygame.K_LEFTBRACKET:
+                        self.jump_exponent = max(self.jump_exponent - 1, 0)
 
                 if event.type == pygame.KEYUP:
                     # Deactivate scrolling
@@ -311,51 +605,90 @@ class Simulation():
                     if event.key == pygame.K_DOWN:
                         self.display_scroll[1] = 0
 
+            if profiling:
+                self.profiler.lap('events')
 
-            # Show where the cell toggle would occur
-            if not self.drawing_asset:
-                pos = [(mpos[0] - self.display_offset[0]) * self.width / self.display_size[0], 
-                    (mpos[1] - self.display_offset[1]) *  self.height / self.display_size[1]]
-                x = (int(pos[0]) * int(self.grid_size * 1.1) / self.width)
-                y = (int(pos[1]) * int(self.grid_size * 1.1) / self.height)
-                toggle_pos = [int(x) * self.width // int(self.grid_size * 1.1), 
-                            int(y) * self.height // int(self.grid_size * 1.1)]
-                self.display.blit(self.toggle_rect, toggle_pos)
-            
-            # Blit display and update screen
-            scaled_display = pygame.transform.scale(self.display, 
-                                                    self.display_size)
-            self.screen.blit(scaled_display, self.display_offset)
-
-            # Render black margins for the buttons and data
-            self.screen.blit(self.margin_y, (0, 0))
-            self.screen.blit(self.margin_x, (0, 0))
-
-            # Render buttons on top of everything
-            self.play_button.render(self.screen)
-            self.refocus_button.render(self.screen)
-            self.rr_button.render(self.screen)
-            self.clear_button.render(self.screen)
-            self.pbc_button.render(self.screen)
-            self.back_button.render(self.screen)
-
-            # Render iteration text
-            iteration_str = str(self.iteration) if self.iteration <= 9999 else '+9999'
-            iteration_text = self.font.render(iteration_str, True, self.text_color_2)
-            self.screen.blit(self.iteration_box, (self.width * 0.237, self.height * 0.01))
-            self.screen.blit(iteration_text, (self.width * 0.245, self.height * 0.014))
-            self.screen.blit(self.iteration_label, (self.width * 0.09, self.height * 0.014))
-
-            # Render patterns text and menu
-            for asset in self.assets:
-                self.assets[asset]['button'].render(self.menu_box, self.font)
-            self.screen.blit(self.menu_box, (self.width * 0.7, self.menu_y))
-            self.screen.blit(self.patterns_box, (self.width * 0.7, 0))
-            self.menu_button.render(self.screen)
-            self.screen.blit(self.patterns_label, (self.width * 0.75, self.height * 0.011))
-            self.unselect_button.render(self.screen)
-
-            pygame.display.update()
-            self.clock.tick(60)
-
-Simulation().run()
\ No newline at end of file
+            # Start or stop the worker after the events of this 
+            # frame, before it runs the commands they queued. The
+            # worker may have stopped itself at a cycle
+            if self.worker.cycle_stop:
+                self.worker.cycle_stop = False
+                self.running = False
+            self.worker.running = self.running
+
+            iteration_str = str(self.iteration) if self.iteration <= 9999 else '{:.1e}'.format(self.iteration).replace('e+0', 'e').replace('e+', 'e')
+            self.iteration_text.set_text(iteration_str)
+            self.jump_text.set_text('Jump 1e' + str(self.jump_exponent))
+            self.speed_text.set_text(self.speed.label())
+
+            if full:
+                # Show where the cell toggle would occur
+                if cursor is not None and not self.drawing_asset:
+                    toggle_rect = self.camera.cell_rect(*cursor)
+                    if toggle_rect is not None:
+                        self.screen.fill((200,200,200), toggle_rect)
+
+                # Render black margins for the buttons and data
+                self.screen.blit(self.margin_y, (0, 0))
+                self.screen.blit(self.margin_x, (0, 0))
+
+                # Render buttons on top of everything
+                for button in self.buttons:
+                    button.render(self.screen)
+
+                # Render iteration, jump size and speed text
+                self.screen.blit(self.iteration_box, (self.width * 0.237, self.height * 0.01))
+                self.screen.blit(self.iteration_label, (self.width * 0.09, self.height * 0.014))
+                for label in self.labels:
+                    label.render(self.screen)
+
+                # Render the period of the grid, once it is periodic,
+                # and its rule
+                self.period_text.render(self.screen)
+                self.rule_text.render(self.screen)
+                self.jump_hint.render(self.screen)
+
+                # Render patterns text and menu. While the menu is
+                # hidden the patterns box covers it
+                if self.menu_y > (0.06 - 1) * self.height:
+                    self.menu_box.fill(self.menu_color)
+                    for row, asset in self.visible_assets():
+                        self.assets[asset]['button'].render(self.menu_box, self.font)
+                    self.screen.blit(self.menu_box, (self.width * 0.7, self.menu_y))
+                self.screen.blit(self.patterns_box, (self.width * 0.7, 0))
+                self.menu_button.render(self.screen)
+                self.screen.blit(self.patterns_label, (self.width * 0.75, self.height * 0.011))
+                self.unselect_button.render(self.screen)
+                dirty = None
+            else:
+                # Only draw the widgets that changed
+                widgets = self.buttons + [self.menu_button, self.unselect_button] + self.labels
+                dirty = [widget.render(self.screen) for widget in widgets if widget.dirty]
+
+            # Render the profiling overlay
+            if self.profiler.overlay:
+                self.profiler.render(self.screen, self.small_font, 
+                                     (self.width * 0.09, self.height * 0.08), self.text_color_2)
+            if profiling:
+                self.profiler.lap('interface')
+
+            # Update the whole display, only the changed widgets, 
+            # or nothing at all
+            if dirty is None:
+                pygame.display.update()
+            elif dirty:
+                pygame.display.update(dirty)
+            if profiling:
+                self.profiler.lap('display')
+            self.clock.tick(self.speed.fps)
+            if profiling:
+                self.profiler.lap('wait')
+                self.profiler.end_frame(self.worker, self.iteration, self.population)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cellular automata simulator.')
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='stream the timings of every frame to a CSV file, '
+                             'or to JSON lines if PATH ends in .jsonl')
+    args = parser.parse_args()
+    Simulation(args.profile).run()
@@ -0,0 +1,274 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import multiprocessing as mp
+import multiprocessing.connection
+from multiprocessing import shared_memory
+import os
+import threading
+import weakref
+import numpy as np
+
+# Import scripts
+from engine import NumpyEngine, padded_count
+from rules import LIFE
+
+
+def split_rows(n_rows, n_tiles):
+    # Boundaries of n_tiles bands of rows with similar sizes
+    bounds = np.linspace(0, n_rows, n_tiles + 1).astype(int)
+    return [(int(bounds[k]), int(bounds[k + 1])) for k in range(n_tiles)]
+
+
+def step_tile(src, dst, rows, pbc, rule=LIFE):
+    '''
+    Params:
+        src : np.ndarray
+            2-D uint8 array with the whole grid state.
+        dst : np.ndarray
+            2-D uint8 array where the next state is written.
+        rows : tuple
+            First and last (exclusive) row of the tile.
+        pbc : bool
+            Whether to use periodic boundary conditions.
+        rule : Rule (optional)
+            Rule used to step the cells.
+    Output:
+        Writes the next state of the tile rows into dst. The
+        one cell halo is read from the rows of the neighboring
+        tiles in src.
+    '''
+    n_i, n_j = src.shape
+    r_0, r_1 = rows
+    padded = np.zeros((r_1 - r_0 + 2, n_j + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = src[r_0:r_1]
+    # Halo rows above and below the tile
+    if r_0 > 0 or pbc:
+        padded[0, 1:-1] = src[(r_0 - 1) % n_i]
+    if r_1 < n_i or pbc:
+        padded[-1, 1:-1] = src[r_1 % n_i]
+    # Halo columns
+    if pbc:
+        padded[:, 0] = padded[:, -2]
+        padded[:, -1] = padded[:, 1]
+    dst[r_0:r_1] = rule.apply(src[r_0:r_1], padded_count(padded))
+
+
+def _worker(names, shape, rows, barrier, conn, timeout):
+    '''
+    Params:
+        names : list
+            Names of the two shared grid buffers.
+        shape : tuple
+            Shape of the grid.
+        rows : tuple
+            First and last (exclusive) row of the tile.
+        barrier : multiprocessing.Barrier
+            Barrier shared by the workers of all tiles.
+        conn : multiprocessing.connection.Connection
+            End of the pipe with the engine.
+        timeout : float
+            Seconds to wait for the other tiles at each barrier.
+    Output:
+        Attaches to both shared buffers once, and steps the tile
+        for each (generations, pbc, rule) command received through
+        conn until it receives None, waiting for all tiles after
+        each generation. Replies None when done, or the error
+        message if the tile failed.
+    '''
+    buffers = [shared_memory.SharedMemory(name=name) for name in names]
+    grids = [np.ndarray(shape, dtype=np.uint8, buffer=buf.buf) for buf in buffers]
+    try:
+        while True:
+            command = conn.recv()
+            if command is None:
+                break
+            generations, pbc, rule = command
+            try:
+                for generation in range(generations):
+                    step_tile(grids[generation % 2], grids[(generation + 1) % 2], rows, pbc, rule)
+                    barrier.wait(timeout)
+            except threading.BrokenBarrierError:
+                conn.send('another tile did not reach the barrier')
+                break
+            except Exception as error:
+                # Break the barrier, so that the other workers stop 
+                # waiting for this tile and fail too
+                barrier.abort()
+                conn.send(repr(error))
+                break
+            conn.send(None)
+    finally:
+        del grids
+        for buf in buffers:
+            buf.close()
+        conn.close()
+
+
+# Define tile pool class
+class TilePool():
+    '''
+    Worker processes attached to the shared buffers of a grid
+    shape, one per band of rows, kept between calls to advance.
+    '''
+    def __init__(self, shape, n_tiles, timeout):
+        self.shape = shape
+        self.n_tiles = n_tiles
+        self.timeout = timeout
+        # Current and next grid, swapped after every generation
+        self.buffers = [shared_memory.SharedMemory(create=True, size=shape[0] * shape[1]) 
+                        for _ in range(2)]
+        self.grids = [np.ndarray(shape, dtype=np.uint8, buffer=buf.buf) for buf in self.buffers]
+        self.barrier = mp.Barrier(n_tiles)
+        self.conns = []
+        self.processes = []
+        for rows in split_rows(shape[0], n_tiles):
+            conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_worker, daemon=True,
+                                 args=([buf.name for buf in self.buffers], shape, rows, 
+                                       self.barrier, child_conn, timeout))
+            process.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+        # Release the shared memory at exit if close is not called
+        self._finalizer = weakref.finalize(self, TilePool._release, self.buffers, 
+                                           self.processes)
+
+    def advance(self, state, pbc, rule, generations):
+        self.grids[0][...] = state
+        try:
+            for conn in self.conns:
+                conn.send((generations, pbc, rule))
+        except OSError:
+            self._fail('a worker exited')
+        # Wait for every tile, failing as soon as a worker 
+        # reports an error or dies
+        pending = list(self.conns)
+        while pending:
+            for conn in mp.connection.wait(pending, timeout=self.timeout):
+                try:
+                    error = conn.recv()
+                except EOFError:
+                    error = 'a worker exited'
+                if error is not None:
+                    self._fail(error)
+                pending.remove(conn)
+            if pending and not all(process.is_alive() for process in self.processes):
+                self._fail('a worker exited')
+        return self.grids[generations % 2].copy()
+
+    def _fail(self, error):
+        # Release the workers still waiting at the barrier
+        self.barrier.abort()
+        raise RuntimeError('A parallel engine worker failed: ' + error)
+
+    def close(self):
+        if not self._finalizer.alive:
+            return
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(self.timeout)
+        for conn in self.conns:
+            conn.close()
+        del self.grids
+        self._finalizer()
+
+    @staticmethod
+    def _release(buffers, processes):
+        # Workers still alive by now are stuck, such as in a
+        # tile that never reaches the barrier
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+        for buf in buffers:
+            buf.close()
+            buf.unlink()
+
+
+# Define parallel engine class
+class ParallelEngine():
+    def __init__(self, workers=None, min_rows=64, rule=LIFE, timeout=60):
+        '''
+        Params:
+            workers : int (optional)
+                Number of worker processes, one per tile. Defaults
+                to the number of CPUs.
+            min_rows : int (optional)
+                Minimum amount of rows per tile. Smaller grids use
+                fewer tiles, and a single tile is stepped in this 
+                process with NumpyEngine.
+            rule : Rule (optional)
+                Rule used to step the cells.
+            timeout : float (optional)
+                Seconds that a tile waits for the others after a
+                generation before it gives up, such as when another
+                worker died.
+        Output:
+            Initializes an engine that splits the grid into bands
+            of rows kept in shared memory. Each worker steps one
+            band, reading the halo rows of its neighbors from the
+            shared grid after every generation. The workers are 
+            started on the first call to advance and kept for the
+            next ones, until close is called or the grid shape 
+            changes. If any worker fails, the pool is closed and 
+            advance raises RuntimeError.
+        '''
+        self.workers = os.cpu_count() if workers is None else workers
+        self.min_rows = min_rows
+        self.timeout = timeout
+        self.serial = NumpyEngine(rule)
+        self.pool = None
+
+    @property
+    def rule(self):
+        return self.serial.rule
+
+    @rule.setter
+    def rule(self, rule):
+        self.serial.rule = rule
+
+    def step(self, state, pbc):
+        # Waking the workers costs more than a generation, so
+        # single generations are stepped in this process
+        return self.serial.step(state, pbc)
+
+    def advance(self, state, pbc, generations):
+        n_tiles = min(self.workers, state.shape[0] // self.min_rows)
+        if n_tiles <= 1 or generations == 0:
+            return self.serial.advance(state, pbc, generations)
+
+        if self.pool is not None and (self.pool.shape, self.pool.n_tiles) != (state.shape, n_tiles):
+            self.close()
+        if self.pool is None:
+            self.pool = TilePool(state.shape, n_tiles, self.timeout)
+        try:
+            return self.pool.advance(state, pbc, self.rule, generations)
+        except Exception:
+            # The barrier may be broken, start over on the next call
+            self.close()
+            raise
+
+    def close(self):
+        # Stop the workers and release the shared memory
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
@@ -0,0 +1,315 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+
+
+PATTERN_EXTENSIONS = ('.rle', '.cells')
+# Run count and tag of each item of an RLE body
+RLE_TOKEN = re.compile(r'(\d*)([^\d\s])')
+RLE_HEADER = re.compile(r'\s*x\s*=')
+
+# Patterns that are always in the menu, as (x, y) cell positions
+BUILTIN_PATTERNS = {'8-Line': [(0,i) for i in range(8)],
+                    'Glider': [(0,0), (0,1), (0,2), (1,2), (2,1)],
+                    'Gosper gun': [(0,0),(0,1),(1,0),(1,1),
+                                   (10,0),(10,1),(10,2),(11,-1),(11,3),
+                                   (12,-2),(12,4),(13,-2),(13,4),(14,1),
+                                   (15,-1),(15,3),(16,0),(16,1),(16,2),
+                                   (17,1),(20,-2),(20,-1),(20,0),(21,-2),
+                                   (21,-1),(21,0),(22,-3),(22,1),(24,-3),
+                                   (24,-4),(24,1),(24,2),(34,-2),(34,-1),
+                                   (35,-2),(35,-1)],
+                    'Snark': [(0,9),(1,9),(1,10),(1,11),(2,12),(3,12),
+                              (3,11),(6,3),(6,4),(7,3),(8,3),(8,1),(8,0),
+                              (9,0),(9,3),(9,4),(9,5),(9,10),(9,11),
+                              (10,10),(10,11),(10,1),(10,2),(10,6),
+                              (11,3),(11,4),(11,5),(11,6),(12,3),(12,19),
+                              (12,20),(13,19),(13,21),(14,21),(15,21),
+                              (15,22),(13,4),(13,5),(13,6),(14,7),(15,2),
+                              (15,3),(15,4),(15,5),(15,6),(16,2),(17,4),
+                              (18,3),(18,4)]}
+
+
+def parse_plaintext(lines):
+    '''
+    Params:
+        lines : iterable
+            Lines of a plaintext (.cells) pattern, where lines
+            starting with '!' are comments, 'O' marks alive cells
+            and '.' marks dead cells.
+    Output:
+        Returns a tuple (name, alive_cells), where alive_cells is
+        an array with shape (n, 2) with the (x, y) position of
+        each alive cell, with x along the line and y the line
+        number. name is None if there is no '!Name:' comment.
+    '''
+    name = None
+    xs, ys = [], []
+    y = 0
+    for line in lines:
+        if line.startswith('!'):
+            if line[1:].lstrip().lower().startswith('name:'):
+                name = line.split(':', 1)[1].strip()
+            continue
+        chars = np.frombuffer(line.rstrip('\r\n').encode(), dtype=np.uint8)
+        x = np.flatnonzero((chars == ord('O')) | (chars == ord('*')))
+        xs.append(x)
+        ys.append(np.full(len(x), y))
+        y += 1
+    return name, _stack(xs, ys)
+
+
+def parse_rle(lines):
+    '''
+    Params:
+        lines : iterable
+            Lines of an RLE pattern: '#' comment lines, a header
+            line 'x = m, y = n, ...' and the body, where 'b' and
+            '.' are runs of dead cells, any other letter is a run
+            of alive cells, '$' ends a row and '!' the pattern.
+    Output:
+        Returns a tuple (name, alive_cells) just like
+        parse_plaintext. name comes from the '#N' line.
+    '''
+    name = None
+    # Start, length and row of each run of alive cells
+    starts, lengths, rows = [], [], []
+    x, y = 0, 0
+    header = True
+    for line in lines:
+        if header and line.startswith('#'):
+            if line.startswith('#N'):
+                name = line[2:].strip()
+            continue
+        if header and RLE_HEADER.match(line):
+            header = False
+            continue
+        for count, tag in RLE_TOKEN.findall(line):
+            count = int(count) if count else 1
+            if tag == '$':
+                x, y = 0, y + count
+            elif tag == '!':
+                return name, _expand_runs(starts, lengths, rows)
+            elif tag in 'b.':
+                x += count
+            else:
+                starts.append(x)
+                lengths.append(count)
+                rows.append(y)
+                x += count
+    return name, _expand_runs(starts, lengths, rows)
+
+
+def _stack(xs, ys):
+    if not xs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.stack([np.concatenate(xs), np.concatenate(ys)], axis=1).astype(np.int64)
+
+
+def _expand_runs(starts, lengths, rows):
+    # One cell for each position of each run
+    lengths = np.array(lengths, dtype=np.int64)
+    first = np.cumsum(lengths) - lengths
+    offset = np.arange(lengths.sum()) - np.repeat(first, lengths)
+    xs = np.repeat(np.array(starts, dtype=np.int64), lengths) + offset
+    ys = np.repeat(np.array(rows, dtype=np.int64), lengths)
+    return _stack([xs], [ys])
+
+
+def read_pattern(path):
+    '''
+    Params:
+        path : str
+            Path to an RLE (.rle) or plaintext (.cells) file.
+    Output:
+        Returns a tuple (name, alive_cells), as returned by
+        parse_rle and parse_plaintext. The file is read line
+        by line, without loading it whole.
+    '''
+    parse = parse_rle if path.lower().endswith('.rle') else parse_plaintext
+    with open(path) as f:
+        name, alive_cells = parse(f)
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    return name, alive_cells
+
+
+def write_plaintext(path, alive_cells, name=None):
+    '''
+    Params:
+        path : str
+            Path of the plaintext (.cells) file to write.
+        alive_cells : np.ndarray
+            Array with shape (n, 2) with the (x, y) position of
+            each alive cell, as returned by read_pattern.
+        name : str (optional)
+            Name of the pattern, written as a '!Name:' comment.
+    Output:
+        Writes the pattern, shifted so that its first row and
+        column hold alive cells.
+    '''
+    cells = np.asarray(alive_cells, dtype=np.int64).reshape(-1, 2)
+    lines = [] if name is None else ['!Name: ' + name]
+    if len(cells):
+        cells = cells - cells.min(axis=0)
+        rows = np.full((cells[:, 1].max() + 1, cells[:, 0].max() + 1), ord('.'), dtype=np.uint8)
+        rows[cells[:, 1], cells[:, 0]] = ord('O')
+        lines += [row.tobytes().decode().rstrip('.') for row in rows]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def file_hash(path):
+    # SHA-1 of the file contents, read in blocks
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Define pattern library class
+class PatternLibrary():
+    index_name = '.pattern_index.json'
+
+    def __init__(self, directory, max_cells=4000000):
+        '''
+        Params:
+            directory : str
+                Directory with .rle and .cells pattern files.
+            max_cells : int (optional)
+                Maximum total amount of cells of the decoded
+                patterns kept in the cache.
+        Output:
+            Initializes a library over the pattern files of the
+            directory. The name, bounding box and population of
+            each file are kept in an index file in the directory,
+            so listing the library only parses new or changed
+            files. Decoded patterns are cached by file hash, and
+            the least recently used are dropped first.
+        '''
+        self.directory = directory
+        self.max_cells = max_cells
+        self.entries = []
+        self.cache = OrderedDict()
+        self.cached_cells = 0
+        self.lock = threading.Lock()
+        # Single background thread for indexing and loading
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, self.index_name)) as f:
+                return {entry['file']: entry for entry in json.load(f)}
+        except (OSError, ValueError, KeyError, TypeError):
+            return dict()
+
+    def _write_index(self):
+        # Write to a temporary file first, so that an interrupted
+        # write does not leave a broken index
+        path = os.path.join(self.directory, self.index_name)
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+    def build_index(self):
+        '''
+        Output:
+            Updates self.entries, a list of dicts with the file,
+            name, hash, width, height and population of each
+            pattern, sorted by name, and saves the index. Files
+            with the same size and modification time as in the
+            saved index are not read again. Returns self.entries.
+        '''
+        if not os.path.isdir(self.directory):
+            self.entries = []
+            return self.entries
+        indexed = self._read_index()
+        entries = []
+        for item in os.scandir(self.directory):
+            if not item.is_file() or not item.name.lower().endswith(PATTERN_EXTENSIONS):
+                continue
+            stat = item.stat()
+            entry = indexed.get(item.name)
+            if entry is None or entry.get('size') != stat.st_size or entry.get('mtime') != stat.st_mtime:
+                try:
+                    digest = file_hash(item.path)
+                    name, alive_cells = self._decode(item.path, digest)
+                except (OSError, ValueError, UnicodeDecodeError):
+                    continue
+                low = alive_cells.min(axis=0) if len(alive_cells) else np.zeros(2, dtype=np.int64)
+                high = alive_cells.max(axis=0) + 1 if len(alive_cells) else low
+                entry = {'file': item.name, 'name': name, 'hash': digest,
+                         'size': stat.st_size, 'mtime': stat.st_mtime,
+                         'width': int(high[0] - low[0]), 'height': int(high[1] - low[1]),
+                         'population': len(alive_cells)}
+            entries.append(entry)
+        entries.sort(key=lambda entry: entry['name'].lower())
+        self.entries = entries
+        if entries != list(indexed.values()):
+            self._write_index()
+        return self.entries
+
+    def _decode(self, path, digest):
+        # Parse the file, or take it from the cache
+        with self.lock:
+            if digest in self.cache:
+                self.cache.move_to_end(digest)
+                return self.cache[digest]
+        name, alive_cells = read_pattern(path)
+        with self.lock:
+            self.cache[digest] = (name, alive_cells)
+            self.cached_cells += len(alive_cells)
+            while self.cached_cells > self.max_cells and len(self.cache) > 1:
+                _, (_, old_cells) = self.cache.popitem(last=False)
+                self.cached_cells -= len(old_cells)
+        return name, alive_cells
+
+    def load(self, entry):
+        '''
+        Params:
+            entry : dict
+                Entry of self.entries.
+        Output:
+            Returns an array with shape (n, 2) with the alive
+            cells of the pattern, with its bounding box starting
+            at (0, 0).
+        '''
+        path = os.path.join(self.directory, entry['file'])
+        alive_cells = self._decode(path, file_hash(path))[1]
+        if len(alive_cells) == 0:
+            return alive_cells
+        return alive_cells - alive_cells.min(axis=0)
+
+    def index_async(self):
+        # Future with the result of build_index
+        return self.executor.submit(self.build_index)
+
+    def load_async(self, entry):
+        # Future with the result of load
+        return self.executor.submit(self.load, entry)
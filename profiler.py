@@ -0,0 +1,190 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import csv
+import json
+import time
+import pygame
+
+
+# Define frame profiler class
+class FrameProfiler():
+    '''
+    Times the phases of each frame of the main loop. The loop
+    calls start at the beginning of a frame, lap at the end of
+    each phase, which adds the time since the previous lap to
+    that phase, and end_frame once the frame is shown. Frames
+    are only timed while enabled, that is while the overlay is
+    shown or the timings are written to a file.
+    '''
+    # Phases of the main loop, in order
+    phases = ['view', 'buttons', 'render', 'events', 'interface', 'display', 'wait']
+
+    def __init__(self, path=None, window=0.5):
+        '''
+        Params:
+            path : str (optional)
+                File to stream the timings of every frame to, as
+                CSV, or as JSON lines if it ends in .jsonl.
+            window : float (optional)
+                Seconds over which the overlay figures are
+                averaged.
+        Output:
+            Initializes an instance of the FrameProfiler class.
+        '''
+        self.window = window
+        self.overlay = False
+        self.file = None
+        self.writer = None
+        self.path = path
+        self.frame = 0
+        self.times = dict.fromkeys(self.phases, 0.0)
+        self.last = None
+        self.origin = None
+        # Worker counters on the previous frame
+        self.generations = 0
+        self.update_time = 0.0
+        # Totals of the current window, and the figures of the
+        # last one for the overlay
+        self.window_start = None
+        self.window_totals = None
+        self.summary = None
+        self.text = None
+        if path is not None:
+            self.open(path)
+
+    @property
+    def enabled(self):
+        return self.overlay or self.file is not None
+
+    def toggle_overlay(self):
+        # The overlay starts averaging a new window
+        self.overlay = not self.overlay
+        self.window_totals = None
+        self.summary = None
+
+    def open(self, path):
+        # Start streaming the frame timings to a file
+        self.close()
+        self.file = open(path, 'w', newline='')
+        self.path = path
+        if not path.endswith('.jsonl'):
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.fields())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.writer = None
+
+    def fields(self):
+        # Columns of each record, times in milliseconds
+        return (['frame', 'time'] + [phase + '_ms' for phase in self.phases]
+                + ['frame_ms', 'update_ms', 'generations', 'generation', 'population'])
+
+    def start(self):
+        now = time.perf_counter()
+        if self.origin is None:
+            self.origin = now
+        self.last = now
+        for phase in self.phases:
+            self.times[phase] = 0.0
+
+    def lap(self, phase):
+        # Add the time since the last lap to the phase
+        now = time.perf_counter()
+        self.times[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, worker, generation, population):
+        '''
+        Params:
+            worker : SimulationWorker
+                Worker stepping the grid, with the generations it
+                stepped and the seconds it spent in Grid.update
+                so far.
+            generation : int
+                Generation shown on this frame.
+            population : int or None
+                Alive cells shown on this frame.
+        Output:
+            Writes the record of the frame to the file, if any,
+            and updates the overlay figures.
+        '''
+        if self.last is None:
+            return
+        now = time.perf_counter()
+        # Work of the worker thread since the last frame
+        generations = worker.stepped - self.generations
+        update_time = worker.update_time - self.update_time
+        self.generations, self.update_time = worker.stepped, worker.update_time
+        frame_time = sum(self.times.values())
+        self.frame += 1
+
+        if self.file is not None:
+            values = ([self.frame, round(now - self.origin, 6)]
+                      + [round(self.times[phase] * 1e3, 4) for phase in self.phases]
+                      + [round(frame_time * 1e3, 4), round(update_time * 1e3, 4),
+                         generations, generation, population])
+            if self.writer is not None:
+                self.writer.writerow(values)
+            else:
+                self.file.write(json.dumps(dict(zip(self.fields(), values))) + '\n')
+
+        if self.overlay:
+            if self.window_totals is None:
+                self.window_start = now
+                self.window_totals = {'frames': 0, 'generations': 0, 'frame_time': 0.0}
+                self.window_totals.update(dict.fromkeys(self.phases, 0.0))
+            totals = self.window_totals
+            totals['frames'] += 1
+            totals['generations'] += generations
+            totals['frame_time'] += frame_time
+            for phase in self.phases:
+                totals[phase] += self.times[phase]
+            if now - self.window_start >= self.window:
+                elapsed = now - self.window_start
+                frames = totals['frames']
+                self.summary = {'frame_ms': 1e3 * totals['frame_time'] / frames,
+                                'fps': frames / elapsed,
+                                'generations_per_second': totals['generations'] / elapsed,
+                                'population': population}
+                self.summary.update({phase: 1e3 * totals[phase] / frames for phase in self.phases})
+                self.window_totals = None
+                self.text = None
+
+    def render(self, surf, font, pos, color):
+        # Draw the figures of the last window, caching the text
+        # until they change
+        if self.summary is None:
+            return
+        if self.text is None:
+            summary = self.summary
+            population = '-' if summary['population'] is None else summary['population']
+            lines = ['Frame {:.1f} ms ({:.0f} fps)'.format(summary['frame_ms'], summary['fps']),
+                     'Gen/s {:.0f}'.format(summary['generations_per_second']),
+                     'Population {}'.format(population)]
+            lines += ['{} {:.2f} ms'.format(phase, summary[phase]) for phase in self.phases]
+            rendered = [font.render(line, True, color) for line in lines]
+            height = font.get_linesize()
+            width = max(text.get_width() for text in rendered)
+            self.text = pygame.Surface((width + 8, height * len(rendered) + 8), pygame.SRCALPHA)
+            self.text.fill((0, 0, 0, 170))
+            for row, text in enumerate(rendered):
+                self.text.blit(text, (4, 4 + row * height))
+        surf.blit(self.text, pos)
@@ -0,0 +1,131 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import pygame
+import numpy as np
+
+
+def cell_lookup(size, n_cells):
+    '''
+    Params:
+        size : int
+            Amount of pixels along one axis.
+        n_cells : int
+            Amount of cells along the same axis. Cell c starts at
+            pixel c * size // n_cells and is size // n_cells 
+            pixels wide.
+    Output:
+        Returns an array with the cell drawn at each pixel, or
+        n_cells for the pixels in the gaps between cells.
+    '''
+    cell_size = size // n_cells
+    lookup = np.full(size, n_cells)
+    for c in range(n_cells):
+        start = c * size // n_cells
+        lookup[start:start + cell_size] = c
+    return lookup
+
+
+def colormap(n_colors=256):
+    # Dark blue to yellow gradient, for cells with continuous
+    # states
+    anchors = np.array([(20, 10, 60), (60, 30, 130), (30, 130, 150), 
+                        (90, 200, 100), (250, 230, 40)], dtype=float)
+    positions = np.linspace(0, 1, len(anchors))
+    x = np.linspace(0, 1, n_colors)
+    return np.stack([np.interp(x, positions, anchors[:, k]) for k in range(3)], 
+                    axis=1).astype(np.uint8)
+
+
+# Define cell renderer class
+class CellRenderer():
+    def __init__(self, width, height, n_cells, color):
+        '''
+        Params:
+            width, height : int
+                Size of the surface on which cells are drawn.
+            n_cells : int
+                Number of cells shown along each dimension. Cell
+                c starts at pixel c * width // n_cells and is
+                width // n_cells pixels wide.
+            color : tuple or str
+                Color of the alive cells, or 'colormap' for cells
+                with states from 1 to 255, drawn with the colors
+                of colormap.
+        Output:
+            Initializes a renderer that draws a whole window of
+            cells with a single blit, through a cached palette 
+            surface where dead cells are transparent.
+        '''
+        self.n_cells = n_cells
+        self.surf = pygame.Surface((width, height), depth=8)
+        self.surf.set_palette_at(0, (0, 0, 0))
+        if color == 'colormap':
+            for index, rgb in enumerate(colormap()[1:].tolist(), start=1):
+                self.surf.set_palette_at(index, rgb)
+        else:
+            self.surf.set_palette_at(1, color)
+        self.surf.set_colorkey(0)
+        # Cell drawn at each pixel column and row, the gaps
+        # between cells point to an extra dead cell
+        self.pixel_x = cell_lookup(width, n_cells)
+        self.pixel_y = cell_lookup(height, n_cells)
+        self.window = np.zeros((n_cells + 1, n_cells + 1), dtype=np.uint8)
+
+    def clear(self):
+        # Empty the window of cells
+        self.window.fill(0)
+
+    def set_cells(self, cells):
+        # Mark the cells at the given (n, 2) positions as alive,
+        # ignoring those outside of the window
+        cells = np.asarray(cells).reshape(-1, 2)
+        inside = np.all((cells >= 0) & (cells < self.n_cells), axis=1)
+        self.window[cells[inside, 0], cells[inside, 1]] = 1
+
+    def set_block(self, state, corner):
+        # Copy a 2-D state array with its first cell at the
+        # given window position
+        c_i, c_j = corner
+        i_0, j_0 = max(c_i, 0), max(c_j, 0)
+        i_1 = min(c_i + state.shape[0], self.n_cells)
+        j_1 = min(c_j + state.shape[1], self.n_cells)
+        if i_1 > i_0 and j_1 > j_0:
+            self.window[i_0:i_1, j_0:j_1] = state[i_0 - c_i:i_1 - c_i, j_0 - c_j:j_1 - c_j]
+
+    def draw(self, surf, camera=None):
+        # Expand the window to pixels in one pass and blit it. With
+        # a camera, cells are drawn panned and zoomed straight at 
+        # screen resolution
+        if camera is None:
+            pixels = self.window[self.pixel_x[:, None], self.pixel_y[None, :]]
+        else:
+            pixels = self.window[camera.lookup_x[:, None], camera.lookup_y[None, :]]
+        pygame.surfarray.blit_array(self.surf, pixels)
+        surf.blit(self.surf, (0, 0))
+
+
+# Renderers shared by every grid and pattern
+_renderers = dict()
+
+
+def get_renderer(sim, color):
+    # Cached renderer for the cells of the given simulation
+    key = (sim.width, sim.height, int(sim.grid_size * 1.1), color)
+    if key not in _renderers:
+        _renderers[key] = CellRenderer(*key)
+    return _renderers[key]
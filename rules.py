@@ -0,0 +1,314 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import re
+import numpy as np
+
+
+# Some well known Life-like rules
+RULES = {'Life': 'B3/S23',
+         'HighLife': 'B36/S23',
+         'Seeds': 'B2/S',
+         'Day & Night': 'B3678/S34678',
+         'Life without death': 'B3/S012345678',
+         'Replicator': 'B1357/S1357',
+         'Diamoeba': 'B35678/S5678',
+         '2x2': 'B36/S125',
+         'Morley': 'B368/S245',
+         'Maze': 'B3/S12345'}
+
+# Larger than Life rules, in the notation of Golly
+LTL_RULES = {'Bosco': 'R5,C0,M1,S34..58,B34..45,NM',
+             'Majority': 'R4,C0,M1,S41..81,B41..81,NM',
+             'Waffle': 'R7,C0,M1,S100..200,B75..170,NM',
+             'Globe': 'R8,C0,M0,S163..223,B74..252,NM'}
+
+RULE_PATTERN = re.compile(r'^\s*B([0-8]*)\s*/\s*S([0-8]*)\s*$', re.IGNORECASE)
+# S/B notation without letters, as in 23/3
+SB_PATTERN = re.compile(r'^\s*([0-8]*)\s*/\s*([0-8]*)\s*$')
+# Range, states, middle cell, survival, birth and neighborhood
+LTL_PATTERN = re.compile(r'^R(\d+),C(\d+),M([01]),S(\d+)(?:\.\.(\d+))?,'
+                         r'B(\d+)(?:\.\.(\d+))?,N([MN])$', re.IGNORECASE)
+
+
+# Define rule class
+class Rule():
+    def __init__(self, birth, survival):
+        '''
+        Params:
+            birth : iterable
+                Neighbor counts for which a dead cell becomes
+                alive.
+            survival : iterable
+                Neighbor counts for which an alive cell stays
+                alive.
+        Output:
+            Initializes a Life-like rule, compiled into a lookup
+            table where entry count + 9 * state holds the next
+            state of a cell. The table is also packed into the 
+            bits of a single integer, which apply shifts by the
+            index of every cell, so every rule costs the same.
+        '''
+        self.birth = frozenset(int(count) for count in birth)
+        self.survival = frozenset(int(count) for count in survival)
+        self.table = np.zeros(18, dtype=np.uint8)
+        self.table[list(self.birth)] = 1
+        self.table[[9 + count for count in self.survival]] = 1
+        self.bits = np.uint32(sum(1 << int(index) for index in np.flatnonzero(self.table)))
+
+    @classmethod
+    def parse(cls, text):
+        '''
+        Params:
+            text : str
+                Rule in B/S notation, such as 'B36/S23', in S/B
+                notation, such as '23/36', or the name of one of
+                RULES.
+        Output:
+            Returns the Rule. Raises ValueError if the text is
+            not a valid rule.
+        '''
+        if isinstance(text, Rule):
+            return text
+        names = {name.lower(): rule for name, rule in RULES.items()}
+        text = names.get(text.strip().lower(), text)
+        match = RULE_PATTERN.match(text)
+        if match is not None:
+            return cls(match.group(1), match.group(2))
+        # Letters may also come in the S/B order
+        match = RULE_PATTERN.match('/'.join(reversed(text.split('/'))))
+        if match is not None:
+            return cls(match.group(1), match.group(2))
+        match = SB_PATTERN.match(text)
+        if match is not None:
+            return cls(match.group(2), match.group(1))
+        raise ValueError('Invalid rule: {}'.format(text))
+
+    def __str__(self):
+        return 'B{}/S{}'.format(''.join(map(str, sorted(self.birth))),
+                                ''.join(map(str, sorted(self.survival))))
+
+    def __repr__(self):
+        return 'Rule({!r})'.format(str(self))
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and (self.birth, self.survival) == (other.birth, other.survival)
+
+    def __hash__(self):
+        return hash((self.birth, self.survival))
+
+    @property
+    def b0(self):
+        # Rules with birth on 0 neighbors turn empty space alive,
+        # which unbounded grids and HashLife cannot represent
+        return 0 in self.birth
+
+    def apply(self, state, counts):
+        '''
+        Params:
+            state : np.ndarray
+                uint8 array with the state of some cells.
+            counts : np.ndarray
+                uint8 array with their alive neighbor count.
+        Output:
+            Returns a uint8 array with the next state of the
+            cells, as given by self.table. Shifting the packed
+            table is a faster gather than indexing it in NumPy.
+        '''
+        index = state * np.uint8(9)
+        index += counts
+        alive = np.right_shift(self.bits, index, dtype=np.uint32)
+        alive &= 1
+        return alive.astype(np.uint8)
+
+    def apply_planes(self, b0, b1, b2, b3, alive):
+        '''
+        Params:
+            b0, b1, b2, b3 : np.ndarray
+                Bit planes of the neighbor counts, as returned by
+                PackedBoard.neighbor_planes.
+            alive : np.ndarray
+                Packed cell states.
+        Output:
+            Returns the packed next state, computed with bitwise
+            logic. Counts 2h and 2h + 1 share the b1, b2 and b3
+            bits, so the rule is evaluated for each pair h.
+        '''
+        dead = ~alive
+
+        def select(count):
+            # Cells with this count that are alive next: None
+            # for none, True for all, or a mask of the states
+            born, survives = count in self.birth, count in self.survival
+            if born and survives:
+                return True
+            if born:
+                return dead
+            if survives:
+                return alive
+            return None
+
+        result = np.zeros_like(alive)
+        not_b0 = ~b0
+        for h in range(5):
+            even, odd = select(2 * h), select(2 * h + 1)
+            if h == 4:
+                # Count 9 is impossible, and b3 is only set for 8
+                odd = even
+            if even is None and odd is None:
+                continue
+            if even is odd:
+                inner = even
+            elif even is None:
+                inner = b0 if odd is True else b0 & odd
+            elif odd is None:
+                inner = not_b0 if even is True else not_b0 & even
+            elif even is True:
+                inner = not_b0 | odd
+            elif odd is True:
+                inner = b0 | even
+            else:
+                # One is alive and the other dead
+                inner = b0 ^ alive if even is alive else b0 ^ dead
+            # High bits of the count. When b3 is set the other
+            # bits are clear, so b3 only needs checking for h = 0
+            if h == 0:
+                high = ~(b1 | b2 | b3)
+            elif h == 1:
+                high = b1 & ~b2
+            elif h == 2:
+                high = ~b1 & b2
+            elif h == 3:
+                high = b1 & b2
+            else:
+                high = b3
+            result |= high if inner is True else high & inner
+        return result
+
+
+# Define Larger than Life rule class
+class LtLRule():
+    def __init__(self, radius, birth, survival, middle=True, neighborhood='moore'):
+        '''
+        Params:
+            radius : int
+                Range of the neighborhood.
+            birth : tuple
+                Lowest and highest count, both included, for which
+                a dead cell becomes alive.
+            survival : tuple
+                Lowest and highest count for which an alive cell
+                stays alive.
+            middle : bool (optional)
+                Whether a cell counts itself as a neighbor.
+            neighborhood : str (optional)
+                'moore' for the (2R + 1) x (2R + 1) square, or
+                'von neumann' for the cells within R steps along
+                the axes.
+        Output:
+            Initializes a two state Larger than Life rule, which
+            is stepped by LtLEngine.
+        '''
+        if radius < 1:
+            raise ValueError('The radius must be at least 1')
+        if neighborhood not in ('moore', 'von neumann'):
+            raise ValueError('Unknown neighborhood: {}'.format(neighborhood))
+        self.radius = int(radius)
+        self.birth = (int(birth[0]), int(birth[1]))
+        self.survival = (int(survival[0]), int(survival[1]))
+        self.middle = bool(middle)
+        self.neighborhood = neighborhood
+
+    @classmethod
+    def parse(cls, text):
+        '''
+        Params:
+            text : str
+                Rule in the notation of Golly, such as
+                'R5,C0,M1,S34..58,B34..45,NM' for Bosco's rule,
+                or the name of one of LTL_RULES.
+        Output:
+            Returns the LtLRule. Raises ValueError if the text
+            is not a valid two state rule.
+        '''
+        names = {name.lower(): rule for name, rule in LTL_RULES.items()}
+        text = names.get(text.strip().lower(), text)
+        match = LTL_PATTERN.match(text.replace(' ', ''))
+        if match is None:
+            raise ValueError('Invalid rule: {}'.format(text))
+        (radius, states, middle, s_low, s_high, b_low, b_high,
+         neighborhood) = match.groups()
+        if int(states) > 2:
+            raise ValueError('Only rules with 2 states are supported: {}'.format(text))
+        s_high = s_low if s_high is None else s_high
+        b_high = b_low if b_high is None else b_high
+        return cls(int(radius), (b_low, b_high), (s_low, s_high), middle == '1',
+                   'moore' if neighborhood.upper() == 'M' else 'von neumann')
+
+    def __str__(self):
+        return 'R{},C0,M{},S{}..{},B{}..{},N{}'.format(
+            self.radius, int(self.middle), self.survival[0], self.survival[1],
+            self.birth[0], self.birth[1], 'M' if self.neighborhood == 'moore' else 'N')
+
+    def __repr__(self):
+        return 'LtLRule({!r})'.format(str(self))
+
+    def __eq__(self, other):
+        return isinstance(other, LtLRule) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    @property
+    def b0(self):
+        return self.birth[0] <= 0
+
+    def apply(self, state, counts):
+        '''
+        Params:
+            state : np.ndarray
+                uint8 array with the state of some cells.
+            counts : np.ndarray
+                Integer array with their neighbor count, which
+                includes the cell itself if self.middle.
+        Output:
+            Returns a uint8 array with the next state of the
+            cells.
+        '''
+        survives = (counts >= self.survival[0]) & (counts <= self.survival[1])
+        born = (counts >= self.birth[0]) & (counts <= self.birth[1])
+        return np.where(state == 1, survives, born).view(np.uint8)
+
+
+def parse_rule(text):
+    '''
+    Params:
+        text : str
+            Life-like rule or Larger than Life rule, or the name
+            of one of RULES or LTL_RULES.
+    Output:
+        Returns a Rule or an LtLRule.
+    '''
+    if isinstance(text, (Rule, LtLRule)):
+        return text
+    name = text.strip().lower()
+    if name in (name.lower() for name in LTL_RULES) or re.match(r'r\d', name):
+        return LtLRule.parse(text)
+    return Rule.parse(text)
+
+
+LIFE = Rule.parse('B3/S23')
@@ -0,0 +1,328 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import numpy as np
+
+# Import scripts
+from engine import MOORE_OFFSETS
+from rules import parse_rule, LIFE
+from hashlife import HashLifeEngine
+from boardfile import save_cells
+# render is only imported by the render methods, so that the
+# grids can be used without pygame, as in headless runs
+
+
+# Define unbounded grid class
+class SparseGrid():
+    # Jumps run HashLife on the same unbounded plane as the grid
+    jump_mode = 'plane'
+    max_jump_exponent = 9
+
+    def __init__(self, sim, grid_size, tile_size=64, rule=LIFE):
+        '''
+        Params:
+            sim : Simulation
+                Instance of the Simulation class on which
+                the grid will be implemented.
+            grid_size : int
+                Size of the region that is shown by default and
+                filled by reset_random. Cells can live anywhere.
+            tile_size : int (optional)
+                Number of cells along each dimension of a tile.
+            rule : Rule (optional)
+                Life-like rule, without birth on 0 neighbors.
+        Output:
+            Initializes an unbounded grid, stored as a dict of
+            tile_size x tile_size uint8 tiles keyed by tile 
+            position. Only tiles with alive cells are kept, so 
+            memory scales with the population.
+        '''
+        self.sim = sim
+        self.grid_size = grid_size
+        self.tile_size = tile_size
+        self.tiles = dict()
+        # Keys of the tiles that are not shared with a snapshot
+        self._owned = set()
+        # Unbounded grids have no boundaries to loop around
+        self.pbc = False
+        # Cell shown at the top left corner of the grid area
+        self.view = [0, 0]
+        self.jump_engine = HashLifeEngine(rule=rule)
+
+    @property
+    def rule(self):
+        return self.jump_engine.rule
+
+    @rule.setter
+    def rule(self, rule):
+        # Tiles are stepped with the Moore neighborhood, just like
+        # in HashLife, which rejects the rules it cannot step
+        self.jump_engine.rule = rule
+
+    @property
+    def alive_cells(self):
+        # Positions of the alive cells, as [i, j] lists
+        return self.get_alive_array().tolist()
+
+    @property
+    def population(self):
+        return int(sum(np.count_nonzero(tile) for tile in self.tiles.values()))
+
+    def get_alive_array(self, low=None, high=None, tiles=None):
+        '''
+        Params:
+            low, high : tuple (optional)
+                If given, only cells with low <= (i, j) < high
+                are returned.
+            tiles : dict (optional)
+                Tiles to read instead of the current ones, as
+                returned by get_cells.
+        Output:
+            Returns an array with shape (n, 2) with the position
+            of the alive cells.
+        '''
+        size = self.tile_size
+        tiles = self.tiles if tiles is None else tiles
+        alive_cells = []
+        for (t_i, t_j), tile in tiles.items():
+            if low is not None and (t_i * size >= high[0] or (t_i + 1) * size <= low[0] or 
+                                    t_j * size >= high[1] or (t_j + 1) * size <= low[1]):
+                continue
+            alive_cells.append(np.argwhere(tile) + (t_i * size, t_j * size))
+        if not alive_cells:
+            return np.zeros((0, 2), dtype=np.int64)
+        alive_cells = np.concatenate(alive_cells)
+        if low is not None:
+            inside = np.all((alive_cells >= low) & (alive_cells < high), axis=1)
+            alive_cells = alive_cells[inside]
+        return alive_cells
+
+    def set_alive_array(self, alive_cells):
+        # Replace the grid with the given alive cells
+        self.tiles = dict()
+        alive_cells = np.asarray(alive_cells, dtype=np.int64).reshape(-1, 2)
+        if len(alive_cells) == 0:
+            return
+        tile_pos, cell_pos = np.divmod(alive_cells, self.tile_size)
+        # Group the cells by tile
+        keys, ids = np.unique(tile_pos, axis=0, return_inverse=True)
+        tiles = np.zeros((len(keys), self.tile_size, self.tile_size), dtype=np.uint8)
+        tiles[ids.ravel(), cell_pos[:, 0], cell_pos[:, 1]] = 1
+        self.tiles = {tuple(key): tiles[k] for k, key in enumerate(keys.tolist())}
+        self._owned = set(self.tiles)
+
+    def is_alive(self, i, j):
+        tile = self.tiles.get((i // self.tile_size, j // self.tile_size))
+        return tile is not None and tile[i % self.tile_size, j % self.tile_size] == 1
+
+    def set_cell(self, i, j, value):
+        key = (i // self.tile_size, j // self.tile_size)
+        tile = self.tiles.get(key)
+        if tile is None:
+            if not value:
+                return
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=np.uint8)
+            self.tiles[key] = tile
+            self._owned.add(key)
+        elif key not in self._owned:
+            # Copy tiles shared with a snapshot before writing
+            tile = tile.copy()
+            self.tiles[key] = tile
+            self._owned.add(key)
+        tile[i % self.tile_size, j % self.tile_size] = value
+        if not value and not tile.any():
+            del self.tiles[key]
+
+    def _own_tile(self, key):
+        # Tile that can be written, created or copied if needed
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=np.uint8)
+        elif key not in self._owned:
+            tile = tile.copy()
+        self.tiles[key] = tile
+        self._owned.add(key)
+        return tile
+
+    def stamp(self, cells, offset=(0, 0), mode='union'):
+        '''
+        Params:
+            cells : np.ndarray
+                Array with shape (n, 2) with the position of the
+                alive cells of a pattern.
+            offset : tuple (optional)
+                Cell where the pattern origin is placed.
+            mode : str (optional)
+                'union', 'xor' or 'replace', as in Grid.stamp.
+        Output:
+            Writes the pattern to the grid, with one vectorized
+            write per tile that it touches.
+        '''
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2) + offset
+        if len(cells) == 0:
+            return
+        size = self.tile_size
+        if mode == 'replace':
+            # Kill the cells of the bounding box first
+            low, high = cells.min(axis=0), cells.max(axis=0) + 1
+            for t_i in range(low[0] // size, (high[0] - 1) // size + 1):
+                for t_j in range(low[1] // size, (high[1] - 1) // size + 1):
+                    if (t_i, t_j) not in self.tiles:
+                        continue
+                    tile = self._own_tile((t_i, t_j))
+                    tile[max(low[0] - t_i * size, 0):max(high[0] - t_i * size, 0), 
+                         max(low[1] - t_j * size, 0):max(high[1] - t_j * size, 0)] = 0
+
+        # Sort the cells by tile, through a single integer key 
+        # per cell, dropping repeated cells
+        low = cells.min(axis=0)
+        span = cells[:, 1].max() - low[1] + 1
+        flat = np.sort((cells[:, 0] - low[0]) * span + cells[:, 1] - low[1])
+        flat = flat[np.concatenate(([True], flat[1:] != flat[:-1]))]
+        cells = np.stack([flat // span + low[0], flat % span + low[1]], axis=1)
+        tile_pos, cell_pos = np.divmod(cells, size)
+        tile_ids = tile_pos[:, 0] * (span // size + 2) + tile_pos[:, 1] - tile_pos[:, 1].min()
+        order = np.argsort(tile_ids, kind='stable')
+        tile_ids = tile_ids[order]
+        bounds = np.flatnonzero(np.concatenate(([True], tile_ids[1:] != tile_ids[:-1], [True])))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            pos = cell_pos[order[start:end]]
+            tile = self._own_tile(tuple(tile_pos[order[start]].tolist()))
+            if mode == 'xor':
+                tile[pos[:, 0], pos[:, 1]] ^= 1
+            else:
+                tile[pos[:, 0], pos[:, 1]] = 1
+
+        # Drop the tiles that were left empty
+        for key in [key for key in self._owned if key in self.tiles and not self.tiles[key].any()]:
+            del self.tiles[key]
+
+    def get_cells(self, out=None):
+        # The tiles are always copied to a new dict, out is only
+        # accepted for compatibility with Grid
+        return {key: tile.copy() for key, tile in self.tiles.items()}
+
+    def set_cells(self, tiles):
+        self.tiles = {key: tile.copy() for key, tile in tiles.items()}
+        self._owned = set(self.tiles)
+
+    def snapshot(self):
+        # Copy-on-write copy of the tiles dict, tiles are only
+        # copied when they are written to
+        self._owned = set()
+        return dict(self.tiles)
+
+    @property
+    def last_changes(self):
+        # Changed cells are not tracked
+        return None
+
+    def save(self, path, generation=0):
+        save_cells(path, self.get_alive_array(), generation, str(self.rule))
+
+    def load(self, board):
+        # Load a BoardFile, at its origin, with its rule
+        self.rule = parse_rule(board.rule)
+        self.set_alive_array(board.alive_cells())
+
+    def clear(self):
+        self.tiles = dict()
+        self._owned = set()
+
+    def reset_random(self):
+        # Random cells in the default region
+        state = np.random.randint(0, 2, (self.grid_size, self.grid_size), dtype=np.uint8)
+        self.set_alive_array(np.argwhere(state))
+
+    def toggle_cell(self, i, j):
+        self.set_cell(i, j, 1 - self.is_alive(i, j))
+
+    def _candidates(self):
+        # Tiles that may have alive cells in the next generation:
+        # the current tiles, plus the neighbors next to alive edges
+        size = self.tile_size
+        candidates = set(self.tiles)
+        for (t_i, t_j), tile in self.tiles.items():
+            rows = {-1: tile[0].any(), 0: True, 1: tile[-1].any()}
+            cols = {-1: tile[:, 0].any(), 0: True, 1: tile[:, -1].any()}
+            for di, dj in MOORE_OFFSETS:
+                if di and dj:
+                    # Corner neighbor, only the corner cell matters
+                    near = tile[0 if di < 0 else size - 1, 0 if dj < 0 else size - 1]
+                else:
+                    near = rows[di] and cols[dj]
+                if near:
+                    candidates.add((t_i + di, t_j + dj))
+        return list(candidates)
+
+    def update(self):
+        if not self.tiles:
+            return
+        size = self.tile_size
+        keys = self._candidates()
+        zeros = np.zeros((size, size), dtype=np.uint8)
+
+        # Build every candidate tile with its one cell halo
+        padded = np.zeros((len(keys), size + 2, size + 2), dtype=np.uint8)
+        for k, (t_i, t_j) in enumerate(keys):
+            get = lambda di, dj: self.tiles.get((t_i + di, t_j + dj), zeros)
+            padded[k, 1:-1, 1:-1] = get(0, 0)
+            padded[k, 0, 1:-1] = get(-1, 0)[-1]
+            padded[k, -1, 1:-1] = get(1, 0)[0]
+            padded[k, 1:-1, 0] = get(0, -1)[:, -1]
+            padded[k, 1:-1, -1] = get(0, 1)[:, 0]
+            padded[k, 0, 0] = get(-1, -1)[-1, -1]
+            padded[k, 0, -1] = get(-1, 1)[-1, 0]
+            padded[k, -1, 0] = get(1, -1)[0, -1]
+            padded[k, -1, -1] = get(1, 1)[0, 0]
+
+        # Step all of the tiles at once
+        counts = np.zeros((len(keys), size, size), dtype=np.uint8)
+        for di, dj in MOORE_OFFSETS:
+            counts += padded[:, 1 + di:1 + di + size, 1 + dj:1 + dj + size]
+        new_tiles = self.rule.apply(padded[:, 1:-1, 1:-1], counts)
+
+        # Keep only the tiles with alive cells
+        alive = new_tiles.reshape(len(keys), -1).any(axis=1)
+        self.tiles = {keys[k]: new_tiles[k] for k in np.flatnonzero(alive)}
+        self._owned = set(self.tiles)
+
+    def advance(self, generations):
+        for _ in range(generations):
+            self.update()
+
+    def jump(self, generations, interrupt=None):
+        # HashLife runs on the unbounded plane, just like this grid,
+        # and is never interrupted
+        alive_cells = self.jump_engine.advance_cells(self.get_alive_array(), generations)
+        self.set_alive_array(alive_cells)
+        return generations
+
+    def render(self, surf, cells=None):
+        # Render a white square at the position of each alive 
+        # cell in view, all in a single blit. cells is a tiles
+        # dict to render instead of the current one
+        camera = self.sim.camera
+        # Cell shown at display cell 0
+        origin = (self.view[0] - camera.margin, self.view[1] - camera.margin)
+        low = (origin[0] + camera.low[0], origin[1] + camera.low[1])
+        high = (origin[0] + camera.high[0], origin[1] + camera.high[1])
+        from render import get_renderer
+        renderer = get_renderer(self.sim, (255,255,255))
+        renderer.clear()
+        renderer.set_cells(self.get_alive_array(low, high, cells) - origin)
+        renderer.draw(surf, camera)
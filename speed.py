@@ -0,0 +1,96 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# Define speed controller class
+class SpeedController():
+    '''
+    Decides how many generations to step on each frame:
+        normal : one generation per frame, at up to fps frames
+                 per second.
+        turbo : as many generations per frame as fit in a share
+                of the frame time, measured on the last frames.
+        uncapped : render_every generations per frame, without
+                   limiting the frame rate.
+    '''
+    modes = ['normal', 'turbo', 'uncapped']
+
+    def __init__(self, fps=60, step_share=0.6, max_generations=100000, render_every=100):
+        '''
+        Params:
+            fps : int (optional)
+                Target frame rate of the normal and turbo modes.
+            step_share : float (optional)
+                Share of the frame time that turbo mode spends 
+                stepping the grid. The rest is left for rendering
+                and input.
+            max_generations : int (optional)
+                Maximum amount of generations per frame.
+            render_every : int (optional)
+                Generations per frame in uncapped mode.
+        Output:
+            Initializes an instance of the SpeedController class.
+        '''
+        self.fps = fps
+        self.step_share = step_share
+        self.max_generations = max_generations
+        self.render_every = render_every
+        self.mode = 'normal'
+        self.turbo_generations = 1
+        # Smoothed time per generation, in seconds
+        self.generation_time = None
+
+    def cycle_mode(self):
+        self.mode = self.modes[(self.modes.index(self.mode) + 1) % len(self.modes)]
+
+    def generations(self):
+        # Generations to step in the next frame
+        if self.mode == 'turbo':
+            return self.turbo_generations
+        if self.mode == 'uncapped':
+            return self.render_every
+        return 1
+
+    def fps_cap(self):
+        # Frame rate cap for the clock, 0 means no cap
+        return 0 if self.mode == 'uncapped' else self.fps
+
+    def record(self, generations, seconds):
+        # Update the time per generation and the turbo step count
+        if generations <= 0:
+            return
+        sample = seconds / generations
+        if self.generation_time is None:
+            self.generation_time = sample
+        else:
+            self.generation_time = 0.8 * self.generation_time + 0.2 * sample
+        budget = self.step_share / self.fps
+        target = int(budget / max(self.generation_time, 1e-9))
+        # Grow at most twice per frame to avoid overshooting
+        target = min(target, 2 * self.turbo_generations)
+        self.turbo_generations = max(1, min(target, self.max_generations))
+
+    def faster(self):
+        self.render_every = min(2 * self.render_every, self.max_generations)
+
+    def slower(self):
+        self.render_every = max(self.render_every // 2, 1)
+
+    def label(self):
+        # Short description for the screen
+        if self.mode == 'normal':
+            return 'x1'
+        return ('T x' if self.mode == 'turbo' else 'U x') + str(self.generations())
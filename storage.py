@@ -0,0 +1,189 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+from collections.abc import Mapping
+import numpy as np
+
+
+# Define cell storage class
+class CellStorage():
+    def __init__(self, grid_size):
+        '''
+        Params:
+            grid_size : int
+                Number of cells along each dimension of the grid.
+        Output:
+            Initializes a flat buffer with one byte per cell. Cell
+            (i, j) lives at index i * grid_size + j, and the buffer
+            is also exposed as a 2-D array through self.state,
+            without copying it.
+        '''
+        self.grid_size = grid_size
+        self.buffer = bytearray(grid_size * grid_size)
+        self.state = np.frombuffer(self.buffer, dtype=np.uint8).reshape(grid_size, grid_size)
+        # Set with the flat indexes of the alive cells. It is
+        # rebuilt lazily after bulk writes to the buffer
+        self._alive = set()
+        self._alive_dirty = False
+        # Whether the buffer is shared with a snapshot
+        self._shared = False
+
+    def index(self, i, j):
+        return i * self.grid_size + j
+
+    def position(self, idx):
+        return divmod(idx, self.grid_size)
+
+    def contains(self, i, j):
+        return 0 <= i < self.grid_size and 0 <= j < self.grid_size
+
+    def get(self, idx):
+        return self.buffer[idx]
+
+    def set(self, idx, value):
+        # Single cell write, keeps the alive index up to date
+        self.detach()
+        self.buffer[idx] = value
+        if not self._alive_dirty:
+            if value:
+                self._alive.add(idx)
+            else:
+                self._alive.discard(idx)
+
+    def load(self, state):
+        # Bulk write of a whole 2-D state array
+        self.detach(copy=False)
+        self.state[...] = state
+        self._alive_dirty = True
+
+    def put(self, indexes, values):
+        # Bulk write of the given flat indexes. The alive index is
+        # rebuilt later if the write is large
+        self.detach()
+        self.state.reshape(-1)[indexes] = values
+        if len(indexes) > len(self.buffer) // 64:
+            self._alive_dirty = True
+        self.flip(indexes)
+
+    def flip(self, indexes):
+        # Track cells that were flipped in place in the buffer
+        if not self._alive_dirty:
+            for idx in indexes.tolist():
+                if self.buffer[idx]:
+                    self._alive.add(idx)
+                else:
+                    self._alive.discard(idx)
+
+    def fill(self, value):
+        self.detach(copy=False)
+        self.state.fill(value)
+        self._alive = set(range(len(self.buffer))) if value else set()
+        self._alive_dirty = False
+
+    def snapshot(self):
+        '''
+        Output:
+            Returns a read-only 2-D array with the current cells.
+            The buffer is shared with the snapshot until the next
+            write, which moves the storage to a new buffer, so
+            taking a snapshot does not copy anything.
+        '''
+        self._shared = True
+        snapshot = self.state.view()
+        snapshot.flags.writeable = False
+        return snapshot
+
+    def release(self):
+        # Drop the buffer while the cells are kept elsewhere, such
+        # as packed by the SWAR engine. The next bulk write gets
+        # a new one
+        self.buffer = None
+        self.state = None
+        self._alive = set()
+        self._alive_dirty = True
+        self._shared = False
+
+    def detach(self, copy=True):
+        # Stop sharing the buffer with snapshots before a write. 
+        # If copy is False the contents of the new buffer are 
+        # left as zeros, for writes that replace every cell
+        if self.buffer is None:
+            self.buffer = bytearray(self.grid_size * self.grid_size)
+            self.state = np.frombuffer(self.buffer, dtype=np.uint8).reshape(self.grid_size, 
+                                                                            self.grid_size)
+        elif self._shared:
+            self.buffer = bytearray(self.buffer) if copy else bytearray(len(self.buffer))
+            self.state = np.frombuffer(self.buffer, dtype=np.uint8).reshape(self.grid_size, 
+                                                                            self.grid_size)
+            self._shared = False
+
+    @property
+    def alive(self):
+        # Set with the flat indexes of the alive cells
+        if self._alive_dirty:
+            self._alive = set(np.flatnonzero(self.state).tolist())
+            self._alive_dirty = False
+        return self._alive
+
+    @property
+    def population(self):
+        if self._alive_dirty:
+            return int(np.count_nonzero(self.state))
+        return len(self._alive)
+
+
+# Read-only view with the old cells dict layout
+class CellsView(Mapping):
+    '''
+    Presents the CellStorage of a grid as the old {'i;j': {'pos': 
+    [i, j], 'state': int}} dict. Entries are built on access, so 
+    the view itself does not hold any per-cell data. The storage
+    is looked up on every access, since the grid unpacks it again
+    after the SWAR engine kept the cells packed.
+    '''
+    def __init__(self, grid):
+        self.grid = grid
+
+    def _parse(self, key):
+        try:
+            i, j = (int(val) for val in key.split(';'))
+        except (AttributeError, ValueError):
+            raise KeyError(key)
+        if not (0 <= i < self.grid.grid_size and 0 <= j < self.grid.grid_size):
+            raise KeyError(key)
+        return i, j
+
+    def __getitem__(self, key):
+        i, j = self._parse(key)
+        storage = self.grid.storage
+        return {'pos': [i, j],
+                'state': storage.get(storage.index(i, j))}
+
+    def __contains__(self, key):
+        try:
+            self._parse(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for i in range(self.grid.grid_size):
+            for j in range(self.grid.grid_size):
+                yield str(i) + ';' + str(j)
+
+    def __len__(self):
+        return self.grid.grid_size ** 2
@@ -0,0 +1,285 @@
+'''
+Copyright 2024 Franco Aquistapace
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# Import modules
+import queue
+import threading
+import time
+
+# Import scripts
+from history import History
+from cycle import CycleDetector
+from boardfile import BoardFile
+from lenia import LeniaFile, LENIA_EXTENSION
+
+
+# Define double buffer class
+class DoubleBuffer():
+    '''
+    Two frames, one that the reader may be looking at and one
+    that the writer fills. Publishing only swaps which of the
+    two is the front one, so the reader never waits for a
+    frame to be written. The writer waits instead if the reader
+    still holds the frame it is about to overwrite.
+    '''
+    def __init__(self):
+        self.frames = [dict(), dict()]
+        self.front = 0
+        self.reading = None
+        self.condition = threading.Condition()
+
+    def write(self, fill):
+        '''
+        Params:
+            fill : function
+                Function that receives the back frame, a dict,
+                and fills it in place.
+        Output:
+            Fills the back frame and makes it the front one.
+        '''
+        with self.condition:
+            back = 1 - self.front
+            while self.reading == back:
+                self.condition.wait()
+        fill(self.frames[back])
+        with self.condition:
+            self.front = back
+
+    def acquire(self):
+        # Front frame, which is not written until it is released
+        with self.condition:
+            self.reading = self.front
+            return self.frames[self.front]
+
+    def release(self):
+        with self.condition:
+            self.reading = None
+            self.condition.notify_all()
+
+
+# Define simulation worker class
+class SimulationWorker(threading.Thread):
+    def __init__(self, grid, speed):
+        '''
+        Params:
+            grid : Grid or SparseGrid
+                Grid to step. Once the worker is started, the
+                grid must only be changed through submit.
+            speed : SpeedController
+                Decides how many generations are stepped between
+                published frames, and how often.
+        Output:
+            Initializes a thread that steps the grid while
+            self.running is True, and publishes every batch of
+            generations to self.frames, a DoubleBuffer.
+        '''
+        super().__init__(daemon=True)
+        self.grid = grid
+        self.speed = speed
+        self.running = False
+        self.generation = 0
+        # Recent generations, to step backwards
+        self.history = History()
+        self.history.edit(0, grid)
+        # Detects when the grid becomes periodic. If stop_on_cycle
+        # is True the worker stops and sets cycle_stop, for the
+        # interface to notice
+        self.cycles = CycleDetector()
+        self.cycles.record(0, grid)
+        self.stop_on_cycle = True
+        self.cycle_stop = False
+        self.error = None
+        # Profiling counters, only kept while profile is True: 
+        # generations stepped and seconds spent in Grid.update,
+        # and the population of each published frame
+        self.profile = False
+        self.stepped = 0
+        self.update_time = 0.0
+        # Set while a jump runs, and set cancel_jump to stop a jump
+        # that is stepped generation by generation
+        self.jumping = False
+        self.cancel_jump = threading.Event()
+        self.commands = queue.Queue()
+        self.frames = DoubleBuffer()
+        # Number of frames published, so that readers can tell a
+        # new frame from one they already drew
+        self.published = 0
+        self._stop_event = threading.Event()
+        self.publish()
+
+    def submit(self, command, edit=True):
+        '''
+        Params:
+            command : function
+                Function that receives the worker. It is run on
+                the worker thread between two generations, and
+                may change self.grid and self.generation.
+            edit : bool (optional)
+                Whether the command changes the grid state by
+                hand, in which case the history is cut at the
+                current generation.
+        '''
+        self.commands.put((command, edit))
+
+    def stop(self):
+        self._stop_event.set()
+        self.commands.put(None)
+        if self.is_alive():
+            self.join()
+
+    # Commands for submit
+    def restart(self, command=None):
+        # Run command, if given, and make the resulting grid 
+        # state the new generation 0
+        if command is not None:
+            command()
+        self.generation = 0
+
+    def load(self, path):
+        # Load a board file, or a Lenia file, with its generation.
+        # Files that cannot be read are ignored
+        try:
+            board = LeniaFile(path) if path.endswith(LENIA_EXTENSION) else BoardFile(path)
+            self.grid.load(board)
+        except (OSError, ValueError):
+            return
+        self.generation = board.generation
+
+    # Commands for submit with edit=False
+    def save(self, path):
+        self.grid.save(path, self.generation)
+
+    def jump(self, generations):
+        # Once the grid is periodic the jump just moves to the
+        # same phase of the cycle, otherwise it uses the grid jump.
+        # Stepped jumps stop early when the worker is stopped, the
+        # jump is cancelled or another command is queued
+        target = self.generation + generations
+        equivalent = self.cycles.equivalent(target)
+        if equivalent is not None and equivalent in self.history:
+            self.history.seek(equivalent, self.grid)
+        else:
+            self.cancel_jump.clear()
+            self.jumping = True
+            try:
+                target = self.generation + self.grid.jump(generations, self._interrupted)
+            finally:
+                self.jumping = False
+            self.cycles.reset()
+        self.generation = target
+        self.history.edit(target, self.grid)
+        self.cycles.record(target, self.grid)
+
+    def _interrupted(self):
+        return (self._stop_event.is_set() or self.cancel_jump.is_set() 
+                or not self.commands.empty())
+
+    def seek(self, generation):
+        # Go to a generation kept in the history
+        if self.history.seek(generation, self.grid):
+            self.generation = generation
+
+    def back(self):
+        # Return to generation 0, or to the oldest one kept
+        if self.history.oldest is not None:
+            self.seek(0 if 0 in self.history else self.history.oldest)
+
+    def step_back(self):
+        self.seek(self.generation - 1)
+
+    def step_forward(self):
+        # Replay the history, or step the grid past its end
+        if self.generation + 1 in self.history:
+            self.seek(self.generation + 1)
+        else:
+            self._step(1)
+
+    def publish(self):
+        self.published += 1
+
+        def fill(frame):
+            frame['serial'] = self.published
+            frame['grid'] = self.grid
+            frame['cells'] = self.grid.get_cells(frame.get('cells'))
+            frame['generation'] = self.generation
+            frame['period'] = self.cycles.period
+            frame['cycle_start'] = self.cycles.entry
+            frame['rule'] = self.grid.rule
+            frame['jump_mode'] = self.grid.jump_mode
+            frame['max_jump_exponent'] = self.grid.max_jump_exponent
+            frame['population'] = self.grid.population if self.profile else None
+        self.frames.write(fill)
+
+    def _apply_commands(self, timeout):
+        # Run the queued commands, waiting up to timeout seconds
+        # for the first one. Returns whether any was run
+        try:
+            item = self.commands.get(timeout=timeout) if timeout else self.commands.get_nowait()
+        except queue.Empty:
+            return False
+        edited = False
+        while item is not None:
+            command, edit = item
+            command(self)
+            edited = edited or edit
+            try:
+                item = self.commands.get_nowait()
+            except queue.Empty:
+                break
+        if edited:
+            self.history.edit(self.generation, self.grid)
+            self.cycles.reset()
+            self.cycles.record(self.generation, self.grid)
+        return True
+
+    def _step(self, generations):
+        # Step one generation at a time, so that each one is
+        # kept in the history
+        start = time.perf_counter()
+        profile = self.profile
+        for step in range(1, generations + 1):
+            if profile:
+                update_start = time.perf_counter()
+                self.grid.update()
+                self.update_time += time.perf_counter() - update_start
+                self.stepped += 1
+            else:
+                self.grid.update()
+            self.generation += 1
+            self.history.record(self.generation, self.grid)
+            if self.cycles.record(self.generation, self.grid) and self.stop_on_cycle:
+                self.running = False
+                self.cycle_stop = True
+                break
+        self.speed.record(step, time.perf_counter() - start)
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                start = time.perf_counter()
+                # While paused, sleep until there is something to do
+                changed = self._apply_commands(0 if self.running else 0.05)
+                if self.running and not self._stop_event.is_set():
+                    self._step(self.speed.generations())
+                    changed = True
+                if changed:
+                    self.publish()
+                # Keep the pace of the speed mode
+                fps = self.speed.fps_cap()
+                if self.running and fps:
+                    time.sleep(max(0, 1 / fps - (time.perf_counter() - start)))
+        except Exception as error:
+            self.error = error